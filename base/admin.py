@@ -1,11 +1,11 @@
 from django.contrib import admin
-from .models import Room, RoomMember
+from .models import Room, RoomMember, Blob
 
 # Register your models here.
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'created_at', 'is_active']
+    list_display = ['id', 'name', 'created_at', 'is_active', 'stroke_tolerance']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'id']
 
@@ -14,3 +14,9 @@ class RoomMemberAdmin(admin.ModelAdmin):
     list_display = ['name', 'uid', 'room_name', 'room', 'insession']
     list_filter = ['insession', 'room']
     search_fields = ['name', 'room_name', 'uid']
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['digest', 'name', 'size', 'created_at']
+    search_fields = ['digest', 'name', 'references__owner']
@@ -0,0 +1,174 @@
+# base/binary_protocol.py
+"""
+Компактный бинарный протокол сигнализации (WebSocket subprotocol vc.msgpack.v2).
+Клиент, запросивший SUBPROTOCOL при подключении, отправляет и получает кадры
+msgpack с короткими ключами и числовыми кодами типов сообщений.
+Клиенты без subprotocol продолжают работать через JSON.
+
+Внутри сервера (channel layer, состояние доски) сообщения остаются JSON, поэтому
+исходящие кадры для бинарных клиентов перекодируются на стороне получателя.
+
+Ключи сокращаются только в конверте сообщения и в известных вложенных словарях
+(KEY_SCHEMA): offer/answer, candidate, data и объекты fabric.js в нем. Остальные
+значения передаются как есть. Ключ такого словаря, совпадающий с коротким ключом
+или начинающийся с ESCAPE, передается с префиксом ESCAPE, поэтому пользовательские
+ключи ('T', 'S', ...) не переименовываются при разборе.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict
+import logging
+import msgpack
+
+from base import codec
+
+logger = logging.getLogger(__name__)
+
+SUBPROTOCOL = 'vc.msgpack.v2'
+
+# Короткие ключи (заглавные, чтобы не пересекаться с ключами объектов fabric.js)
+SHORT_KEYS = {
+    'type': 'T', 'from': 'F', 'to': 'O', 'room': 'R', 'uid': 'U', 'name': 'N',
+    'data': 'D', 'message': 'MS', '_target': '_T',
+    'offer': 'OF', 'answer': 'AN', 'sdp': 'S',
+    'candidate': 'C', 'sdpMid': 'M', 'sdpMLineIndex': 'L', 'usernameFragment': 'UF',
+    'eventType': 'E', 'object': 'OB', 'objects': 'OS', 'id': 'I', 'path': 'P',
+    'stroke': 'ST', 'strokeWidth': 'SW', 'fill': 'FL', 'src': 'SR',
+    'sharing_user': 'SU', 'is_active': 'IA',
+}
+LONG_KEYS = {short: key for key, short in SHORT_KEYS.items()}
+
+# Числовые коды типов сообщений (только для поля 'type' верхнего уровня).
+# Коды не переиспользуются: новые типы добавляются в конец, иначе нужен новый subprotocol.
+MESSAGE_TYPE_CODES = {
+    'join': 1, 'user-joined': 2, 'user-left': 3,
+    'offer': 4, 'answer': 5, 'ice-candidate': 6,
+    'mic-active': 7, 'mic-inactive': 8, 'camera-enabled': 9, 'camera-disabled': 10,
+    'request-camera-states': 11, 'request-audio-states': 12, 'audio-enabled': 13, 'audio-disabled': 14,
+    'whiteboard-draw': 15, 'whiteboard-object': 16, 'whiteboard-cursor': 17, 'whiteboard-clear': 18,
+    'whiteboard-state-restored': 19,
+    'turn-server-used': 20, 'turn-test-start': 21, 'turn-test-complete': 22,
+    'screen-share-start': 23, 'screen-share-stop': 24, 'screen-share-request-state': 25,
+    'screen-share-started': 26, 'screen-share-stopped': 27, 'screen-share-error': 28, 'screen-share-state': 29,
+    'error': 30,
+    'whiteboard-state-chunk': 31,
+}
+MESSAGE_TYPES_BY_CODE = {code: message_type for message_type, code in MESSAGE_TYPE_CODES.items()}
+
+# Кэш перекодирования исходящих кадров: один и тот же кадр группы получают
+# все бинарные клиенты процесса. Большие кадры (изображения) не кэшируются.
+TRANSCODE_CACHE_SIZE = 512
+TRANSCODE_CACHE_MAX_TEXT = 64 * 1024
+
+
+# Экранирование ключей, совпадающих с короткими
+ESCAPE = '~'
+
+# Вложенные словари, ключи которых тоже сокращаются: {ключ: схема значения}.
+# Пустая схема - сокращаются только ключи самого словаря.
+_FABRIC_OBJECT: Dict[str, Any] = {}
+_FABRIC_OBJECT['objects'] = _FABRIC_OBJECT  # Объекты группы
+KEY_SCHEMA: Dict[str, Any] = {
+    'offer': {}, 'answer': {}, 'candidate': {},
+    'data': {'object': _FABRIC_OBJECT, 'objects': _FABRIC_OBJECT, 'path': _FABRIC_OBJECT},
+}
+
+
+def _shorten_key(key):
+    short = SHORT_KEYS.get(key)
+    if short is not None:
+        return short
+    if isinstance(key, str) and (key in LONG_KEYS or key.startswith(ESCAPE)):
+        return ESCAPE + key
+    return key
+
+
+def _expand_key(key: str) -> str:
+    if key.startswith(ESCAPE):
+        return key[len(ESCAPE):]
+    return LONG_KEYS.get(key, key)
+
+
+def _shorten(obj, schema: Dict[str, Any]):
+    if isinstance(obj, dict):
+        return {_shorten_key(key): value if key not in schema else _shorten(value, schema[key])
+                for key, value in obj.items()}
+    # Списки обходим, только если в них объекты (массивы координат пути пропускаем)
+    if isinstance(obj, list) and obj and isinstance(obj[0], dict):
+        return [_shorten(value, schema) for value in obj]
+    return obj
+
+
+def _expand(obj, schema: Dict[str, Any]):
+    if isinstance(obj, dict):
+        message = {}
+        for key, value in obj.items():
+            key = _expand_key(key)
+            message[key] = value if key not in schema else _expand(value, schema[key])
+        return message
+    if isinstance(obj, list) and obj and isinstance(obj[0], dict):
+        return [_expand(value, schema) for value in obj]
+    return obj
+
+
+def pack(message: Dict[str, Any]) -> bytes:
+    """Сообщение -> бинарный кадр"""
+    short = _shorten(message, KEY_SCHEMA)
+    code = MESSAGE_TYPE_CODES.get(message.get('type'))
+    if code is not None:
+        short['T'] = code
+    return msgpack.packb(short, use_bin_type=True)
+
+
+# Значения, которые есть в JSON; bin, ext и нестроковые ключи msgpack в JSON не
+# перекодируются (codec.dumps выбросил бы TypeError уже после приема кадра)
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def _check_json_compatible(obj):
+    """Проверить, что значение кадра представимо в JSON (без рекурсии - вложенность не ограничена)"""
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if not isinstance(key, str):
+                    raise codec.DecodeError(f'Invalid msgpack frame: non-string key {type(key).__name__}')
+                stack.append(item)
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif not isinstance(value, _JSON_SCALARS):
+            raise codec.DecodeError(f'Invalid msgpack frame: unsupported value {type(value).__name__}')
+
+
+def unpack(frame: bytes) -> Dict[str, Any]:
+    """
+    Бинарный кадр -> сообщение.
+
+    Raises:
+        codec.DecodeError: Некорректный кадр или значения, которых нет в JSON
+    """
+    try:
+        short = msgpack.unpackb(frame, raw=False)
+    except (ValueError, TypeError, msgpack.UnpackException) as e:
+        raise codec.DecodeError(f'Invalid msgpack frame: {e}')
+    _check_json_compatible(short)
+    if not isinstance(short, dict):
+        return short
+    message = _expand(short, KEY_SCHEMA)
+    message_type = message.get('type')
+    if isinstance(message_type, int):
+        message['type'] = MESSAGE_TYPES_BY_CODE.get(message_type, message_type)
+    return message
+
+
+@lru_cache(maxsize=TRANSCODE_CACHE_SIZE)
+def _transcode_cached(text: str) -> bytes:
+    return pack(codec.loads(text))
+
+
+def text_to_frame(text: str) -> bytes:
+    """Перекодировать готовый JSON кадр в бинарный"""
+    if len(text) <= TRANSCODE_CACHE_MAX_TEXT:
+        return _transcode_cached(text)
+    return pack(codec.loads(text))
@@ -0,0 +1,254 @@
+# base/blob_store.py
+"""
+Хранилище файлов с адресацией по содержимому.
+
+Файл хранится один раз под sha256 своего содержимого:
+MEDIA_ROOT/blobs/<вид>/<2 символа>/<sha256><расширение>. Ключ записи - <вид>:<sha256>:
+изображение доски (image) хранится вариантами image_pipeline, файл обмена (file) -
+как есть, поэтому одно и то же содержимое, загруженное на доску и в обмен файлами,
+дает два разных blob. Владельцы (доска комнаты -
+whiteboard:<КОМНАТА>, файл обмена - share:<ключ>) ссылаются на него записями
+BlobReference; release() удаляет ссылки владельца и файлы, на которые больше
+никто не ссылается.
+
+Хэш считается по частям по мере чтения загрузки (image_file.chunks()): для
+изображений - при сборке байтов для image_pipeline, для файлов обмена и потоковых
+загрузок (UploadSpool) - при записи во временный файл. Повторная загрузка того же
+содержимого заканчивается после хэширования: изображение не перекодируется, файл
+не сохраняется второй раз.
+
+Функции синхронные (ORM и диск): из async кода - через run_in_executor.
+"""
+
+from typing import Dict, Iterable, Optional
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from base import image_pipeline
+from base.models import Blob, BlobReference
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = 'blobs'
+
+# Виды blob: варианты image_pipeline и исходные файлы не подменяют друг друга
+IMAGE = 'image'
+FILE = 'file'
+
+# Расширение файла обмена в имени blob (остальное имя - хэш)
+_EXTENSION_PATTERN = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+_stats = {
+    'stored': 0,
+    'deduplicated': 0,
+    'bytes_deduplicated': 0,
+    'released': 0,
+    'deleted': 0,
+}
+
+
+def whiteboard_owner(room_name: str) -> str:
+    return f"whiteboard:{room_name.upper()}"
+
+
+def share_owner(key: str) -> str:
+    return f"share:{key}"
+
+
+def media_path(name: str) -> Path:
+    return Path(settings.MEDIA_ROOT) / name
+
+
+def media_url(name: str) -> str:
+    return f"{settings.MEDIA_URL}{name}"
+
+
+def _blob_key(kind: str, digest: str) -> str:
+    return f"{kind}:{digest}"
+
+
+def _blob_dir(kind: str, digest: str) -> str:
+    return f"{BLOBS_DIR}/{kind}/{digest[:2]}"
+
+
+def _acquire_existing(key: str, owner: str, size: int) -> Optional[Blob]:
+    """Добавить ссылку владельца на существующий blob (None - такого содержимого нет)"""
+    try:
+        with transaction.atomic():
+            blob = Blob.objects.filter(digest=key).first()
+            if blob is None:
+                return None
+            BlobReference.objects.get_or_create(blob=blob, owner=owner)
+    except IntegrityError:
+        # blob удален release() между поиском и добавлением ссылки - сохраняем заново
+        return None
+    _stats['deduplicated'] += 1
+    _stats['bytes_deduplicated'] += size
+    logger.debug(f"[BlobStore] Duplicate content {key[:18]} for {owner}")
+    return blob
+
+
+def _create(key: str, owner: str, **fields) -> Blob:
+    """Запись о сохраненном blob и ссылка владельца"""
+    with transaction.atomic():
+        blob, _ = Blob.objects.get_or_create(digest=key, defaults=fields)
+        BlobReference.objects.get_or_create(blob=blob, owner=owner)
+    _stats['stored'] += 1
+    return blob
+
+
+class UploadSpool:
+    """
+    Временный файл загрузки в blobs/ (та же файловая система, что и итоговые файлы -
+    os.replace атомарен). sha256 и размер считаются по мере записи.
+    """
+
+    def __init__(self):
+        temp_dir = media_path(BLOBS_DIR)
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=temp_dir, prefix='.upload-')
+        self._file = os.fdopen(fd, 'wb')
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def finish(self) -> str:
+        """Закрыть файл, вернуть sha256 содержимого"""
+        self._file.close()
+        return self._hasher.hexdigest()
+
+    def discard(self):
+        """Удалить временный файл (если он не переименован в blobs/)"""
+        self._file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+        self.path = None
+
+
+def _store_image_data(digest: str, owner: str, data: bytes) -> Blob:
+    directory = _blob_dir(IMAGE, digest)
+    variants = image_pipeline.optimize(data, media_path(directory), name=digest)
+    return _create(
+        _blob_key(IMAGE, digest), owner,
+        name=f"{directory}/{variants.full}", thumbnail=f"{directory}/{variants.thumbnail}",
+        width=variants.width, height=variants.height, size=variants.bytes_out,
+    )
+
+
+def store_image(owner: str, chunks: Iterable[bytes]) -> Blob:
+    """
+    Сохранить изображение доски: варианты image_pipeline (WebP + миниатюра) под
+    хэшем исходного содержимого. Повтор того же содержимого не обрабатывается.
+    Бросает image_pipeline.ImageRejected / ImagePipelineBusy.
+    """
+    hasher = hashlib.sha256()
+    parts = []
+    for chunk in chunks:
+        hasher.update(chunk)
+        parts.append(chunk)
+    digest = hasher.hexdigest()
+    data = b''.join(parts)
+
+    blob = _acquire_existing(_blob_key(IMAGE, digest), owner, len(data))
+    if blob is not None:
+        return blob
+    return _store_image_data(digest, owner, data)
+
+
+def store_image_upload(owner: str, spool: UploadSpool) -> Blob:
+    """
+    Сохранить изображение, уже записанное в UploadSpool (потоковая загрузка).
+    Временный файл удаляется в любом случае: в blobs/ атомарно попадают варианты image_pipeline.
+    """
+    try:
+        digest = spool.finish()
+        blob = _acquire_existing(_blob_key(IMAGE, digest), owner, spool.size)
+        if blob is not None:
+            return blob
+        with open(spool.path, 'rb') as source:
+            data = source.read()
+        return _store_image_data(digest, owner, data)
+    finally:
+        spool.discard()
+
+
+def store_file(owner: str, chunks: Iterable[bytes], original_name: str = '') -> Blob:
+    """
+    Сохранить файл как есть: части пишутся во временный файл с подсчетом хэша,
+    затем атомарно переименовываются в blobs/ (дубликат - временный файл удаляется).
+    """
+    extension = os.path.splitext(original_name)[1].lower()
+    if not _EXTENSION_PATTERN.match(extension):
+        extension = ''
+
+    spool = UploadSpool()
+    try:
+        for chunk in chunks:
+            spool.write(chunk)
+        digest = spool.finish()
+        key = _blob_key(FILE, digest)
+
+        blob = _acquire_existing(key, owner, spool.size)
+        if blob is not None:
+            return blob
+
+        name = f"{_blob_dir(FILE, digest)}/{digest}{extension}"
+        media_path(name).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(spool.path, media_path(name))
+        spool.path = None
+        return _create(key, owner, name=name, size=spool.size)
+    finally:
+        spool.discard()
+
+
+def release(owner: str) -> int:
+    """
+    Удалить ссылки владельца; blob без ссылок удаляется вместе с файлами.
+    Возвращает количество удаленных blob.
+    """
+    with transaction.atomic():
+        references = BlobReference.objects.filter(owner=owner)
+        digests = list(references.values_list('blob_id', flat=True))
+        if not digests:
+            return 0
+        # Строки blob блокируются до конца транзакции: конкурентный store_* того же
+        # содержимого не добавит ссылку на удаляемый blob (ждет и сохраняет заново)
+        list(Blob.objects.select_for_update().filter(digest__in=digests).values_list('digest', flat=True))
+        references.delete()
+        orphans = list(
+            Blob.objects.filter(digest__in=digests)
+            .annotate(reference_count=Count('references'))
+            .filter(reference_count=0)
+        )
+        Blob.objects.filter(digest__in=[blob.digest for blob in orphans]).delete()
+        # Файлы удаляются до фиксации удаления записей: store_* видит, что записи нет, только
+        # после фиксации, поэтому заново сохраненные файлы не будут удалены здесь
+        for blob in orphans:
+            for name in (blob.name, blob.thumbnail):
+                if name:
+                    try:
+                        media_path(name).unlink()
+                    except FileNotFoundError:
+                        pass
+    _stats['released'] += len(digests)
+    _stats['deleted'] += len(orphans)
+    if orphans:
+        logger.info(f"[BlobStore] Released {owner}: deleted {len(orphans)}/{len(digests)} blobs")
+    return len(orphans)
+
+
+def get_stats() -> Dict[str, int]:
+    """Статистика хранилища на этом воркере"""
+    return dict(_stats)
@@ -0,0 +1,74 @@
+# base/channel_registry.py
+"""
+Реестр соответствия UID пользователя -> channel_name его WebSocket соединения.
+Позволяет доставлять адресные WebRTC сигналы (offer/answer/ice-candidate)
+напрямую в один канал через channel_layer.send вместо group_send на всю комнату.
+"""
+
+from typing import Optional, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Хранилище соответствий по комнатам (в памяти процесса)
+# Формат: {room_group_name: {user_uid: channel_name}}
+# Если UID не найден (например, пользователь подключен к другому воркеру),
+# отправитель откатывается на group_send.
+channel_registry: Dict[str, Dict[str, str]] = {}
+
+
+class ChannelRegistry:
+    """Реестр каналов пользователей для адресной доставки сообщений"""
+
+    @staticmethod
+    def register(room_group_name: str, user_uid: str, channel_name: str):
+        """
+        Зарегистрировать канал пользователя в комнате.
+
+        Args:
+            room_group_name: Имя группы комнаты
+            user_uid: UID пользователя
+            channel_name: Имя канала WebSocket соединения
+        """
+        channel_registry.setdefault(room_group_name, {})[str(user_uid)] = channel_name
+        logger.debug(f'[ChannelRegistry] Registered {user_uid} -> {channel_name} in {room_group_name}')
+
+    @staticmethod
+    def unregister(room_group_name: str, user_uid: str, channel_name: str):
+        """
+        Удалить канал пользователя из реестра.
+        Запись удаляется только если она принадлежит этому каналу
+        (пользователь мог переподключиться с новым соединением).
+
+        Args:
+            room_group_name: Имя группы комнаты
+            user_uid: UID пользователя
+            channel_name: Имя канала, который отключается
+        """
+        room_channels = channel_registry.get(room_group_name)
+        if not room_channels:
+            return
+        if room_channels.get(str(user_uid)) == channel_name:
+            del room_channels[str(user_uid)]
+            logger.debug(f'[ChannelRegistry] Unregistered {user_uid} from {room_group_name}')
+        if not room_channels:
+            del channel_registry[room_group_name]
+
+    @staticmethod
+    def get_channel(room_group_name: str, user_uid) -> Optional[str]:
+        """
+        Получить канал пользователя.
+
+        Args:
+            room_group_name: Имя группы комнаты
+            user_uid: UID пользователя
+
+        Returns:
+            channel_name или None, если пользователь неизвестен этому процессу
+        """
+        if user_uid is None:
+            return None
+        room_channels = channel_registry.get(room_group_name)
+        if not room_channels:
+            return None
+        return room_channels.get(str(user_uid))
@@ -0,0 +1,65 @@
+# base/codec.py
+"""
+JSON кодек для WebSocket consumers.
+Использует orjson (есть в requirements.txt); если он не установлен - ujson
+или стандартный json.
+Бэкенд можно выбрать явно через переменную окружения JSON_CODEC
+(auto, orjson, ujson, json).
+"""
+
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto').lower()
+
+# Все бэкенды выбрасывают подклассы ValueError при ошибке разбора
+DecodeError = ValueError
+
+orjson = None
+ujson = None
+if JSON_CODEC in ('auto', 'orjson'):
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+if orjson is None and JSON_CODEC in ('auto', 'ujson'):
+    try:
+        import ujson
+    except ImportError:
+        ujson = None
+
+
+def _json_dumps(obj) -> str:
+    return json.dumps(obj)
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+
+    def dumps(obj) -> str:
+        """Сериализовать объект в JSON строку"""
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            # orjson не поддерживает нестроковые ключи и целые больше 64 бит
+            return _json_dumps(obj)
+
+    # Целые больше 64 бит orjson читает как float (в сигнализации таких нет)
+    loads = orjson.loads
+elif ujson is not None:
+    BACKEND = 'ujson'
+
+    def dumps(obj) -> str:
+        """Сериализовать объект в JSON строку"""
+        return ujson.dumps(obj, ensure_ascii=False)
+
+    loads = ujson.loads
+else:
+    BACKEND = 'json'
+    dumps = _json_dumps
+    loads = json.loads
+
+logger.info(f'[Codec] Using {BACKEND} JSON backend')
@@ -1,25 +1,51 @@
 # base/consumers.py
 import os
-import json
 import time
 import re
 import asyncio
+import logging
 from collections import defaultdict
+from urllib.parse import parse_qs
+from weakref import WeakSet
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.layers import get_channel_layer
-from channels.exceptions import StopConsumer
-import redis
+from channels.exceptions import ChannelFull, StopConsumer
+from channels.db import database_sync_to_async
 from base.views import cleanup_room_images
-from base.screen_sharing_service import ScreenSharingService
+from base.screen_sharing_service import ScreenSharingService, SCREEN_SHARING_HEARTBEAT_INTERVAL
 from base.screen_sharing_handlers import ScreenSharingHandlers
+from base.channel_registry import ChannelRegistry, channel_registry
+from base.room_occupancy import RoomOccupancy, OccupancyUnavailable
+from base.presence import PresenceRegistry, PRESENCE_HEARTBEAT_INTERVAL
+from base.rate_limiter import ConnectionRateLimiter, RoomRateLimiter, UNPARSED
+from base.event_coalescer import EventCoalescer, get_coalesce_key
+from base.outbound_queue import OutboundQueue, OUTBOUND_QUEUE_CLOSE_CODE, get_lane
+from base.message_dispatch import (
+    DEFAULT_MAX_MESSAGE_SIZE, MESSAGE_HANDLERS, message_handler, get_handler_spec, dispatch_message
+)
+from base import codec, binary_protocol, stroke_simplify, whiteboard_media, image_pipeline
+from base.redis_cleanup import RedisCleanup
+from base.whiteboard_store import WhiteboardStore, OP_PATH, OP_ADD, state_item_text, iter_state_chunks
+from base.structured_log import get_logger
+from base import metrics, signal_trace
 
 # Максимальное количество участников в комнате
 MAX_ROOM_SIZE = int(os.environ.get('MAX_ROOM_SIZE', '20'))
 
-# Rate limiting: максимум сообщений в секунду
-# Увеличено для WebRTC (много ICE кандидатов приходят быстро)
-MAX_MESSAGES_PER_SECOND = 30  # Было 10 - недостаточно для WebRTC
-RATE_LIMIT_WINDOW = 1.0  # секунды
+# Батчинг ICE кандидатов: интервал флеша растет с размером комнаты
+ICE_BATCH_MIN_INTERVAL = 0.02  # 20ms для комнат из 2 человек
+ICE_BATCH_INTERVAL_STEP = 0.005  # +5ms за каждого дополнительного участника
+ICE_BATCH_MAX_INTERVAL = 0.1  # Гарантированный потолок задержки кандидата
+ICE_BATCH_FLUSH_THRESHOLD = 15  # Флешим сразу, если накопилось столько кандидатов
+ICE_BATCH_MAX_SIZE = 30  # Максимум сообщений в одном webrtc_signal_batch
+
+# Восстановление доски: максимум байт в исходящей очереди, после которого
+# следующий пакет состояния ждет, пока клиент примет предыдущие
+WHITEBOARD_STATE_MAX_BUFFERED = int(os.environ.get('WHITEBOARD_STATE_MAX_BUFFERED', str(1024 * 1024)))
+
+# Самый большой допустимый кадр (whiteboard-object с изображением в data URL):
+# кадры больше отклоняются до разбора
+MAX_FRAME_SIZE = max(whiteboard_media.WHITEBOARD_INLINE_IMAGE_MAX_SIZE, 2 * 1024 * 1024)
 
 # Валидные типы сообщений
 VALID_MESSAGE_TYPES = {
@@ -39,29 +65,75 @@ UID_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{1,50}$')
 # Валидация room_name: только буквы, цифры, дефисы и подчеркивания, максимум 100 символов
 ROOM_NAME_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{1,100}$')
 
-# Счетчик участников в комнатах (в памяти, для простоты)
-# В продакшене лучше использовать Redis
-room_user_count = defaultdict(int)
+def whiteboard_object_max_size(data):
+    """
+    Лимит размера whiteboard-object. Кадр с изображением в data URL принимается
+    целиком только для выноса изображения в файл (пересылается уже ссылка),
+    остальные - обычный лимит сообщения.
+    """
+    event_data = data.get('data')
+    if isinstance(event_data, dict) and whiteboard_media.has_inline_images(event_data.get('object')):
+        return whiteboard_media.WHITEBOARD_INLINE_IMAGE_MAX_SIZE
+    return DEFAULT_MAX_MESSAGE_SIZE
+
+
+# Логгеры по категориям (уровни - LOG_LEVEL_<КАТЕГОРИЯ> в settings)
+log_signaling = get_logger('signaling')
+log_whiteboard = get_logger('whiteboard')
+log_turn = get_logger('turn')
+log_cleanup = get_logger('cleanup')
+log_presence = get_logger('presence')
+log_screen_sharing = get_logger('screen_sharing')
 
-# Redis клиент для хранения состояния доски
-def get_redis_client():
-    """Получить Redis клиент для хранения состояния доски"""
-    try:
-        return redis.Redis(host='127.0.0.1', port=6379, db=0, decode_responses=True)
-    except Exception as e:
-        print(f"[Whiteboard] Error connecting to Redis: {e}")
-        return None
+# Открытые соединения процесса (для gauge в /metrics)
+active_consumers = WeakSet()
+ACTIVE_CONSUMERS_SNAPSHOT_ATTEMPTS = 5
+
+
+def _active_consumers_snapshot() -> list:
+    """
+    Копия active_consumers для sync view /metrics.
+
+    View работает в другом потоке, event loop в это время добавляет и удаляет
+    соединения - копирование может прерваться RuntimeError (множество изменилось
+    во время обхода); тогда копируем заново. Если множество меняется на всех
+    попытках - пустой снимок: gauge на один опрос занижен, но /metrics отвечает.
+    """
+    for _ in range(ACTIVE_CONSUMERS_SNAPSHOT_ATTEMPTS):
+        try:
+            return list(active_consumers)
+        except RuntimeError:
+            continue
+    return []
+
+
+metrics.connections.function = lambda: {(): len(active_consumers)}
+metrics.rooms.function = lambda: {(): len(channel_registry)}
+metrics.pending_ice.function = lambda: {
+    (): sum(len(consumer.pending_messages) for consumer in _active_consumers_snapshot())}
 
 
 class VideoCallConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.user_uid = None  # Сохраняем UID пользователя при подключении
-        self.message_timestamps = []  # Для rate limiting
+        self.rate_limiter = ConnectionRateLimiter()  # Token bucket по классам сообщений
         self.channel_layer = get_channel_layer()
-        self.pending_messages = []  # Очередь сообщений для батчинга
+        self.pending_messages = []  # Очередь сообщений для батчинга: (сообщение, время получения)
+        self.received_at = None  # Отметка receive обрабатываемого кадра (signal_trace)
+        self.trace_frames = False  # Клиент запросил отметки трассировки в кадрах (?trace=1)
+        self.inline_images = {}  # Вынесенные в файлы data URL изображений: {sha1: URL}
         self.last_flush_time = time.time()
-        self.flush_interval = 0.1  # Флеш каждые 100ms для батчинга
+        self.flush_task = None  # Таймер флеша батча ICE кандидатов
+        self.flush_sleeping = False  # Таймер еще ждет (флеш не начат) - его можно отменить
+        self.flush_lock = asyncio.Lock()  # Батчи отправляются по одному, в порядке извлечения
+        self.room_size = 0  # Последний известный размер комнаты (для адаптивного батчинга)
+        self.screen_share_heartbeat_task = None  # Продление lease демонстрации экрана
+        self.presence_task = None  # Heartbeat присутствия в комнате
+        self.whiteboard_restore_task = None  # Отправка состояния доски после join
+        # Исходящая очередь с приоритетами: signaling -> media-state -> whiteboard -> cursor
+        self.outbound = OutboundQueue(self._send_frame, self._on_outbound_overflow)
+        self.binary_protocol = False  # Клиент согласовал msgpack subprotocol
     
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
@@ -73,10 +145,16 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
         
         self.room_group_name = f"video_call_{self.room_name}"
         
-        # Проверка размера комнаты
-        # Примечание: точная проверка количества участников требует дополнительной логики
-        # (например, хранение счетчика в Redis). Для простоты проверяем при join сообщении.
-        # Ограничение будет применяться на уровне rate limiting и валидации.
+        # Бинарный протокол, если клиент его запросил (остальные клиенты работают через JSON)
+        subprotocol = None
+        query = parse_qs(self.scope.get("query_string", b"").decode("latin-1"))
+        self.trace_frames = query.get("trace") == ["1"]
+        if binary_protocol.SUBPROTOCOL in self.scope.get("subprotocols", []):
+            subprotocol = binary_protocol.SUBPROTOCOL
+            self.binary_protocol = True
+        
+        # Размер комнаты проверяет join (атомарно в Redis): UID еще неизвестен, а
+        # переподключающийся участник занимает свое место, даже если комната полна
 
         # Join room group
         await self.channel_layer.group_add(
@@ -84,7 +162,9 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol=subprotocol)
+        active_consumers.add(self)
+        metrics.start_publisher()
         
         # Notify all other users about new user joining
         # We'll send the user-joined message after they send their join message
@@ -93,79 +173,87 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
         """⚠️ КРИТИЧНО: Полная очистка всех соединений при отключении"""
         # Сохраняем user_uid ПЕРЕД очисткой для логирования
         user_uid_for_log = self.user_uid
-        print(f"[Cleanup] Starting cleanup for user {user_uid_for_log} in room {self.room_name}")
+        log_cleanup.debug('cleanup start', user=user_uid_for_log, room=self.room_name)
         
-        # 1. Очищаем очередь сообщений
+        # 1. Останавливаем таймер батчинга, очищаем очередь сообщений и исходящую очередь
+        self._cancel_flush_task()
         self.pending_messages.clear()
+        self.outbound.close()
+        active_consumers.discard(self)
         
-        # 2. Уменьшаем счетчик участников при отключении
-        if self.room_group_name in room_user_count:
-            current_count = room_user_count.get(self.room_group_name, 0)
-            if current_count is not None:
-                room_user_count[self.room_group_name] = max(0, int(current_count) - 1)
-            else:
-                room_user_count[self.room_group_name] = 0
-            # Удаляем запись если комната пуста
-            if room_user_count.get(self.room_group_name, 0) == 0:
-                del room_user_count[self.room_group_name]
-                print(f"[Cleanup] Room {self.room_name} is now empty")
+        # Удаляем канал из реестра адресной доставки и из присутствия
+        self._cancel_presence_heartbeat()
+        self._cancel_whiteboard_restore()
+        if user_uid_for_log:
+            ChannelRegistry.unregister(self.room_group_name, user_uid_for_log, self.channel_name)
+            try:
+                await PresenceRegistry.remove(self.room_name, user_uid_for_log, self.channel_name)
+            except Exception as e:
+                log_cleanup.warning('presence remove failed', user=user_uid_for_log, error=e)
+        
+        # 2. Удаляем пользователя из комнаты (атомарно в Redis, общий счетчик для всех воркеров)
+        room_empty = False
+        superseded = False
+        if user_uid_for_log:
+            # Место удаляется, только если принадлежит этому соединению: после переподключения
+            # с тем же UID disconnect старого сокета не выводит пользователя из комнаты
+            removed, room_size, superseded = await RoomOccupancy.leave(
+                self.room_group_name, user_uid_for_log, self.channel_name)
+            # Очистку выполняет только тот процесс, который удалил последнего участника
+            room_empty = removed and room_size == 0
+            if room_empty:
+                log_cleanup.info('room empty', room=self.room_name)
                 # Очищаем состояние доски когда комната становится пустой
                 await self._clear_whiteboard_state()
                 # Очищаем состояние демонстрации экрана
-                ScreenSharingService.cleanup_room(self.room_name)
+                await ScreenSharingService.cleanup_room(self.room_name)
+                RoomRateLimiter.cleanup_room(self.room_group_name)
+                EventCoalescer.cleanup_room(self.room_group_name)
         
         # 3. Если отключается пользователь, который демонстрировал экран, останавливаем демонстрацию
-        if user_uid_for_log:
-            sharing_user = ScreenSharingService.get_sharing_user(self.room_name)
-            if sharing_user == user_uid_for_log:
-                ScreenSharingService.force_stop_sharing(self.room_name)
+        self._cancel_screen_share_heartbeat()
+        if user_uid_for_log and not room_empty and not superseded:
+            # Lease снимается, только если он принадлежит этому пользователю
+            result = await ScreenSharingService.stop_sharing(self.room_name, user_uid_for_log)
+            if result['success']:
                 # Уведомляем остальных пользователей
                 try:
                     await asyncio.wait_for(
                         self.channel_layer.group_send(
                             self.room_group_name,
-                            {
-                                "type": "webrtc_signal",
-                                "message": {
-                                    "type": "screen-share-stopped",
-                                    "from": user_uid_for_log,
-                                    "room": self.room_name,
-                                    "sharing_user": user_uid_for_log,
-                                    "reason": "user_disconnected"
-                                },
-                                "sender_channel": self.channel_name,
-                                "target_id": None,
-                            }
+                            self._build_signal_event({
+                                "type": "screen-share-stopped",
+                                "from": user_uid_for_log,
+                                "room": self.room_name,
+                                "sharing_user": user_uid_for_log,
+                                "reason": "user_disconnected"
+                            })
                         ),
                         timeout=0.5
                     )
+                    await self._broadcast_screen_share_invalidate()
                 except (asyncio.TimeoutError, Exception) as e:
-                    print(f"[Cleanup] Error notifying screen share stop (non-critical): {e}")
+                    log_cleanup.warning('screen share stop notify failed', user=user_uid_for_log, error=e)
         
-        # 3. Отправляем user-left сообщение (если есть UID) - БЕЗ задержки, с таймаутом
-        if user_uid_for_log:
+        # 3. Отправляем user-left сообщение (если есть UID и пользователь не переподключился) - БЕЗ задержки, с таймаутом
+        if user_uid_for_log and not superseded:
             try:
                 # Отправляем сообщение асинхронно, но не ждем долго
                 await asyncio.wait_for(
                     self.channel_layer.group_send(
                         self.room_group_name,
-                        {
-                            "type": "webrtc_signal",
-                            "message": {
-                                "type": "user-left",
-                                "uid": user_uid_for_log,
-                                "room": self.room_name
-                            },
-                            "sender_channel": self.channel_name,
-                            "target_id": None,  # Broadcast
-                        }
+                        self._build_signal_event({
+                            "type": "user-left",
+                            "uid": user_uid_for_log,
+                            "room": self.room_name
+                        })  # Broadcast
                     ),
                     timeout=0.5  # Таймаут 500ms
                 )
             except asyncio.TimeoutError:
-                print(f"[Cleanup] Timeout sending user-left (non-critical)")
+                log_cleanup.warning('user-left timeout', user=user_uid_for_log)
             except Exception as e:
-                print(f"[Cleanup] Error sending user-left (non-critical): {e}")
+                log_cleanup.warning('user-left failed', user=user_uid_for_log, error=e)
         
         # 4. Удаляем из группы - с таймаутом
         try:
@@ -176,117 +264,29 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                 ),
                 timeout=0.5  # Таймаут 500ms
             )
-            print(f"[Cleanup] Removed channel {self.channel_name} from group {self.room_group_name}")
+            log_cleanup.debug('group discard', channel=self.channel_name, group=self.room_group_name)
         except asyncio.TimeoutError:
-            print(f"[Cleanup] Timeout in group_discard (non-critical)")
+            log_cleanup.warning('group discard timeout', channel=self.channel_name)
         except Exception as e:
-            print(f"[Cleanup] Error in group_discard (non-critical): {e}")
+            log_cleanup.warning('group discard failed', channel=self.channel_name, error=e)
         
-        # 5. Redis очистка - выносим в фоновую задачу, чтобы не блокировать disconnect
-        # Используем asyncio.create_task для неблокирующего выполнения
-        if user_uid_for_log:
-            asyncio.create_task(self._cleanup_redis_async(self.channel_name, self.room_group_name))
+        # 5. Redis очистка - в фоновом пуле, чтобы не блокировать disconnect.
+        # Удаляем только ключи присутствия опустевшей комнаты и только если в нее никто
+        # не вошел заново; ключ группы не трогаем (его членов истекает channel layer)
+        if room_empty:
+            RedisCleanup.schedule(RedisCleanup.room_keys(self.room_name),
+                                  guard_key=RoomOccupancy.key(self.room_group_name))
         
         # 6. Очищаем все локальные данные
-        self.message_timestamps.clear()
         self.pending_messages.clear()
         # Очищаем user_uid ПОСЛЕ всех операций
         self.user_uid = None
         
-        print(f"[Cleanup] Cleanup completed for user {user_uid_for_log} in room {self.room_name}")
+        log_cleanup.info('user disconnected', user=user_uid_for_log, room=self.room_name, code=close_code)
         
         # 7. Явно завершаем consumer
         raise StopConsumer()
     
-    async def _cleanup_redis_async(self, channel_name, room_group_name):
-        """Асинхронная очистка Redis в фоне"""
-        try:
-            # Пытаемся использовать асинхронный Redis клиент
-            try:
-                import redis.asyncio as aioredis
-                r = aioredis.Redis(host='127.0.0.1', port=6379, db=0, decode_responses=False)
-                
-                try:
-                    # Удаляем ключи канала
-                    channel_key_pattern = f"asgi:channel:{channel_name}*"
-                    deleted_count = 0
-                    
-                    async for key in r.scan_iter(match=channel_key_pattern):
-                        try:
-                            await r.delete(key)
-                            deleted_count += 1
-                        except Exception as e:
-                            print(f"[Cleanup] Error deleting key {key}: {e}")
-                    
-                    if deleted_count > 0:
-                        print(f"[Cleanup] Deleted {deleted_count} channel keys for {channel_name}")
-                    
-                    # Очищаем групповые ключи если комната пуста
-                    if room_group_name in room_user_count and room_user_count[room_group_name] == 0:
-                        group_key_pattern = f"asgi:group:{room_group_name}*"
-                        group_deleted = 0
-                        async for key in r.scan_iter(match=group_key_pattern):
-                            try:
-                                await r.delete(key)
-                                group_deleted += 1
-                            except Exception as e:
-                                print(f"[Cleanup] Error deleting group key {key}: {e}")
-                        
-                        if group_deleted > 0:
-                            print(f"[Cleanup] Deleted {group_deleted} group keys for empty room")
-                finally:
-                    # Закрываем асинхронное соединение
-                    await r.aclose()
-            except ImportError:
-                # Если aioredis не доступен, используем синхронный клиент в executor
-                import redis
-                loop = asyncio.get_event_loop()
-                
-                def cleanup_sync():
-                    deleted_count = 0
-                    r = None
-                    try:
-                        r = redis.Redis(host='127.0.0.1', port=6379, db=0, decode_responses=False)
-                        for key in r.scan_iter(match=f"asgi:channel:{channel_name}*"):
-                            try:
-                                r.delete(key)
-                                deleted_count += 1
-                            except:
-                                pass
-                    except:
-                        pass
-                    finally:
-                        # Синхронный клиент закрывается автоматически, но можно явно закрыть соединение
-                        if r:
-                            try:
-                                r.close()
-                            except:
-                                pass
-                    return deleted_count
-                
-                try:
-                    deleted_count = await loop.run_in_executor(None, cleanup_sync)
-                    if deleted_count > 0:
-                        print(f"[Cleanup] Deleted {deleted_count} channel keys for {channel_name}")
-                except Exception as e:
-                    print(f"[Cleanup] Error in async Redis cleanup: {e}")
-        except Exception as e:
-            print(f"[Cleanup] Error in Redis cleanup (non-critical): {e}")
-
-    def _check_rate_limit(self):
-        """Проверка rate limiting с оптимизацией для WebRTC"""
-        now = time.time()
-        # Удаляем старые записи (старше окна)
-        self.message_timestamps = [ts for ts in self.message_timestamps if now - ts < RATE_LIMIT_WINDOW]
-        
-        # Проверяем лимит
-        if len(self.message_timestamps) >= MAX_MESSAGES_PER_SECOND:
-            return False
-        
-        # Добавляем текущее время
-        self.message_timestamps.append(now)
-        return True
-    
     def _validate_message(self, data):
         """Валидация сообщения"""
         # Проверка типа сообщения
@@ -318,8 +318,67 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             if 'candidate' in data and len(str(data['candidate'])) > 1000:
                 return False, "ICE candidate too large"
         
+        # Обработчики доски читают data и data.object как словари
+        if message_type in ('whiteboard-draw', 'whiteboard-object', 'whiteboard-cursor'):
+            event_data = data.get("data")
+            if event_data is not None and not isinstance(event_data, dict):
+                return False, "Invalid whiteboard data"
+            obj = event_data.get("object") if event_data else None
+            if obj is not None and not isinstance(obj, dict):
+                return False, "Invalid whiteboard data"
+        
         return True, None
 
+    def _get_flush_interval(self):
+        """Адаптивный интервал батчинга ICE кандидатов в зависимости от размера комнаты"""
+        # В маленьких комнатах отправляем почти сразу (быстрая установка соединения),
+        # в больших - копим дольше, чтобы сократить количество обращений к Redis
+        interval = ICE_BATCH_MIN_INTERVAL + ICE_BATCH_INTERVAL_STEP * max(0, self.room_size - 2)
+        return min(interval, ICE_BATCH_MAX_INTERVAL)
+
+    def _schedule_flush(self):
+        """Запустить таймер флеша, если он еще не запущен"""
+        if self.flush_task is None or self.flush_task.done():
+            # Таймер отменяем и до первого шага задачи: флеш еще не начат
+            self.flush_sleeping = True
+            self.flush_task = asyncio.create_task(self._flush_after(self._get_flush_interval()))
+
+    async def _flush_after(self, delay):
+        """Таймер: флешит накопленные сообщения не позже чем через delay секунд"""
+        current = asyncio.current_task()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        finally:
+            if self.flush_task is current:
+                self.flush_sleeping = False
+        try:
+            await self._flush_pending_messages(force=True)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            log_signaling.error('batch flusher failed', error=e)
+        if self.flush_task is current:
+            self.flush_task = None
+        # Кандидаты, пришедшие во время отправки батча, отправит следующий таймер
+        if self.pending_messages:
+            self._schedule_flush()
+
+    def _cancel_flush_timer(self):
+        """Отменить таймер, который еще ждет; уже начатый флеш не прерывается (его батч извлечен из очереди)"""
+        if self.flush_task is not None and self.flush_sleeping:
+            self.flush_task.cancel()
+            self.flush_task = None
+            self.flush_sleeping = False
+
+    def _cancel_flush_task(self):
+        """Остановить таймер флеша (при отключении)"""
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+        self.flush_task = None
+        self.flush_sleeping = False
+
     async def _flush_pending_messages(self, force=False):
         """Флеш накопленных сообщений (батчинг для ICE кандидатов)"""
         if not self.pending_messages:
@@ -327,404 +386,686 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
         
         now = time.time()
         # Флешим если принудительно, прошло достаточно времени или накопилось много сообщений
-        # При 3+ пользователях уменьшаем порог для более частого флеша
-        if not force and now - self.last_flush_time < self.flush_interval and len(self.pending_messages) < 15:
+        if not force and now - self.last_flush_time < self._get_flush_interval() and len(self.pending_messages) < ICE_BATCH_FLUSH_THRESHOLD:
             return
         
-        # При множественных соединениях уменьшаем размер батча для более частой отправки
-        batch_size = 30  # Было 50 - уменьшено для 3+ пользователей
-        messages_to_send = self.pending_messages[:batch_size]
-        self.pending_messages = self.pending_messages[batch_size:]
-        self.last_flush_time = now
+        # Следующий батч ждет, пока предыдущий (например, из таймера) будет отправлен целиком
+        async with self.flush_lock:
+            await self._send_pending_messages()
+
+    async def _send_pending_messages(self):
+        if not self.pending_messages:
+            return
+        messages_to_send = self.pending_messages
+        self.pending_messages = []
+        self.last_flush_time = time.time()
         
-        # Отправляем батч сообщений напрямую в channel_layer
-        for msg_data in messages_to_send:
-            try:
-                message_type = msg_data.get("type")
-                target_id = msg_data.get("to")
-                
-                if message_type in ['user-joined', 'mic-active', 'mic-inactive', 'camera-enabled', 'camera-disabled', 
-                                   'request-camera-states', 'whiteboard-draw', 'whiteboard-object', 'whiteboard-cursor', 
-                                   'whiteboard-clear'] or not target_id:
-                    # Broadcast
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            "type": "webrtc_signal",
-                            "message": msg_data,
-                            "sender_channel": self.channel_name,
-                            "target_id": None,
-                        }
-                    )
-                else:
-                    # Send to specific target
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            "type": "webrtc_signal",
-                            "message": msg_data,
-                            "sender_channel": self.channel_name,
-                            "target_id": target_id,
-                        }
-                    )
-            except Exception as e:
-                if 'capacity' in str(e).lower() or 'rate limit' in str(e).lower():
-                    print(f"[WebRTC] Batched message dropped due to capacity (non-critical)")
-                else:
-                    print(f"[WebRTC] Error sending batched message: {e}")
+        # Группируем сообщения по маршруту: адресные - по каналу получателя,
+        # остальные (неизвестный получатель или broadcast) - одним батчем в группу
+        direct_batches = defaultdict(list)
+        group_batch = []
+        for msg_data, received_at in messages_to_send:
+            target_id = msg_data.get("to")
+            # Каждое сообщение сериализуется один раз здесь, получатели пересылают готовый текст
+            item = {"text": self._encode_signal(msg_data, target_id), "target_id": target_id,
+                    "msg_type": msg_data.get("type"), "ts": received_at}
+            target_channel = ChannelRegistry.get_channel(self.room_group_name, target_id)
+            if target_channel:
+                direct_batches[target_channel].append(item)
+            else:
+                group_batch.append(item)
+        
+        # Один webrtc_signal_batch на получателя вместо отдельного сообщения на каждый кандидат
+        for target_channel, items in direct_batches.items():
+            for i in range(0, len(items), ICE_BATCH_MAX_SIZE):
+                await self._send_batch(items[i:i + ICE_BATCH_MAX_SIZE], target_channel)
+        for i in range(0, len(group_batch), ICE_BATCH_MAX_SIZE):
+            await self._send_batch(group_batch[i:i + ICE_BATCH_MAX_SIZE], None)
     
-    async def _send_message_internal(self, message_data):
+    async def _send_batch(self, items, target_channel):
+        """Отправить батч сообщений одним событием channel layer"""
+        event = {
+            "type": "webrtc_signal_batch",
+            "messages": items,
+            "sender_channel": self.channel_name,
+            "pub_ts": signal_trace.stamp(),
+        }
+        try:
+            start = time.perf_counter()
+            if target_channel:
+                await self._send_direct(target_channel, event, [item["msg_type"] for item in items])
+            else:
+                await self.channel_layer.group_send(self.room_group_name, event)
+                metrics.group_send_seconds.observe(time.perf_counter() - start, 'group')
+        except ChannelFull:
+            for item in items:
+                metrics.dropped_messages_total.inc(item["msg_type"])
+            log_signaling.sampled(logging.WARNING, 'batch dropped (capacity)', size=len(items))
+        except Exception as e:
+            log_signaling.warning('batch send failed', size=len(items), error=e)
+    
+    def _encode_signal(self, message_data, target_id=None):
+        """Сериализовать сообщение для клиента (один раз, на стороне отправителя)"""
+        if target_id:
+            # _target нужен клиенту для фильтрации; добавляем в копию, исходный dict не меняем
+            message_data = {**message_data, "_target": target_id}
+        return codec.dumps(message_data)
+
+    def _build_signal_event(self, message_data, target_id=None):
+        """
+        Событие channel layer с готовым текстом кадра.
+        Метаданные маршрутизации (sender_channel, target_id) хранятся вне payload,
+        получатели отправляют text в WebSocket без повторной сериализации.
+        """
+        return {
+            "type": "webrtc_signal",
+            "text": self._encode_signal(message_data, target_id),
+            "sender_channel": self.channel_name,
+            "target_id": target_id,
+            "msg_type": message_data.get("type"),  # Полоса исходящей очереди получателя
+            "ts": self.received_at,  # Отметка receive (трассировка, только в конверте)
+        }
+
+    async def _send_direct(self, target_channel, event, message_types):
+        """
+        Отправка события в канал получателя. Если канал переполнен (ChannelFull),
+        событие отбрасывается, как его молча отбросил бы group_send: медленный
+        получатель не должен завершать consumer отправителя.
+
+        Returns:
+            False если событие отброшено
+        """
+        start = time.perf_counter()
+        try:
+            await self.channel_layer.send(target_channel, event)
+        except ChannelFull:
+            for message_type in message_types:
+                metrics.dropped_messages_total.inc(message_type)
+            log_signaling.sampled(logging.WARNING, 'recipient channel full, dropped',
+                                  channel=target_channel, size=len(message_types))
+            return False
+        metrics.group_send_seconds.observe(time.perf_counter() - start, 'direct')
+        return True
+
+    async def _send_to_target(self, message_data, target_id):
+        """Адресная доставка: напрямую в канал получателя, если он известен, иначе через группу"""
+        event = self._build_signal_event(message_data, target_id)
+        target_channel = ChannelRegistry.get_channel(self.room_group_name, target_id)
+        event["pub_ts"] = signal_trace.stamp()
+        start = time.perf_counter()
+        if target_channel:
+            # O(1): сообщение получает только адресат, остальные участники его не декодируют
+            await self._send_direct(target_channel, event, [event["msg_type"]])
+        else:
+            # Fallback: получатель неизвестен этому процессу - рассылаем группе,
+            # клиенты отфильтруют сообщение по _target
+            await self.channel_layer.group_send(self.room_group_name, event)
+            metrics.group_send_seconds.observe(time.perf_counter() - start, 'group')
+
+    async def _send_message_internal(self, message_data, spec=None):
         """Внутренний метод для отправки сообщения с приоритизацией"""
         message_type = message_data.get("type")
         target_id = message_data.get("to")
+        if spec is None:
+            spec = get_handler_spec(message_type)
         
-        # КРИТИЧЕСКИЕ сообщения (offer, answer, user-joined, user-left) отправляем СРАЗУ
         # Батчим только ice-candidate для снижения нагрузки
-        if message_type == 'ice-candidate':
-            self.pending_messages.append(message_data)
-            # Флешим если накопилось много (15 для 3+ пользователей) или прошло время
-            # При 3+ пользователях уменьшаем порог для более частого флеша
-            flush_threshold = 15  # Было 20
-            if len(self.pending_messages) >= flush_threshold:
+        if spec is not None and spec.batched:
+            self.pending_messages.append((message_data, self.received_at))
+            # Флешим если накопилось много, иначе таймер гарантирует отправку не позже интервала
+            if len(self.pending_messages) >= ICE_BATCH_FLUSH_THRESHOLD:
+                self._cancel_flush_timer()
                 await self._flush_pending_messages(force=True)
+            else:
+                self._schedule_flush()
             return
         
-        # КРИТИЧЕСКИЕ сообщения (offer, answer) отправляем СРАЗУ без батчинга
-        # Остальные сообщения также отправляем сразу
-        if message_type in ['offer', 'answer']:
-            # Критические сообщения - отправляем немедленно
-            try:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "webrtc_signal",
-                        "message": message_data,
-                        "sender_channel": self.channel_name,
-                        "target_id": target_id,
-                    }
-                )
-            except Exception as e:
-                # Для критических сообщений логируем ошибку, но не игнорируем
-                print(f"[WebRTC] ERROR sending critical {message_type} to {target_id}: {e}")
-                raise  # Пробрасываем ошибку для критических сообщений
-        elif message_type in ['user-joined', 'user-left', 'mic-active', 'mic-inactive', 'camera-enabled', 'camera-disabled', 
-                           'request-camera-states', 'whiteboard-draw', 'whiteboard-object', 'whiteboard-cursor', 
-                           'whiteboard-clear'] or not target_id:
-            # Broadcast - отправляем сразу
-            try:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "webrtc_signal",
-                        "message": message_data,
-                        "sender_channel": self.channel_name,
-                        "target_id": None,
-                    }
-                )
-            except Exception as e:
-                if 'capacity' in str(e).lower() or 'rate limit' in str(e).lower():
-                    print(f"[WebRTC] Channel capacity exceeded for {message_type}, message dropped (non-critical)")
-                else:
-                    raise
-        else:
-            # Send to specific target
-            try:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "webrtc_signal",
-                        "message": message_data,
-                        "sender_channel": self.channel_name,
-                        "target_id": target_id,
-                    }
-                )
-            except Exception as e:
-                if 'capacity' in str(e).lower() or 'rate limit' in str(e).lower():
-                    print(f"[WebRTC] Channel capacity exceeded for {message_type}, message dropped (non-critical)")
-                else:
-                    raise
+        # Broadcast, если так объявлено для типа сообщения или получатель не указан;
+        # серверные сообщения без обработчика (screen-share-error, screen-share-state) с 'to' - адресные
+        broadcast = spec.broadcast if spec is not None else not target_id
+        if spec is None and target_id and target_id == self.user_uid:
+            # Ответ запросившему пользователю - этому соединению: своему каналу сообщение
+            # не доставляется (webrtc_signal пропускает отправителя), кладем кадр в очередь клиента
+            self._deliver_to_client(self._encode_signal(message_data, target_id), message_type)
+            return
+        try:
+            if broadcast or not target_id:
+                event = self._build_signal_event(message_data)
+                event["pub_ts"] = signal_trace.stamp()
+                start = time.perf_counter()
+                await self.channel_layer.group_send(self.room_group_name, event)
+                metrics.group_send_seconds.observe(time.perf_counter() - start, 'group')
+            else:
+                # Send to specific target
+                await self._send_to_target(message_data, target_id)
+        except ChannelFull:
+            # Переполнение канала получателя определяется по типу исключения (текст у него пустой)
+            metrics.dropped_messages_total.inc(message_type)
+            log_signaling.sampled(logging.WARNING, 'message dropped (capacity)', type=message_type)
+        except Exception as e:
+            if spec is not None and spec.critical:
+                # КРИТИЧЕСКИЕ сообщения (offer, answer): логируем и пробрасываем ошибку
+                log_signaling.error('critical send failed', type=message_type, target=target_id, error=e)
+            raise
 
     # Receive WebRTC signaling message from WebSocket
-    async def receive(self, text_data):
-        # Rate limiting
-        if not self._check_rate_limit():
-            print(f"Rate limit exceeded for channel {self.channel_name}")
-            await self.send(text_data=json.dumps({
+    async def receive(self, text_data=None, bytes_data=None):
+        received_at = signal_trace.stamp()
+        frame_size = len(bytes_data) if bytes_data is not None else len(text_data)
+        
+        # До разбора: кадр больше любого лимита или сверх общего бюджета соединения
+        # отклоняется сразу, поток больших кадров не заставляет сервер их разбирать
+        if frame_size > MAX_FRAME_SIZE:
+            log_signaling.sampled(logging.WARNING, 'message too large', size=frame_size, max_size=MAX_FRAME_SIZE)
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": f"Message too large (max {MAX_FRAME_SIZE // 1024}KB)"
+            }))
+            return
+        if not self.rate_limiter.can_accept(frame_size):
+            metrics.rate_limited_total.inc(UNPARSED)
+            log_signaling.sampled(logging.WARNING, 'rate limit exceeded', channel=self.channel_name, message_class=UNPARSED)
+            await self._send_frame(codec.dumps({
                 "type": "error",
                 "message": "Rate limit exceeded. Please slow down."
             }))
             return
         
-        # Оптимизация: проверяем размер сообщения с учетом типа
-        # Ограничиваем размер для предотвращения перегрузки
-        # Для изображений на доске нужен больший лимит (до 10MB)
-        MAX_MESSAGE_SIZE = 100 * 1024  # По умолчанию 100KB
-        text_data_json = None  # Инициализируем переменную
-        
-        # Сначала пытаемся определить тип сообщения через быстрый парсинг
-        # Это нужно для установки правильного лимита размера
         try:
-            # Пытаемся распарсить JSON для определения типа
-            text_data_json = json.loads(text_data)
-            
-            # Проверяем тип сообщения и устанавливаем соответствующий лимит
-            message_type = text_data_json.get('type', '')
-            if message_type == 'whiteboard-object':
-                data = text_data_json.get('data', {})
-                event_type = data.get('eventType', '')
-                obj = data.get('object', {})
-                obj_type = obj.get('type', '')
-                
-                # Если это добавление изображения, увеличиваем лимит
-                if event_type == 'object-added' and obj_type in ['image', 'Image']:
-                    MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # 10MB для изображений
-                    print(f"[Whiteboard] Image detected, allowing up to 10MB")
-                elif message_type == 'whiteboard-object':
-                    # Для других объектов whiteboard тоже увеличиваем лимит (могут быть большие объекты)
-                    MAX_MESSAGE_SIZE = 5 * 1024 * 1024  # 5MB для других объектов whiteboard
-            elif message_type == 'whiteboard-draw':
-                # Для рисования тоже может быть большой размер (много точек)
-                MAX_MESSAGE_SIZE = 2 * 1024 * 1024  # 2MB для рисования
-        except (json.JSONDecodeError, KeyError, AttributeError):
-            # Если не удалось распарсить, используем стандартный лимит
-            # Но сначала проверим размер, чтобы не парсить очень большие невалидные сообщения
-            if len(text_data) > 100 * 1024:
-                # Пытаемся определить тип через поиск строк (fallback)
-                if 'whiteboard-object' in text_data and ('image' in text_data.lower() or 'Image' in text_data):
-                    MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # 10MB для изображений
-                    print(f"[Whiteboard] Large message detected as image (fallback), allowing up to 10MB")
-        
-        # Теперь проверяем размер с установленным лимитом
-        if len(text_data) > MAX_MESSAGE_SIZE:
-            print(f"Message too large: {len(text_data)} bytes (max: {MAX_MESSAGE_SIZE}), ignoring")
-            await self.send(text_data=json.dumps({
+            if bytes_data is not None:
+                text_data_json = binary_protocol.unpack(bytes_data)
+            else:
+                text_data_json = codec.loads(text_data)
+        except codec.DecodeError as e:
+            log_signaling.sampled(logging.WARNING, 'invalid frame', error=e)
+            await self._send_frame(codec.dumps({
                 "type": "error",
-                "message": f"Message too large (max {MAX_MESSAGE_SIZE // 1024}KB)"
+                "message": "Invalid JSON"
             }))
             return
+        if not isinstance(text_data_json, dict):
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": "Invalid message type"
+            }))
+            return
+        
+        # Один поиск в таблице обработчиков определяет лимиты и способ доставки
+        message_type = text_data_json.get("type")
+        spec = get_handler_spec(message_type)
+        # Метка - только известный тип (произвольные строки клиента не создают новых серий)
+        metrics.messages_total.inc(spec.message_type if spec else 'unknown', 'in')
+        metrics.frame_bytes.observe(frame_size, 'in')
         
-        # Флешим накопленные сообщения перед обработкой нового (принудительно)
-        await self._flush_pending_messages(force=True)
+        # Rate limiting по классу сообщения: поток whiteboard-cursor не расходует бюджет offer/answer
+        allowed, message_class = self.rate_limiter.check(message_type, frame_size, self.room_group_name)
+        if not allowed:
+            metrics.rate_limited_total.inc(message_class)
+            log_signaling.sampled(logging.WARNING, 'rate limit exceeded', channel=self.channel_name, message_class=message_class)
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": "Rate limit exceeded. Please slow down."
+            }))
+            return
         
-        # Если JSON еще не распарсен, парсим его
-        if text_data_json is None:
-            try:
-                text_data_json = json.loads(text_data)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSON: {e}")
-                await self.send(text_data=json.dumps({
-                    "type": "error",
-                    "message": "Invalid JSON"
-                }))
-                return
+        # Проверяем размер с лимитом, объявленным для типа сообщения
+        max_message_size = spec.get_max_size(text_data_json) if spec else DEFAULT_MAX_MESSAGE_SIZE
+        if frame_size > max_message_size:
+            log_signaling.sampled(logging.WARNING, 'message too large', size=frame_size, max_size=max_message_size)
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": f"Message too large (max {max_message_size // 1024}KB)"
+            }))
+            return
+        
+        # Флешим накопленные ICE кандидаты перед обработкой сообщения другого типа,
+        # чтобы сохранить порядок (например, кандидаты не должны обогнать новый offer).
+        # Новые ICE кандидаты просто добавляются в батч - его отправит таймер.
+        if spec is None or not spec.batched:
+            await self._flush_pending_messages(force=True)
         
         # Валидация сообщения
         is_valid, error_msg = self._validate_message(text_data_json)
         if not is_valid:
-            print(f"Invalid message: {error_msg}")
-            await self.send(text_data=json.dumps({
+            log_signaling.sampled(logging.WARNING, 'invalid message', error=error_msg)
+            await self._send_frame(codec.dumps({
                 "type": "error",
                 "message": error_msg
             }))
             return
         
-        message_type = text_data_json.get("type")
+        self.received_at = received_at
+        try:
+            await dispatch_message(self, spec, text_data_json)
+        finally:
+            self.received_at = None
+
+    # Handle 'join' message - convert to 'user-joined' and broadcast
+    @message_handler('join')
+    async def _handle_join(self, text_data_json, spec):
         sender_id = text_data_json.get("from") or text_data_json.get("uid")
-        target_id = text_data_json.get("to")
-        
-        # Handle 'join' message - convert to 'user-joined' and broadcast
-        if message_type == 'join':
-            # Проверка размера комнаты перед присоединением
-            if room_user_count[self.room_group_name] >= MAX_ROOM_SIZE:
-                await self.send(text_data=json.dumps({
-                    "type": "error",
-                    "message": "Room is full"
-                }))
-                await self.close(code=4002)  # Room is full
-                return
-            
-            # Увеличиваем счетчик участников
-            room_user_count[self.room_group_name] += 1
-            
-            # Сохраняем UID пользователя для использования при disconnect
-            self.user_uid = sender_id
-            
-            # Получаем имя пользователя
-            user_name = text_data_json.get("name") or "User"
-            
-            # Логируем подключение пользователя
-            print(f"[User Join] User {sender_id} ({user_name}) joined room {self.room_name}")
-            print(f"[User Join] Room {self.room_name} now has {room_user_count[self.room_group_name]} users")
-            
-            # Broadcast user-joined to all other users с именем
+        
+        # Атомарная проверка размера комнаты и добавление участника
+        # (повторный join того же UID не увеличивает счетчик)
+        try:
+            admitted, self.room_size = await RoomOccupancy.admit(
+                self.room_group_name, sender_id, MAX_ROOM_SIZE, self.channel_name)
+        except OccupancyUnavailable:
+            # Без общего учета лимит комнаты не соблюсти - клиент переподключится позже
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": "Room is temporarily unavailable"
+            }))
+            await self.close(code=1011)
+            return
+        if not admitted:
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": "Room is full"
+            }))
+            await self.close(code=4002)  # Room is full
+            return
+        
+        # Если соединение повторно отправило join с другим UID - освобождаем прежний
+        if self.user_uid and self.user_uid != sender_id:
+            await RoomOccupancy.leave(self.room_group_name, self.user_uid, self.channel_name)
+            ChannelRegistry.unregister(self.room_group_name, self.user_uid, self.channel_name)
+        
+        # Сохраняем UID пользователя для использования при disconnect
+        self.user_uid = sender_id
+        # Регистрируем канал для адресной доставки offer/answer/ice-candidate
+        ChannelRegistry.register(self.room_group_name, sender_id, self.channel_name)
+        
+        # Получаем имя пользователя
+        user_name = text_data_json.get("name") or "User"
+        
+        # Отмечаем присутствие и запускаем heartbeat
+        try:
+            await PresenceRegistry.touch(self.room_name, sender_id, user_name, self.channel_name)
+        except Exception as e:
+            log_presence.warning('presence update failed', user=sender_id, error=e)
+        self._start_presence_heartbeat()
+        
+        # Логируем подключение пользователя
+        log_signaling.info('user joined', user=sender_id, name=user_name, room=self.room_name, room_size=self.room_size)
+        
+        # Broadcast user-joined to all other users с именем
+        await self._send_message_internal({
+            "type": "user-joined",
+            "uid": sender_id,
+            "name": user_name,  # Передаем имя пользователя
+            "room": text_data_json.get("room")
+        })
+        
+        # Отправляем состояние доски новому пользователю - отдельной задачей: пока она ждет
+        # клиента (flow control), consumer продолжает принимать события, и offer от других
+        # участников обгоняет оставшиеся пакеты доски в исходящей очереди
+        self._start_whiteboard_restore(sender_id)
+        
+        # Отправляем состояние демонстрации экрана новому пользователю
+        sharing_state = await ScreenSharingService.get_sharing_state(self.room_name)
+        if sharing_state:
             await self._send_message_internal({
-                        "type": "user-joined",
-                        "uid": sender_id,
-                "name": user_name,  # Передаем имя пользователя
-                        "room": text_data_json.get("room")
+                "type": "screen-share-state",
+                "from": "system",
+                "to": sender_id,
+                "is_active": True,
+                "sharing_user": sharing_state['sharing_user_uid']
             })
-            
-            # Отправляем состояние доски новому пользователю
-            await self._send_whiteboard_state(sender_id)
-            
-            # Отправляем состояние демонстрации экрана новому пользователю
-            sharing_state = ScreenSharingService.get_sharing_state(self.room_name)
-            if sharing_state:
-                await self._send_message_internal({
-                    "type": "screen-share-state",
-                    "from": "system",
-                    "to": sender_id,
-                    "is_active": True,
-                    "sharing_user": sharing_state['sharing_user_uid']
-                })
-        # Handle 'user-left' message - broadcast immediately
-        elif message_type == 'user-left':
-            # Broadcast user-left immediately to all users
-            await self._send_message_internal(text_data_json)
-        elif message_type == 'turn-server-used':
-            # Логируем используемый TURN сервер (не пересылаем другим пользователям)
-            turn_server = text_data_json.get('turn_server', 'Unknown')
-            protocol = text_data_json.get('protocol', 'Unknown')
-            address = text_data_json.get('address', 'Unknown')
-            target_uid = text_data_json.get('to', 'Unknown')
-            sender_uid = text_data_json.get('from', 'Unknown')
-            print(f"[TURN Server] User {sender_uid} using {turn_server} ({protocol}) for connection to {target_uid} (address: {address})")
-            # Не пересылаем это сообщение другим пользователям - это только для логирования
-        elif message_type == 'turn-test-start':
-            # Логируем начало тестирования TURN серверов
-            sender_uid = text_data_json.get('from', 'Unknown')
-            servers_count = text_data_json.get('servers_count', 0)
-            servers = text_data_json.get('servers', [])
-            print(f"[TURN Test] 🚀 User {sender_uid} starting TURN server tests ({servers_count} servers)")
-            if servers:
-                print(f"[TURN Test] Servers to test: {', '.join(servers)}")
-        elif message_type == 'turn-test-complete':
-            # Логируем результаты тестирования TURN серверов
-            sender_uid = text_data_json.get('from', 'Unknown')
-            success = text_data_json.get('success', False)
-            working_servers = text_data_json.get('working_servers', 0)
-            total_servers = text_data_json.get('total_servers', 0)
-            duration_ms = text_data_json.get('duration_ms', 0)
-            selected_server = text_data_json.get('selected_server', 'Unknown')
-            selected_latency = text_data_json.get('selected_latency', 0)
-            from_cache = text_data_json.get('from_cache', False)
-            
-            if from_cache:
-                print(f"[TURN Test] 💾 User {sender_uid} using cached TURN server configuration")
-                print(f"[TURN Test] Cached servers: {working_servers}/{total_servers} servers")
-                print(f"[TURN Test] Selected from cache: {selected_server}")
-            elif success:
-                print(f"[TURN Test] ✅ User {sender_uid} completed tests: {working_servers}/{total_servers} servers working")
-                print(f"[TURN Test] Selected: {selected_server} ({selected_latency:.0f}ms) in {duration_ms:.0f}ms")
+
+    # Пересылка сообщений без дополнительной обработки
+    @message_handler('user-joined', 'user-left', 'mic-active', 'mic-inactive', 'camera-enabled', 'camera-disabled',
+                     'request-camera-states')
+    # Адресные, если указан получатель ('to'), иначе всей комнате
+    @message_handler('request-audio-states', 'audio-enabled', 'audio-disabled', broadcast=False)
+    @message_handler('offer', 'answer', broadcast=False, critical=True)
+    @message_handler('ice-candidate', broadcast=False, batched=True)
+    async def _handle_relay(self, text_data_json, spec):
+        await self._send_message_internal(text_data_json, spec)
+
+    # Курсоры рассылаются объединенными: последняя позиция каждого участника раз в тик
+    @message_handler('whiteboard-cursor')
+    async def _handle_whiteboard_cursor(self, text_data_json, spec):
+        self._coalesce_message(text_data_json, get_coalesce_key(text_data_json))
+
+    def _coalesce_message(self, message_data, key):
+        """Передать частое событие в накопитель комнаты вместо немедленного group_send"""
+        sender_uid = message_data.get("from") or self.user_uid
+        EventCoalescer.add(self.channel_layer, self.room_group_name, sender_uid, key, {
+            "text": self._encode_signal(message_data),
+            "msg_type": message_data.get("type"),
+            "sender_channel": self.channel_name,
+        })
+
+    # Сообщения доски: сохраняем состояние и пересылаем
+    @message_handler('whiteboard-draw', persisted=True, max_size=2 * 1024 * 1024)  # Много точек в пути
+    @message_handler('whiteboard-object', persisted=True, max_size=whiteboard_object_max_size)
+    @message_handler('whiteboard-clear', persisted=True)
+    async def _handle_whiteboard(self, text_data_json, spec):
+        message_type = spec.message_type
+        # Изображения из data URL - в файлы: дальше идет объект со ссылкой
+        if message_type == 'whiteboard-object' and not await self._offload_inline_images(text_data_json):
+            return
+        # object-moving/object-scaling: только последнее состояние за тик, без сохранения
+        coalesce_key = get_coalesce_key(text_data_json)
+        if coalesce_key is not None:
+            self._coalesce_message(text_data_json, coalesce_key)
+            return
+        
+        # Накопленные промежуточные состояния не должны обогнать итоговое изменение
+        if message_type == 'whiteboard-clear':
+            EventCoalescer.discard(self.room_group_name)
+        elif message_type == 'whiteboard-object':
+            event_data = text_data_json.get("data") or {}
+            obj_id = (event_data.get("object") or {}).get("id")
+            if obj_id and event_data.get("eventType") in ['object-modified', 'object-removed']:
+                EventCoalescer.discard(self.room_group_name, key=('object', obj_id))
+        
+        # Логируем объект перед сохранением и отправкой (поля собираются, только если DEBUG включен)
+        if message_type == 'whiteboard-object' and log_whiteboard.isEnabledFor(logging.DEBUG):
+            event_data = text_data_json.get("data", {})
+            event_type = event_data.get("eventType")
+            obj_data = event_data.get("object", {})
+            if event_type in ['object-added', 'object-modified']:
+                src = obj_data.get('src') or ''
+                log_whiteboard.sampled(
+                    logging.DEBUG, 'forwarding object', event_type=event_type,
+                    obj_type=obj_data.get('type', 'unknown'), obj_id=obj_data.get('id', 'no-id'),
+                    src_length=len(src), src_preview=src[:100]
+                )
+        
+        if spec.persisted:
+            await self._save_whiteboard_state(text_data_json)
+        await self._send_message_internal(text_data_json, spec)
+
+    async def _offload_inline_images(self, text_data_json):
+        """Вынести изображения из data URL объекта в файлы комнаты. False - сообщение отклонено"""
+        obj = (text_data_json.get("data") or {}).get("object")
+        if not whiteboard_media.has_inline_images(obj):
+            return True
+        try:
+            # Пул потоков (не общий thread-sensitive executor sync views): хэш, запись blob и ORM
+            images = await database_sync_to_async(whiteboard_media.offload_inline_images, thread_sensitive=False)(
+                self.room_name, obj, self.inline_images)
+        except Exception as e:
+            if isinstance(e, whiteboard_media.InlineImageError):
+                message = "Invalid inline image"
+            elif isinstance(e, (image_pipeline.ImagePipelineBusy, TimeoutError)):
+                message = "Image processing is busy, try again"
             else:
-                print(f"[TURN Test] ❌ User {sender_uid} tests failed: 0/{total_servers} servers working (fallback used)")
-                print(f"[TURN Test] Duration: {duration_ms:.0f}ms")
-            
-            # Логируем детальные результаты если есть
-            all_results = text_data_json.get('all_results', [])
-            if all_results:
-                print(f"[TURN Test] Detailed results:")
-                for result in all_results:
-                    status = "✅" if result.get('success') else "❌"
-                    reason = f" ({result.get('reason')})" if result.get('reason') else ""
-                    latency = result.get('latency', 0)
-                    if from_cache and latency == 0:
-                        latency_str = "cached"
-                    else:
-                        latency_str = f"{latency:.0f}ms"
-                    print(f"   {status} {result.get('name')}: {latency_str}{reason}")
-        elif message_type == 'screen-share-start':
-            # Обработка запроса на начало демонстрации экрана
-            result = await ScreenSharingHandlers.handle_screen_share_start(self, text_data_json)
-            if result.get('type') == 'screen-share-started':
-                # Broadcast всем пользователям
-                await self._send_message_internal(result)
-            elif result.get('type') == 'screen-share-error':
-                # Отправляем ошибку только запросившему пользователю
-                await self._send_message_internal(result)
-        elif message_type == 'screen-share-stop':
-            # Обработка запроса на остановку демонстрации экрана
-            result = await ScreenSharingHandlers.handle_screen_share_stop(self, text_data_json)
-            if result.get('type') == 'screen-share-stopped':
-                # Broadcast всем пользователям
-                await self._send_message_internal(result)
-            elif result.get('type') == 'screen-share-error':
-                # Отправляем ошибку только запросившему пользователю
-                await self._send_message_internal(result)
-        elif message_type == 'screen-share-request-state':
-            # Обработка запроса на получение состояния демонстрации экрана
-            result = await ScreenSharingHandlers.handle_screen_share_request_state(self, text_data_json)
-            # Отправляем состояние только запросившему пользователю
-            await self._send_message_internal(result)
+                message = "Failed to store image"
+            log_whiteboard.warning('inline image rejected', room=self.room_name, user=self.user_uid, error=e)
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": message
+            }))
+            return False
+        # После выноса изображений объект должен укладываться в обычный лимит
+        size = len(codec.dumps(text_data_json))
+        if size > DEFAULT_MAX_MESSAGE_SIZE:
+            log_signaling.sampled(logging.WARNING, 'message too large', size=size, max_size=DEFAULT_MAX_MESSAGE_SIZE)
+            await self._send_frame(codec.dumps({
+                "type": "error",
+                "message": f"Message too large (max {DEFAULT_MAX_MESSAGE_SIZE // 1024}KB)"
+            }))
+            return False
+        log_whiteboard.debug('inline images offloaded', room=self.room_name, images=images, size=size)
+        return True
+
+    @message_handler('turn-server-used', broadcast=False)
+    async def _handle_turn_server_used(self, text_data_json, spec):
+        # Логируем используемый TURN сервер (не пересылаем другим пользователям)
+        turn_server = text_data_json.get('turn_server', 'Unknown')
+        protocol = text_data_json.get('protocol', 'Unknown')
+        address = text_data_json.get('address', 'Unknown')
+        target_uid = text_data_json.get('to', 'Unknown')
+        sender_uid = text_data_json.get('from', 'Unknown')
+        log_turn.info('turn server used', user=sender_uid, server=turn_server, protocol=protocol,
+                      target=target_uid, address=address)
+        # Не пересылаем это сообщение другим пользователям - это только для логирования
+
+    @message_handler('turn-test-start', broadcast=False)
+    async def _handle_turn_test_start(self, text_data_json, spec):
+        # Логируем начало тестирования TURN серверов
+        sender_uid = text_data_json.get('from', 'Unknown')
+        servers_count = text_data_json.get('servers_count', 0)
+        servers = text_data_json.get('servers', [])
+        log_turn.info('turn test start', user=sender_uid, servers_count=servers_count)
+        if servers:
+            log_turn.debug('turn test servers', user=sender_uid, servers=','.join(servers))
+
+    @message_handler('turn-test-complete', broadcast=False)
+    async def _handle_turn_test_complete(self, text_data_json, spec):
+        # Логируем результаты тестирования TURN серверов
+        sender_uid = text_data_json.get('from', 'Unknown')
+        success = text_data_json.get('success', False)
+        working_servers = text_data_json.get('working_servers', 0)
+        total_servers = text_data_json.get('total_servers', 0)
+        duration_ms = text_data_json.get('duration_ms', 0)
+        selected_server = text_data_json.get('selected_server', 'Unknown')
+        selected_latency = text_data_json.get('selected_latency', 0)
+        from_cache = text_data_json.get('from_cache', False)
+        
+        # Одна запись с результатом вместо нескольких строк вывода
+        if from_cache:
+            log_turn.info('turn test cached', user=sender_uid, working=working_servers,
+                          total=total_servers, selected=selected_server)
+        elif success:
+            log_turn.info('turn test complete', user=sender_uid, working=working_servers, total=total_servers,
+                          selected=selected_server, latency_ms=selected_latency, duration_ms=duration_ms)
         else:
-            # Сохраняем состояние доски для whiteboard-object, whiteboard-draw и whiteboard-clear
-            if message_type in ['whiteboard-object', 'whiteboard-draw', 'whiteboard-clear']:
-                # КРИТИЧНО: Логируем тип объекта перед сохранением и отправкой
-                if message_type == 'whiteboard-object':
-                    event_data = text_data_json.get("data", {})
-                    event_type = event_data.get("eventType")
-                    obj_data = event_data.get("object", {})
-                    if event_type == 'object-added':
-                        obj_type = obj_data.get('type', 'unknown')
-                        obj_id = obj_data.get('id', 'no-id')
-                        has_src = 'src' in obj_data
-                        src_length = len(obj_data.get('src', '')) if has_src else 0
-                        src_preview = obj_data.get('src', '')[:100] if has_src else ''  # Первые 100 символов для отладки
-                        print(f"[Whiteboard] 📤 Forwarding object-added: type={obj_type}, id={obj_id}, has_src={has_src}, src_length={src_length}, src_preview={src_preview}")
-                    elif event_type in ['object-modified', 'object-moving', 'object-scaling']:
-                        obj_type = obj_data.get('type', 'unknown')
-                        obj_id = obj_data.get('id', 'no-id')
-                        has_src = 'src' in obj_data
-                        src_length = len(obj_data.get('src', '')) if has_src else 0
-                        src_preview = obj_data.get('src', '')[:100] if has_src else ''
-                        print(f"[Whiteboard] 📤 Forwarding {event_type}: type={obj_type}, id={obj_id}, has_src={has_src}, src_length={src_length}, src_preview={src_preview}")
-                
-                await self._save_whiteboard_state(text_data_json)
-            
-            # Используем внутренний метод для отправки (с батчингом для ice-candidate)
-            await self._send_message_internal(text_data_json)
+            log_turn.warning('turn test failed', user=sender_uid, total=total_servers, duration_ms=duration_ms)
+        
+        # Детальные результаты - только на уровне DEBUG
+        all_results = text_data_json.get('all_results', [])
+        if all_results and log_turn.isEnabledFor(logging.DEBUG):
+            for result in all_results:
+                latency = result.get('latency', 0)
+                log_turn.debug('turn test result', user=sender_uid, server=result.get('name'),
+                               success=bool(result.get('success')),
+                               latency='cached' if from_cache and latency == 0 else latency,
+                               reason=result.get('reason'))
+
+    @message_handler('screen-share-start')
+    async def _handle_screen_share_start(self, text_data_json, spec):
+        # Обработка запроса на начало демонстрации экрана
+        result = await ScreenSharingHandlers.handle_screen_share_start(self, text_data_json)
+        if result.get('type') == 'screen-share-started':
+            # Продлеваем lease, пока пользователь демонстрирует экран
+            self._start_screen_share_heartbeat(result['sharing_user'])
+            # Broadcast всем пользователям
+            await self._send_message_internal(result)
+            await self._broadcast_screen_share_invalidate()
+        elif result.get('type') == 'screen-share-error':
+            # Отправляем ошибку только запросившему пользователю
+            await self._send_message_internal(result)
+
+    @message_handler('screen-share-stop')
+    async def _handle_screen_share_stop(self, text_data_json, spec):
+        # Обработка запроса на остановку демонстрации экрана
+        result = await ScreenSharingHandlers.handle_screen_share_stop(self, text_data_json)
+        if result.get('type') == 'screen-share-stopped':
+            self._cancel_screen_share_heartbeat()
+            # Broadcast всем пользователям
+            await self._send_message_internal(result)
+            await self._broadcast_screen_share_invalidate()
+        elif result.get('type') == 'screen-share-error':
+            # Отправляем ошибку только запросившему пользователю
+            await self._send_message_internal(result)
+
+    @message_handler('screen-share-request-state', broadcast=False)
+    async def _handle_screen_share_request_state(self, text_data_json, spec):
+        # Обработка запроса на получение состояния демонстрации экрана
+        result = await ScreenSharingHandlers.handle_screen_share_request_state(self, text_data_json)
+        # Отправляем состояние только запросившему пользователю
+        await self._send_message_internal(result)
 
     # Receive message from room group
     async def webrtc_signal(self, event):
-        message = event["message"]
         sender_channel = event.get("sender_channel")
-        target_id = event.get("target_id")
 
         # Send message to WebSocket (excluding sender)
         if self.channel_name != sender_channel:
-            # If target_id is specified, include it in message for client-side filtering
-            if target_id:
-                message["_target"] = target_id
-            try:
-                await self.send(text_data=json.dumps(message))
-            except Exception as e:
-                # Игнорируем ошибки отправки - соединение может быть уже закрыто
-                # Это нормально при отключении пользователя
-                pass
+            self._deliver_to_client(self._get_event_text(event), self._get_event_type(event), sender_channel,
+                                    event.get("ts"), event.get("pub_ts"))
+    
+    # Receive batch of messages (ICE candidates) from room group or direct send
+    async def webrtc_signal_batch(self, event):
+        if self.channel_name == event.get("sender_channel"):
+            return
+        for item in event.get("messages", []):
+            # В объединенных батчах (курсоры, перемещения) отправитель указан в каждом элементе
+            sender_channel = item.get("sender_channel") or event.get("sender_channel")
+            if sender_channel == self.channel_name:
+                continue
+            self._deliver_to_client(self._get_event_text(item), self._get_event_type(item), sender_channel,
+                                    item.get("ts"), event.get("pub_ts"))
+    
+    def _start_presence_heartbeat(self):
+        """Запустить heartbeat присутствия (один на соединение)"""
+        if self.presence_task is None or self.presence_task.done():
+            self.presence_task = asyncio.create_task(self._presence_heartbeat())
+    
+    def _cancel_presence_heartbeat(self):
+        """Остановить heartbeat присутствия"""
+        if self.presence_task is not None and not self.presence_task.done():
+            self.presence_task.cancel()
+        self.presence_task = None
+    
+    async def _presence_heartbeat(self):
+        """
+        Heartbeat: обновляет last-seen пользователя, продлевает членство в группе
+        channel layer (иначе через group_expiry соединение молча выпадает из группы)
+        и удаляет участников, переставших присылать heartbeat.
+        """
+        try:
+            while True:
+                await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+                if not self.user_uid:
+                    continue
+                try:
+                    await PresenceRegistry.touch(self.room_name, self.user_uid)
+                    await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+                    for expired_uid in await PresenceRegistry.sweep(self.room_name):
+                        await self._handle_expired_member(expired_uid)
+                except Exception as e:
+                    log_presence.warning('heartbeat failed', user=self.user_uid, error=e)
+        except asyncio.CancelledError:
+            pass
+    
+    async def _handle_expired_member(self, expired_uid):
+        """Участник пропал без disconnect (например, упал воркер) - освобождаем место и сообщаем комнате"""
+        log_presence.info('member expired', user=expired_uid, room=self.room_name)
+        await RoomOccupancy.leave(self.room_group_name, expired_uid)
+        event = self._build_signal_event({
+            "type": "user-left",
+            "uid": expired_uid,
+            "room": self.room_name,
+            "reason": "presence_expired"
+        })
+        # Системное событие: доставляем всем, включая это соединение
+        event["sender_channel"] = None
+        await self.channel_layer.group_send(self.room_group_name, event)
+    
+    # Сброс локального кэша состояния демонстрации экрана (старт/остановка в любом воркере)
+    async def screen_share_invalidate(self, event):
+        ScreenSharingService.invalidate_cache(event["room"])
+    
+    async def _broadcast_screen_share_invalidate(self):
+        """Сообщить всем воркерам комнаты, что состояние демонстрации экрана изменилось"""
+        try:
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {"type": "screen_share_invalidate", "room": self.room_name}
+            )
+        except Exception as e:
+            log_screen_sharing.warning('cache invalidation broadcast failed', error=e)
+    
+    def _start_screen_share_heartbeat(self, sharing_uid):
+        """Запустить периодическое продление lease демонстрации экрана"""
+        self._cancel_screen_share_heartbeat()
+        self.screen_share_heartbeat_task = asyncio.create_task(self._screen_share_heartbeat(sharing_uid))
+    
+    def _cancel_screen_share_heartbeat(self):
+        """Остановить продление lease"""
+        if self.screen_share_heartbeat_task is not None and not self.screen_share_heartbeat_task.done():
+            self.screen_share_heartbeat_task.cancel()
+        self.screen_share_heartbeat_task = None
+    
+    async def _screen_share_heartbeat(self, sharing_uid):
+        """Heartbeat: продлевает lease, пока он принадлежит этому пользователю"""
+        try:
+            while True:
+                await asyncio.sleep(SCREEN_SHARING_HEARTBEAT_INTERVAL)
+                if not await ScreenSharingService.renew_sharing(self.room_name, sharing_uid):
+                    log_screen_sharing.info('lease lost', user=sharing_uid, room=self.room_name)
+                    return
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            log_screen_sharing.warning('lease renew failed', user=sharing_uid, error=e)
+    
+    def _get_event_text(self, event):
+        """Готовый текст кадра из события (события без text - от старых воркеров при обновлении)"""
+        text = event.get("text")
+        if text is None:
+            text = self._encode_signal(event["message"], event.get("target_id"))
+        return text
+    
+    def _get_event_type(self, event):
+        """Тип сообщения события (для выбора полосы исходящей очереди)"""
+        message_type = event.get("msg_type")
+        if message_type is None and isinstance(event.get("message"), dict):
+            message_type = event["message"].get("type")
+        return message_type
+    
+    def _deliver_to_client(self, text, message_type=None, sender=None, received_at=None, published_at=None):
+        """Поставить готовый кадр в исходящую очередь клиента (без повторной сериализации)"""
+        metrics.messages_total.inc(message_type or 'unknown', 'out')
+        metrics.frame_bytes.observe(len(text), 'out')
+        if received_at is not None:
+            # Последняя отметка трассировки - перед отправкой клиенту
+            delivered_at = time.time()
+            signal_trace.record(message_type, received_at, published_at, delivered_at)
+            if self.trace_frames:
+                text = signal_trace.attach(text, received_at, published_at, delivered_at)
+        self.outbound.put(text, get_lane(message_type), sender)
+    
+    async def _send_frame(self, text):
+        """Отправка кадра в WebSocket (вызывается писателем исходящей очереди)"""
+        if self.binary_protocol:
+            await self.send(bytes_data=binary_protocol.text_to_frame(text))
+        else:
+            await self.send(text_data=text)
+    
+    def _on_outbound_overflow(self):
+        """Клиент безнадежно отстал - закрываем соединение, клиент переподключится и получит состояние"""
+        log_signaling.warning('outbound queue overflow, closing', user=self.user_uid, room=getattr(self, 'room_name', None))
+        asyncio.create_task(self.close(code=OUTBOUND_QUEUE_CLOSE_CODE))
     
     async def _save_whiteboard_state(self, message_data):
         """Сохранить состояние доски в Redis"""
         try:
-            r = get_redis_client()
-            if not r:
-                return
-            
-            room_key = f"whiteboard_state:{self.room_name}"
             message_type = message_data.get("type")
             
             if message_type == 'whiteboard-clear':
                 # Очищаем состояние доски
-                r.delete(room_key)
-                r.delete(f"{room_key}:objects")
-                r.delete(f"{room_key}:paths")
-                print(f"[Whiteboard] Cleared state for room {self.room_name}")
+                await WhiteboardStore.clear(self.room_name)
+                log_whiteboard.info('state cleared', room=self.room_name)
             elif message_type == 'whiteboard-draw':
                 # Сохраняем путь рисования
                 draw_data = message_data.get("data", {})
-                path_json = json.dumps(draw_data)
-                r.lpush(f"{room_key}:paths", path_json)
-                r.expire(f"{room_key}:paths", 86400)
-                print(f"[Whiteboard] Saved path to state for room {self.room_name}")
+                path = draw_data.get('path')
+                # id штриха - в объекте fabric.js (по нему же приходит object-removed при стирании)
+                path_id = (path.get('id') if isinstance(path, dict) else None) or draw_data.get('id')
+                tolerance = await stroke_simplify.get_room_tolerance(self.room_name)
+                if stroke_simplify.stroke_points(draw_data) > stroke_simplify.STROKE_SIMPLIFY_INLINE_POINTS:
+                    loop = asyncio.get_event_loop()
+                    draw_data = await loop.run_in_executor(None, stroke_simplify.simplify_draw, draw_data, tolerance)
+                else:
+                    draw_data = stroke_simplify.simplify_draw(draw_data, tolerance)
+                await WhiteboardStore.add_path(self.room_name, path_id, codec.dumps(draw_data))
+                log_whiteboard.debug('path saved', room=self.room_name)
             elif message_type == 'whiteboard-object':
                 # Сохраняем объект доски
                 event_data = message_data.get("data", {})
@@ -732,13 +1073,10 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                 obj_data = event_data.get("object", {})
                 
                 if event_type == 'object-added':
-                    # КРИТИЧНО: Логируем тип объекта перед сохранением
                     obj_type = obj_data.get('type', 'unknown')
                     obj_id = obj_data.get('id', 'no-id')
-                    has_src = 'src' in obj_data
-                    src_length = len(obj_data.get('src', '')) if has_src else 0
-                    src_preview = obj_data.get('src', '')[:100] if has_src else ''  # Первые 100 символов для отладки
-                    print(f"[Whiteboard] 📥 Received object-added: type={obj_type}, id={obj_id}, has_src={has_src}, src_length={src_length}, src_preview={src_preview}")
+                    log_whiteboard.debug('received object-added', obj_type=obj_type, obj_id=obj_id,
+                                         src_length=len(obj_data.get('src') or ''))
                     
                     # КРИТИЧНО: Если объект - Group с изображением, извлекаем изображение
                     if obj_type.lower() == 'group' and 'objects' in obj_data:
@@ -754,7 +1092,7 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                                 break
                         
                         if image_in_group:
-                            print(f"[Whiteboard] ⚠️ Found image in Group, extracting image object")
+                            log_whiteboard.debug('image found in group', obj_id=obj_id)
                             # Извлекаем изображение из Group
                             image_data = {
                                 **image_in_group,
@@ -773,7 +1111,7 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                                 image_data['src'] = image_in_group.get('_imageUrl') or image_in_group.get('_src') or image_in_group.get('src')
                             obj_data = image_data
                             obj_type = 'image'
-                            print(f"[Whiteboard] ✅ Extracted image from Group, type: {obj_type}, has src: {'src' in obj_data}")
+                            log_whiteboard.debug('image extracted from group', obj_id=obj_id, has_src='src' in obj_data)
                     
                     # КРИТИЧНО: Если объект - изображение (даже если тип не указан явно), убеждаемся, что src сохранен
                     # Проверяем наличие src с URL для определения изображения
@@ -782,159 +1120,102 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                         if obj_type.lower() != 'image':
                             obj_data['type'] = 'image'
                             obj_type = 'image'
-                            print(f"[Whiteboard] ✅ Detected image by src URL, setting type to image")
+                            log_whiteboard.debug('image detected by src url', obj_id=obj_id)
                     
-                    # Добавляем объект в список
-                    obj_json = json.dumps(obj_data)
-                    r.lpush(f"{room_key}:objects", obj_json)
-                    # Устанавливаем TTL на 24 часа
-                    r.expire(f"{room_key}:objects", 86400)
-                    print(f"[Whiteboard] Saved object to state for room {self.room_name}, type: {obj_type}")
+                    # Добавляем объект поверх остальных
+                    await WhiteboardStore.add_object(self.room_name, obj_data.get('id'), codec.dumps(obj_data))
+                    log_whiteboard.debug('object saved', room=self.room_name, obj_type=obj_type, obj_id=obj_id)
                 elif event_type == 'object-removed':
-                    # Удаляем объект из списка по ID
+                    # Удаляем объект по ID
                     obj_id = obj_data.get("id")
                     if obj_id:
-                        # Получаем все объекты, фильтруем и сохраняем обратно
-                        objects = r.lrange(f"{room_key}:objects", 0, -1)
-                        filtered_objects = [obj for obj in objects if json.loads(obj).get("id") != obj_id]
-                        r.delete(f"{room_key}:objects")
-                        if filtered_objects:
-                            for obj in filtered_objects:
-                                r.lpush(f"{room_key}:objects", obj)
-                            r.expire(f"{room_key}:objects", 86400)
-                        print(f"[Whiteboard] Removed object {obj_id} from state for room {self.room_name}")
-                elif event_type in ['object-modified', 'object-moving', 'object-scaling']:
-                    # КРИТИЧНО: Логируем получение события модификации
-                    obj_type = obj_data.get('type', 'unknown')
-                    obj_id = obj_data.get('id', 'no-id')
-                    has_src = 'src' in obj_data
-                    src_length = len(obj_data.get('src', '')) if has_src else 0
-                    src_preview = obj_data.get('src', '')[:100] if has_src else ''
-                    print(f"[Whiteboard] 📥 Received {event_type}: type={obj_type}, id={obj_id}, has_src={has_src}, src_length={src_length}, src_preview={src_preview}")
+                        await WhiteboardStore.remove_object(self.room_name, obj_id)
+                        log_whiteboard.debug('object removed', room=self.room_name, obj_id=obj_id)
+                elif event_type == 'object-modified':
+                    # object-moving/object-scaling не сохраняются - их объединяет EventCoalescer
+                    log_whiteboard.sampled(logging.DEBUG, 'received object-modified',
+                                           obj_type=obj_data.get('type', 'unknown'), obj_id=obj_data.get('id', 'no-id'))
                     
-                    # Обновляем объект в списке
+                    # Обновляем объект на его месте в порядке
                     obj_id = obj_data.get("id")
                     if obj_id:
-                        objects = r.lrange(f"{room_key}:objects", 0, -1)
-                        updated_objects = []
-                        found = False
-                        for obj_str in objects:
-                            obj = json.loads(obj_str)
-                            if obj.get("id") == obj_id:
-                                updated_objects.append(json.dumps(obj_data))
-                                found = True
-                            else:
-                                updated_objects.append(obj_str)
-                        if found:
-                            r.delete(f"{room_key}:objects")
-                            for obj in updated_objects:
-                                r.lpush(f"{room_key}:objects", obj)
-                            r.expire(f"{room_key}:objects", 86400)
-                            print(f"[Whiteboard] Updated object {obj_id} in state for room {self.room_name}")
-                        else:
-                            print(f"[Whiteboard] ⚠️ Object {obj_id} not found in state for {event_type}, cannot update")
+                        await WhiteboardStore.modify_object(self.room_name, obj_id, codec.dumps(obj_data))
+                        log_whiteboard.debug('object updated', room=self.room_name, obj_id=obj_id)
         except Exception as e:
-            print(f"[Whiteboard] Error saving state: {e}")
+            log_whiteboard.error('state save failed', room=self.room_name, error=e)
     
+    def _start_whiteboard_restore(self, user_id):
+        """Запустить отправку состояния доски (повторный join начинает ее заново)"""
+        self._cancel_whiteboard_restore()
+        self.whiteboard_restore_task = asyncio.create_task(self._send_whiteboard_state(user_id))
+
+    def _cancel_whiteboard_restore(self):
+        """Остановить отправку состояния доски (при отключении)"""
+        if self.whiteboard_restore_task is not None and not self.whiteboard_restore_task.done():
+            self.whiteboard_restore_task.cancel()
+        self.whiteboard_restore_task = None
+
     async def _send_whiteboard_state(self, user_id):
-        """Отправить состояние доски новому пользователю"""
+        """
+        Отправить состояние доски новому пользователю: снимок, затем хвост операций,
+        пакетами whiteboard-state-chunk. Следующий пакет ставится в очередь, только когда
+        клиент принял предыдущие (в исходящей очереди не больше WHITEBOARD_STATE_MAX_BUFFERED).
+        """
         try:
-            r = get_redis_client()
-            if not r:
-                return
-            
-            room_key = f"whiteboard_state:{self.room_name}"
-            objects = r.lrange(f"{room_key}:objects", 0, -1)
-            paths = r.lrange(f"{room_key}:paths", 0, -1)
+            state = await WhiteboardStore.load(self.room_name)
             
-            if not objects and not paths:
-                print(f"[Whiteboard] No state to send for room {self.room_name}")
+            if not state.items and not state.tail:
+                log_whiteboard.debug('no state to send', room=self.room_name)
                 return
             
-            print(f"[Whiteboard] Sending {len(objects)} objects and {len(paths)} paths to new user {user_id} in room {self.room_name}")
+            log_whiteboard.info('sending state', user=user_id, room=self.room_name, items=len(state.items),
+                                tail=len(state.tail), version=state.version)
             
-            # Сначала отправляем пути рисования (они должны быть нарисованы первыми)
-            for path_str in reversed(paths):  # reversed чтобы восстановить порядок рисования
-                try:
-                    path_data = json.loads(path_str)
-                    path_id = path_data.get('id', 'no-id')
-                    event_type = path_data.get('eventType', 'unknown')
-                    has_path = 'path' in path_data
-                    path_length = len(path_data.get('path', [])) if has_path else 0
-                    print(f"[Whiteboard] 📤 Sending path to {user_id}: id={path_id}, eventType={event_type}, has_path={has_path}, path_length={path_length}")
-                    message = {
-                        "type": "whiteboard-draw",
-                        "room": self.room_name,
-                        "from": "system",
-                        "data": path_data
-                    }
-                    await self.send(text_data=json.dumps(message))
-                    await asyncio.sleep(0.01)
-                except Exception as e:
-                    print(f"[Whiteboard] Error sending path to {user_id}: {e}")
-            
-            # Затем отправляем объекты
-            for obj_str in reversed(objects):  # reversed чтобы восстановить порядок добавления
-                try:
-                    obj_data = json.loads(obj_str)
-                    obj_type = obj_data.get('type', 'unknown')
-                    obj_id = obj_data.get('id', 'no-id')
-                    has_src = 'src' in obj_data
-                    src_length = len(obj_data.get('src', '')) if has_src else 0
-                    src_preview = obj_data.get('src', '')[:100] if has_src else ''
-                    print(f"[Whiteboard] 📤 Sending state object to {user_id}: type={obj_type}, id={obj_id}, has_src={has_src}, src_length={src_length}, src_preview={src_preview}")
-                    message = {
-                        "type": "whiteboard-object",
-                        "room": self.room_name,
-                        "from": "system",
-                        "data": {
-                            "eventType": "object-added",
-                            "object": obj_data
-                        }
-                    }
-                    await self.send(text_data=json.dumps(message))
-                    # Небольшая задержка между отправками для предотвращения перегрузки
-                    await asyncio.sleep(0.01)
-                except Exception as e:
-                    print(f"[Whiteboard] Error sending object to {user_id}: {e}")
+            entries = state.items + state.tail
+            texts = (state_item_text(self.room_name, kind, item_id, data_json) for kind, item_id, data_json in entries)
+            chunks = 0
+            for chunk_text in iter_state_chunks(self.room_name, texts, state.version):
+                if not await self.outbound.wait_writable(WHITEBOARD_STATE_MAX_BUFFERED):
+                    log_whiteboard.debug('state send aborted, connection closed', user=user_id)
+                    return
+                self._deliver_to_client(chunk_text, "whiteboard-state-chunk")
+                chunks += 1
             
             # КРИТИЧНО: Отправляем финальное сообщение о завершении восстановления состояния
             # Это позволяет клиенту знать, что все пути и объекты отправлены
-            await asyncio.sleep(0.1)  # Небольшая задержка перед финальным сообщением
-            try:
-                final_message = {
-                    "type": "whiteboard-state-restored",
-                    "room": self.room_name,
-                    "from": "system",
-                    "data": {
-                        "objects_count": len(objects),
-                        "paths_count": len(paths)
-                    }
+            final_message = {
+                "type": "whiteboard-state-restored",
+                "room": self.room_name,
+                "from": "system",
+                "data": {
+                    "objects_count": sum(1 for kind, _, _ in entries if kind == OP_ADD),
+                    "paths_count": sum(1 for kind, _, _ in entries if kind == OP_PATH),
+                    "chunks": chunks,
+                    "version": state.version
                 }
-                await self.send(text_data=json.dumps(final_message))
-                print(f"[Whiteboard] ✅ State restoration complete for {user_id}: {len(objects)} objects, {len(paths)} paths")
-            except Exception as e:
-                print(f"[Whiteboard] Error sending final state message to {user_id}: {e}")
+            }
+            self._deliver_to_client(codec.dumps(final_message), "whiteboard-state-restored")
+            log_whiteboard.debug('state sent', user=user_id, items=len(entries), chunks=chunks)
+        except asyncio.CancelledError:
+            log_whiteboard.debug('state send cancelled', user=user_id)
         except Exception as e:
-            print(f"[Whiteboard] Error sending state to {user_id}: {e}")
+            log_whiteboard.error('state send failed', user=user_id, error=e)
     
     async def _clear_whiteboard_state(self):
         """Очистить состояние доски когда комната становится пустой"""
         try:
-            r = get_redis_client()
-            if not r:
-                return
-            
-            room_key = f"whiteboard_state:{self.room_name}"
-            r.delete(room_key)
-            r.delete(f"{room_key}:objects")
-            r.delete(f"{room_key}:paths")
-            print(f"[Whiteboard] Cleared state for empty room {self.room_name}")
+            await WhiteboardStore.clear(self.room_name)
+            log_whiteboard.info('state cleared for empty room', room=self.room_name)
+            stroke_simplify.forget_room(self.room_name)
             
-            # Очищаем изображения комнаты
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, cleanup_room_images, self.room_name)
-            print(f"[Whiteboard] Cleared images for empty room {self.room_name}")
+            # Освобождаем изображения комнаты (файлы, нужные другим комнатам, остаются)
+            await database_sync_to_async(cleanup_room_images, thread_sensitive=False)(self.room_name)
+            log_whiteboard.info('images cleared for empty room', room=self.room_name)
         except Exception as e:
-            print(f"[Whiteboard] Error clearing state: {e}")
+            log_whiteboard.error('state clear failed', room=self.room_name, error=e)
+
 
+# Каждый валидный тип сообщения должен иметь обработчик в таблице
+assert set(MESSAGE_HANDLERS) == VALID_MESSAGE_TYPES, (
+    f"Message types without handlers: {VALID_MESSAGE_TYPES - set(MESSAGE_HANDLERS)}"
+)
@@ -0,0 +1,160 @@
+# base/event_coalescer.py
+"""
+Объединение частых событий доски на стороне сервера.
+whiteboard-cursor и object-moving/object-scaling приходят десятками в секунду на
+каждого участника. Вместо group_send на каждое событие комната накапливает только
+последнее состояние для (отправитель, объект) и раз в COALESCE_INTERVAL рассылает
+все накопленное одним webrtc_signal_batch. Промежуточные состояния не сохраняются -
+в состояние доски пишется только итоговый object-modified.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Интервал рассылки накопленных событий (~30 кадров в секунду)
+COALESCE_INTERVAL = 0.033  # секунды
+
+# События перемещения/масштабирования объектов, которые можно объединять
+COALESCED_OBJECT_EVENTS = ('object-moving', 'object-scaling')
+
+# Счетчики: получено событий, объединено (не разослано), разослано, отброшено
+coalesce_stats: Dict[str, int] = {'received': 0, 'collapsed': 0, 'flushed': 0, 'discarded': 0}
+
+
+def get_coalesce_key(message_data: Dict[str, Any]) -> Optional[Hashable]:
+    """
+    Ключ объединения сообщения (без отправителя) или None, если сообщение
+    нужно отправить сразу.
+    """
+    message_type = message_data.get('type')
+    if message_type == 'whiteboard-cursor':
+        return 'cursor'
+    if message_type == 'whiteboard-object':
+        event_data = message_data.get('data') or {}
+        if event_data.get('eventType') in COALESCED_OBJECT_EVENTS:
+            obj_id = (event_data.get('object') or {}).get('id')
+            if obj_id:
+                return ('object', obj_id)
+    return None
+
+
+class RoomCoalescer:
+    """Накопитель событий одной комнаты"""
+
+    def __init__(self, room_group_name: str, channel_layer):
+        self.room_group_name = room_group_name
+        self.channel_layer = channel_layer
+        # {(sender_uid, key): item}, item - элемент webrtc_signal_batch
+        self.pending: Dict[Hashable, Dict[str, Any]] = OrderedDict()
+        self.flush_task = None
+
+    def add(self, sender_uid: str, key: Hashable, item: Dict[str, Any]):
+        coalesce_stats['received'] += 1
+        pending_key = (sender_uid, key)
+        if pending_key in self.pending:
+            # Предыдущее состояние еще не разослано - заменяем его (порядок ключей сохраняется)
+            coalesce_stats['collapsed'] += 1
+        self.pending[pending_key] = item
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_after())
+
+    def discard(self, sender_uid: Optional[str] = None, key: Optional[Hashable] = None) -> int:
+        """Отбросить накопленные события (фильтр по отправителю и/или ключу, без фильтра - все)"""
+        stale = [
+            pending_key for pending_key in self.pending
+            if (sender_uid is None or pending_key[0] == sender_uid) and (key is None or pending_key[1] == key)
+        ]
+        for pending_key in stale:
+            del self.pending[pending_key]
+        coalesce_stats['discarded'] += len(stale)
+        return len(stale)
+
+    async def _flush_after(self):
+        try:
+            await asyncio.sleep(COALESCE_INTERVAL)
+            await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """Разослать накопленные события одним батчем"""
+        items = list(self.pending.values())
+        self.pending.clear()
+        self.flush_task = None
+        if room_coalescers.get(self.room_group_name) is self:
+            # Пустой накопитель не храним - следующее событие создаст новый
+            del room_coalescers[self.room_group_name]
+        if not items:
+            return
+        coalesce_stats['flushed'] += len(items)
+        try:
+            await self.channel_layer.group_send(self.room_group_name, {
+                "type": "webrtc_signal_batch",
+                "messages": items,
+                # Отправитель указан в каждом элементе
+                "sender_channel": None,
+            })
+        except Exception as e:
+            logger.warning(f'[Coalescer] Error sending {len(items)} coalesced events: {e}')
+
+    def cancel(self):
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+        self.flush_task = None
+        self.pending.clear()
+
+
+# Накопители по комнатам (в рамках процесса)
+# Формат: {room_group_name: RoomCoalescer}
+room_coalescers: Dict[str, RoomCoalescer] = {}
+
+
+class EventCoalescer:
+    """Объединение частых событий доски по комнатам"""
+
+    @staticmethod
+    def add(channel_layer, room_group_name: str, sender_uid: str, key: Hashable, item: Dict[str, Any]):
+        """
+        Добавить событие в накопитель комнаты.
+
+        Args:
+            channel_layer: Channel layer для рассылки
+            room_group_name: Имя группы комнаты
+            sender_uid: UID отправителя
+            key: Ключ объединения (см. get_coalesce_key)
+            item: Элемент батча {'text', 'msg_type', 'sender_channel'}
+        """
+        coalescer = room_coalescers.get(room_group_name)
+        if coalescer is None:
+            coalescer = room_coalescers[room_group_name] = RoomCoalescer(room_group_name, channel_layer)
+        coalescer.add(sender_uid, key, item)
+
+    @staticmethod
+    def discard(room_group_name: str, sender_uid: Optional[str] = None, key: Optional[Hashable] = None) -> int:
+        """
+        Отбросить накопленные события, которые устарели (например, пришел object-modified
+        или object-removed для того же объекта - промежуточное состояние не должно его обогнать).
+
+        Returns:
+            Количество отброшенных событий
+        """
+        coalescer = room_coalescers.get(room_group_name)
+        if coalescer is None:
+            return 0
+        return coalescer.discard(sender_uid, key)
+
+    @staticmethod
+    def cleanup_room(room_group_name: str):
+        """Удалить накопитель комнаты (комната опустела)"""
+        coalescer = room_coalescers.pop(room_group_name, None)
+        if coalescer is not None:
+            coalescer.cancel()
+
+    @staticmethod
+    def get_stats() -> Dict[str, int]:
+        """Счетчики объединения событий"""
+        return dict(coalesce_stats, rooms=len(room_coalescers))
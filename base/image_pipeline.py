@@ -0,0 +1,242 @@
+# base/image_pipeline.py
+"""
+Обработка изображений доски: проверка, удаление метаданных, уменьшение,
+WebP + миниатюра.
+
+Декодирование выполняется в ProcessPoolExecutor (IMAGE_PIPELINE_WORKERS процессов),
+чтобы большие изображения не занимали GIL процесса Daphne. Очередь ограничена:
+если в обработке уже IMAGE_PIPELINE_MAX_PENDING изображений, новое сразу
+отклоняется (ImagePipelineBusy), а не ждет неограниченно. Изображение занимает
+место в очереди, пока задача не завершится в пуле, в том числе после таймаута ожидания.
+
+Результат - два файла в каталоге комнаты:
+- <name>.webp - не больше IMAGE_MAX_DIMENSION по большей стороне;
+- <name>.thumb.webp - не больше IMAGE_THUMBNAIL_DIMENSION.
+Участники сначала загружают миниатюру (src объекта), полный вариант (fullSrc) -
+в фоне. Анимированные изображения сохраняются как есть (без перекодирования),
+миниатюра - по первому кадру.
+
+Метаданные (EXIF, XMP, комментарии) не переносятся; ориентация из EXIF
+применяется к пикселям, ICC профиль сохраняется (цвет).
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, NamedTuple, Optional
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Процессов обработки и максимум изображений в обработке/очереди
+IMAGE_PIPELINE_WORKERS = int(os.environ.get('IMAGE_PIPELINE_WORKERS', '2'))
+IMAGE_PIPELINE_MAX_PENDING = int(os.environ.get('IMAGE_PIPELINE_MAX_PENDING', '8'))
+# Максимальное время обработки одного изображения (секунды)
+IMAGE_PIPELINE_TIMEOUT = float(os.environ.get('IMAGE_PIPELINE_TIMEOUT', '30'))
+
+# Размеры вариантов (пиксели по большей стороне) и качество WebP
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '2048'))
+IMAGE_THUMBNAIL_DIMENSION = int(os.environ.get('IMAGE_THUMBNAIL_DIMENSION', '320'))
+IMAGE_WEBP_QUALITY = 82
+IMAGE_THUMBNAIL_QUALITY = 70
+# Изображения больше не декодируются (защита от "декомпрессионных бомб")
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(50 * 1000 * 1000)))
+
+ALLOWED_FORMATS = {'PNG', 'JPEG', 'GIF', 'WEBP'}
+_ANIMATED_EXTENSIONS = {'GIF': '.gif', 'WEBP': '.webp', 'PNG': '.png'}
+
+
+class ImageRejected(ValueError):
+    """Файл не является поддерживаемым изображением"""
+
+
+class ImagePipelineBusy(RuntimeError):
+    """В обработке уже IMAGE_PIPELINE_MAX_PENDING изображений"""
+
+
+class ImageVariants(NamedTuple):
+    """Имена файлов вариантов в каталоге комнаты и размеры полного варианта"""
+    full: str
+    thumbnail: str
+    width: int
+    height: int
+    bytes_in: int
+    bytes_out: int
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(IMAGE_PIPELINE_MAX_PENDING)
+
+_stats = {
+    'processed': 0,
+    'rejected': 0,
+    'busy': 0,
+    'failed': 0,
+    'bytes_in': 0,
+    'bytes_out': 0,
+}
+
+
+def _flatten_mode(image):
+    """RGB или RGBA (с прозрачностью) для кодирования в WebP"""
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    target = 'RGBA' if has_alpha else 'RGB'
+    return image if image.mode == target else image.convert(target)
+
+
+def _save_atomic(directory: str, filename: str, data: bytes):
+    """Записать файл под временным именем и переименовать (читатели не видят частичный файл)"""
+    temp_path = os.path.join(directory, f".{filename}.tmp")
+    with open(temp_path, 'wb') as destination:
+        destination.write(data)
+    os.replace(temp_path, os.path.join(directory, filename))
+
+
+def _encode_webp(image, quality: int, icc_profile: Optional[bytes]) -> bytes:
+    buffer = io.BytesIO()
+    options = {'quality': quality, 'method': 4}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    image.save(buffer, 'WEBP', **options)
+    return buffer.getvalue()
+
+
+def process_image(data: bytes, directory: str, name: str) -> Dict:
+    """
+    Обработать изображение (выполняется в процессе пула).
+    Возвращает словарь полей ImageVariants; бросает ImageRejected.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception as e:
+        raise ImageRejected(f"not an image: {e}") from e
+    if image.format not in ALLOWED_FORMATS:
+        raise ImageRejected(f"unsupported format: {image.format}")
+    width, height = image.size
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageRejected(f"image too large: {width}x{height}")
+    try:
+        image.load()
+    except Exception as e:
+        raise ImageRejected(f"corrupted image: {e}") from e
+
+    icc_profile = image.info.get('icc_profile')
+    os.makedirs(directory, exist_ok=True)
+
+    if getattr(image, 'is_animated', False):
+        # Анимацию не перекодируем: метаданных в GIF/WebP анимации практически нет
+        full_name = f"{name}{_ANIMATED_EXTENSIONS[image.format]}"
+        full_data = data
+        image.seek(0)
+        preview = _flatten_mode(image.copy())
+    else:
+        preview = _flatten_mode(ImageOps.exif_transpose(image))
+        preview.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+        full_name = f"{name}.webp"
+        full_data = _encode_webp(preview, IMAGE_WEBP_QUALITY, icc_profile)
+    full_width, full_height = preview.size
+
+    preview.thumbnail((IMAGE_THUMBNAIL_DIMENSION, IMAGE_THUMBNAIL_DIMENSION), Image.LANCZOS)
+    thumbnail_name = f"{name}.thumb.webp"
+    thumbnail_data = _encode_webp(preview, IMAGE_THUMBNAIL_QUALITY, icc_profile)
+
+    _save_atomic(directory, full_name, full_data)
+    _save_atomic(directory, thumbnail_name, thumbnail_data)
+    return {
+        'full': full_name,
+        'thumbnail': thumbnail_name,
+        'width': full_width,
+        'height': full_height,
+        'bytes_in': len(data),
+        'bytes_out': len(full_data) + len(thumbnail_data),
+    }
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Пул процессов (создается при первом изображении; spawn - без копии потоков Daphne)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_PIPELINE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"[ImagePipeline] Started {IMAGE_PIPELINE_WORKERS} worker processes")
+        return _pool
+
+
+def _submit(data: bytes, directory: str, name: Optional[str]) -> Future:
+    """
+    Поставить изображение в пул, заняв слот очереди. Слот освобождается, когда задача
+    завершилась в процессе пула: задачу, которая уже выполняется, таймаут ожидания
+    не останавливает, и она продолжает занимать место в очереди.
+    """
+    if not _slots.acquire(blocking=False):
+        _stats['busy'] += 1
+        raise ImagePipelineBusy("image pipeline is busy")
+    try:
+        future = _get_pool().submit(process_image, data, str(directory), name or str(uuid.uuid4()))
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _record(variants: Dict) -> ImageVariants:
+    _stats['processed'] += 1
+    _stats['bytes_in'] += variants['bytes_in']
+    _stats['bytes_out'] += variants['bytes_out']
+    return ImageVariants(**variants)
+
+
+def _record_error(error: Exception):
+    global _pool
+    if isinstance(error, ImageRejected):
+        _stats['rejected'] += 1
+        return
+    _stats['failed'] += 1
+    logger.error(f"[ImagePipeline] Processing failed: {error}")
+    if isinstance(error, BrokenProcessPool):
+        # Процесс пула завершился аварийно (например, OOM) - следующее изображение создаст новый пул
+        with _pool_lock:
+            _pool = None
+
+
+def optimize(data: bytes, directory: str, name: Optional[str] = None) -> ImageVariants:
+    """
+    Обработать изображение в пуле процессов, ожидая результат (для потоков и sync views).
+    name - имя файлов вариантов без расширения (по умолчанию uuid4).
+    """
+    future = _submit(data, directory, name)
+    try:
+        return _record(future.result(timeout=IMAGE_PIPELINE_TIMEOUT))
+    except FutureTimeoutError as e:
+        future.cancel()
+        _record_error(e)
+        raise
+    except Exception as e:
+        _record_error(e)
+        raise
+
+
+async def optimize_async(data: bytes, directory: str, name: Optional[str] = None) -> ImageVariants:
+    """Обработать изображение в пуле процессов, не блокируя event loop"""
+    future = _submit(data, directory, name)
+    try:
+        variants = await asyncio.wait_for(asyncio.wrap_future(future), IMAGE_PIPELINE_TIMEOUT)
+        return _record(variants)
+    except Exception as e:
+        _record_error(e)
+        raise
+
+
+def get_stats() -> Dict[str, int]:
+    """Статистика обработки изображений на этом воркере"""
+    return dict(_stats)
@@ -0,0 +1,106 @@
+# base/message_dispatch.py
+"""
+Таблица обработчиков входящих WebSocket сообщений.
+Каждый тип сообщения регистрируется декоратором @message_handler с объявленными
+свойствами (broadcast/адресное, сохраняется ли состояние, батчится ли, лимит размера).
+Диспетчеризация - один поиск в словаре, количество вызовов и время выполнения
+каждого обработчика записываются автоматически.
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Optional, Union
+from collections import defaultdict
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Лимит размера сообщения по умолчанию
+DEFAULT_MAX_MESSAGE_SIZE = 100 * 1024  # 100KB
+
+
+class MessageHandlerSpec(NamedTuple):
+    """Описание обработчика типа сообщения"""
+    message_type: str
+    handler: Callable  # async def handler(consumer, data, spec)
+    broadcast: bool  # True - рассылка всей комнате, False - адресное сообщение (поле 'to')
+    persisted: bool  # Сохраняется в состояние доски
+    batched: bool  # Отправляется батчами (ICE кандидаты)
+    critical: bool  # Ошибки отправки не игнорируются (offer/answer)
+    max_size: Union[int, Callable[[Dict[str, Any]], int]]  # Лимит размера или функция от сообщения
+
+    def get_max_size(self, data: Dict[str, Any]) -> int:
+        if callable(self.max_size):
+            return self.max_size(data)
+        return self.max_size
+
+
+# Реестр обработчиков: {message_type: MessageHandlerSpec}
+MESSAGE_HANDLERS: Dict[str, MessageHandlerSpec] = {}
+
+# Статистика обработчиков: {message_type: {'calls', 'errors', 'total_time', 'max_time'}}
+handler_stats: Dict[str, Dict[str, float]] = defaultdict(
+    lambda: {'calls': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0}
+)
+
+
+def message_handler(*message_types: str, broadcast: bool = True, persisted: bool = False,
+                    batched: bool = False, critical: bool = False,
+                    max_size: Union[int, Callable[[Dict[str, Any]], int]] = DEFAULT_MAX_MESSAGE_SIZE):
+    """
+    Декоратор: зарегистрировать метод consumer'а как обработчик типов сообщений.
+
+    Args:
+        message_types: Типы сообщений
+        broadcast: Рассылка всей комнате (иначе адресное сообщение)
+        persisted: Сообщение сохраняется в состояние доски
+        batched: Сообщение отправляется батчами
+        critical: Ошибки отправки пробрасываются
+        max_size: Лимит размера в байтах или функция от распарсенного сообщения
+    """
+    def decorator(func):
+        for message_type in message_types:
+            MESSAGE_HANDLERS[message_type] = MessageHandlerSpec(
+                message_type, func, broadcast, persisted, batched, critical, max_size
+            )
+        return func
+    return decorator
+
+
+def get_handler_spec(message_type: Optional[str]) -> Optional[MessageHandlerSpec]:
+    """Получить описание обработчика по типу сообщения"""
+    return MESSAGE_HANDLERS.get(message_type)
+
+
+async def dispatch_message(consumer, spec: MessageHandlerSpec, data: Dict[str, Any]):
+    """
+    Вызвать обработчик сообщения с записью статистики.
+
+    Args:
+        consumer: Экземпляр consumer'а
+        spec: Описание обработчика
+        data: Распарсенное сообщение
+    """
+    stats = handler_stats[spec.message_type]
+    start = time.perf_counter()
+    try:
+        await spec.handler(consumer, data, spec)
+    except Exception:
+        stats['errors'] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stats['calls'] += 1
+        stats['total_time'] += elapsed
+        if elapsed > stats['max_time']:
+            stats['max_time'] = elapsed
+
+
+def get_handler_stats() -> Dict[str, Dict[str, float]]:
+    """Получить копию статистики обработчиков (со средним временем вызова)"""
+    result = {}
+    # list() копирует словарь одной операцией: view читает статистику из другого потока
+    for message_type, stats in list(handler_stats.items()):
+        item = dict(stats)
+        item['avg_time'] = stats['total_time'] / stats['calls'] if stats['calls'] else 0.0
+        result[message_type] = item
+    return result
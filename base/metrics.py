@@ -0,0 +1,357 @@
+# base/metrics.py
+"""
+Метрики сигнального сервера в формате Prometheus (text exposition format 0.0.4).
+
+Реестр в памяти процесса: счетчики, гистограммы и gauge с метками. Запись метрики -
+это обновление словаря по кортежу меток, без блокировок и ввода-вывода.
+Значения, которые уже считаются в других модулях (исходящие очереди, обработчики,
+очистка Redis), не дублируются: collector'ы читают их только при запросе /metrics.
+
+Несколько воркеров: каждый процесс раз в METRICS_PUBLISH_INTERVAL секунд
+публикует снимок своих метрик в Redis (ключ с TTL), /metrics суммирует снимки
+всех живых воркеров, поэтому ответ не зависит от того, какой воркер принял запрос.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import os
+import socket
+
+from base import codec
+
+logger = logging.getLogger(__name__)
+
+# Публикация снимков метрик в Redis
+METRICS_PUBLISH_INTERVAL = float(os.environ.get('METRICS_PUBLISH_INTERVAL', '5'))  # секунды
+METRICS_SNAPSHOT_TTL = 30  # секунды: снимок упавшего воркера пропадает сам
+METRICS_WORKERS_KEY = 'metrics:workers'
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Границы гистограмм
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 10485760)
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict:
+        # list() копирует словарь одной операцией: view читает реестр из другого потока
+        return {'values': [[list(labels), value] for labels, value in list(self.values.items())]}
+
+
+class Gauge(Counter):
+    """Текущее значение; вместо хранения может вычисляться функцией при запросе"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+    def snapshot(self) -> Dict:
+        if self.function is not None:
+            self.values = self.function()
+        return super().snapshot()
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами и метками"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # {labels: [счетчики по корзинам (последняя - +Inf), сумма]}
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def snapshot(self) -> Dict:
+        return {'values': [[list(labels), list(counts), total]
+                           for labels, (counts, total) in list(self.values.items())]}
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        # Функции, возвращающие [(имя, тип, описание, [(метки dict, значение)])] при запросе
+        self.collectors: List[Callable[[], List]] = []
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], List]):
+        self.collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        """Снимок всех метрик процесса (сериализуемый в JSON)"""
+        result = {}
+        for name, metric in self.metrics.items():
+            data = metric.snapshot()
+            data.update(kind=metric.kind, doc=metric.documentation, labels=list(metric.labelnames))
+            if metric.kind == 'histogram':
+                data['buckets'] = list(metric.buckets)
+            result[name] = data
+        for collector in self.collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    labelnames = sorted(samples[0][0]) if samples else []
+                    result[name] = {
+                        'kind': kind, 'doc': documentation, 'labels': labelnames,
+                        'values': [[[labels[key] for key in labelnames], value] for labels, value in samples],
+                    }
+            except Exception as e:
+                logger.warning(f'[Metrics] Collector failed: {e}')
+        return result
+
+
+registry = MetricsRegistry()
+
+# Метрики сигнального сервера
+messages_total = registry.counter(
+    'signaling_messages_total', 'WebSocket messages by type and direction', ('type', 'direction'))
+dropped_messages_total = registry.counter(
+    'signaling_dropped_messages_total', 'Messages dropped because the recipient channel was full', ('type',))
+rate_limited_total = registry.counter(
+    'signaling_rate_limited_total', 'Incoming messages rejected by rate limiting', ('message_class',))
+group_send_seconds = registry.histogram(
+    'signaling_group_send_seconds', 'Channel layer send/group_send latency', ('mode',))
+receive_to_deliver_seconds = registry.histogram(
+    'signaling_receive_to_deliver_seconds', 'Time from server receive to delivery into the recipient queue')
+frame_bytes = registry.histogram(
+    'signaling_frame_bytes', 'WebSocket frame size', ('direction',), buckets=SIZE_BUCKETS)
+connections = registry.gauge('signaling_connections', 'Open WebSocket connections')
+rooms = registry.gauge('signaling_rooms', 'Rooms with connections in this worker')
+pending_ice = registry.gauge('signaling_pending_ice_messages', 'ICE candidates waiting for a batch flush')
+
+
+def _collect_service_stats() -> List:
+    """Счетчики, которые уже ведут сервисные модули (читаются только при запросе)"""
+    from base.outbound_queue import get_outbound_stats
+    from base.event_coalescer import EventCoalescer
+    from base.redis_cleanup import RedisCleanup
+    from base.rate_limiter import get_rate_limit_stats
+    from base.message_dispatch import get_handler_stats
+    from base.whiteboard_store import WhiteboardStore
+    from base import stroke_simplify, whiteboard_media, image_pipeline, blob_store, whiteboard_upload
+
+    outbound = get_outbound_stats()
+    coalesce = EventCoalescer.get_stats()
+    cleanup = RedisCleanup.get_stats()
+    rate_limits = get_rate_limit_stats()
+    handlers = get_handler_stats()
+    compaction = WhiteboardStore.get_stats()
+    strokes = stroke_simplify.get_stats()
+    inline_images = whiteboard_media.get_stats()
+    images = image_pipeline.get_stats()
+    blobs = blob_store.get_stats()
+    uploads = whiteboard_upload.get_stats()
+    return [
+        ('signaling_outbound_messages_total', 'counter', 'Outbound queue events by lane and outcome',
+         [({'lane': lane, 'outcome': outcome}, value)
+          for lane, counters in outbound['lanes'].items() for outcome, value in counters.items()]),
+        ('signaling_outbound_queue_depth', 'gauge', 'Frames waiting in outbound queues',
+         [({}, outbound['depth'])]),
+        ('signaling_outbound_queue_bytes', 'gauge', 'Bytes waiting in outbound queues',
+         [({}, outbound['pending_bytes'])]),
+        ('signaling_outbound_overflow_disconnects_total', 'counter', 'Connections closed on outbound overflow',
+         [({}, outbound['overflow_disconnects'])]),
+        ('signaling_coalesced_events_total', 'counter', 'Whiteboard events by coalescing outcome',
+         [({'outcome': key}, value) for key, value in coalesce.items() if key != 'rooms']),
+        ('signaling_cleanup_total', 'counter', 'Redis cleanups by outcome',
+         [({'outcome': key}, cleanup[key]) for key in ('scheduled', 'completed', 'failed', 'dropped')]),
+        ('signaling_cleanup_keys_deleted_total', 'counter', 'Redis keys unlinked by cleanup',
+         [({}, cleanup['keys_deleted'])]),
+        ('signaling_rate_limit_checked_total', 'counter', 'Rate limiter decisions by message class',
+         [({'message_class': message_class, 'decision': decision}, stats[decision])
+          for message_class, stats in rate_limits.items() for decision in ('allowed', 'rejected')]),
+        ('signaling_handler_seconds_total', 'counter', 'Time spent in message handlers',
+         [({'type': message_type}, stats['total_time']) for message_type, stats in handlers.items()]),
+        ('signaling_handler_calls_total', 'counter', 'Message handler calls',
+         [({'type': message_type}, stats['calls']) for message_type, stats in handlers.items()]),
+        ('signaling_whiteboard_compactions_total', 'counter', 'Whiteboard op-log compactions by outcome',
+         [({'outcome': 'completed'}, compaction['runs']), ({'outcome': 'failed'}, compaction['failed'])]),
+        ('signaling_whiteboard_ops_folded_total', 'counter', 'Whiteboard ops folded into snapshots',
+         [({}, compaction['ops_folded'])]),
+        ('signaling_whiteboard_strokes_simplified_total', 'counter', 'Whiteboard strokes simplified before storage',
+         [({'outcome': 'simplified'}, strokes['strokes']), ({'outcome': 'failed'}, strokes['failed'])]),
+        ('signaling_whiteboard_stroke_points_total', 'counter', 'Stroke path commands before and after simplification',
+         [({'stage': 'in'}, strokes['points_in']), ({'stage': 'out'}, strokes['points_out'])]),
+        ('signaling_whiteboard_stroke_bytes_total', 'counter', 'Stroke path JSON bytes before and after simplification',
+         [({'stage': 'in'}, strokes['bytes_in']), ({'stage': 'out'}, strokes['bytes_out'])]),
+        ('signaling_whiteboard_inline_images_total', 'counter', 'Inline data URL images by offload outcome',
+         [({'outcome': key}, inline_images[key]) for key in ('images', 'reused', 'rejected')]),
+        ('signaling_whiteboard_inline_image_bytes_total', 'counter', 'Inline image bytes moved out of messages',
+         [({}, inline_images['bytes'])]),
+        ('signaling_image_pipeline_total', 'counter', 'Whiteboard images by processing outcome',
+         [({'outcome': key}, images[key]) for key in ('processed', 'rejected', 'busy', 'failed')]),
+        ('signaling_image_pipeline_bytes_total', 'counter', 'Image bytes before and after optimization',
+         [({'stage': 'in'}, images['bytes_in']), ({'stage': 'out'}, images['bytes_out'])]),
+        ('signaling_blob_store_total', 'counter', 'Content-addressed storage operations by outcome',
+         [({'outcome': key}, blobs[key]) for key in ('stored', 'deduplicated', 'released', 'deleted')]),
+        ('signaling_blob_store_deduplicated_bytes_total', 'counter', 'Upload bytes not stored again as duplicates',
+         [({}, blobs['bytes_deduplicated'])]),
+        ('signaling_whiteboard_uploads_total', 'counter', 'Streaming whiteboard image uploads by outcome',
+         [({'outcome': key}, uploads[key]) for key in ('uploads', 'too_large', 'room_not_found', 'rejected',
+                                                       'busy', 'failed', 'aborted')]),
+        ('signaling_whiteboard_upload_bytes_total', 'counter', 'Bytes received by streaming whiteboard uploads',
+         [({}, uploads['bytes'])]),
+        ('signaling_whiteboard_upload_room_cache_total', 'counter', 'Upload room validation cache lookups',
+         [({'result': 'hit'}, uploads['room_cache_hits']), ({'result': 'miss'}, uploads['room_cache_misses'])]),
+    ]
+
+
+registry.add_collector(_collect_service_stats)
+
+
+def _merge(target: Dict, snapshot: Dict):
+    """Добавить снимок воркера к суммарному"""
+    for name, data in snapshot.items():
+        merged = target.get(name)
+        if merged is None:
+            target[name] = merged = dict(data, values={})
+        values = merged['values']
+        for item in data['values']:
+            key = tuple(item[0])
+            if data['kind'] == 'histogram':
+                current = values.get(key)
+                if current is None:
+                    values[key] = [list(item[1]), item[2]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], item[1])]
+                    current[1] += item[2]
+            else:
+                values[key] = values.get(key, 0) + item[1]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labels, le=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(snapshots: List[Dict]) -> str:
+    """Суммировать снимки воркеров и отформатировать в text exposition format"""
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        _merge(merged, snapshot)
+    lines = [
+        '# HELP signaling_workers Workers included in this scrape',
+        '# TYPE signaling_workers gauge',
+        f'signaling_workers {len(snapshots)}',
+    ]
+    for name in sorted(merged):
+        data = merged[name]
+        lines.append(f"# HELP {name} {data['doc']}")
+        lines.append(f"# TYPE {name} {data['kind']}")
+        labelnames = data['labels']
+        for labels, value in data['values'].items():
+            if data['kind'] == 'histogram':
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(list(data['buckets']) + ['+Inf'], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, bound)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+async def publish_snapshot():
+    """Опубликовать снимок метрик этого воркера в Redis"""
+    from base.redis_pool import get_redis
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    pipe.set(f'metrics:worker:{WORKER_ID}', codec.dumps(registry.snapshot()), ex=METRICS_SNAPSHOT_TTL)
+    pipe.sadd(METRICS_WORKERS_KEY, WORKER_ID)
+    pipe.expire(METRICS_WORKERS_KEY, METRICS_SNAPSHOT_TTL * 10)
+    await pipe.execute()
+
+
+_publisher_task = None
+
+
+async def _publisher():
+    try:
+        while True:
+            try:
+                await publish_snapshot()
+            except Exception as e:
+                logger.warning(f'[Metrics] Error publishing snapshot: {e}')
+            await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+    except asyncio.CancelledError:
+        pass
+
+
+def start_publisher():
+    """Запустить периодическую публикацию снимков (один раз на процесс, из consumer'а)"""
+    global _publisher_task
+    if _publisher_task is None or _publisher_task.done():
+        _publisher_task = asyncio.create_task(_publisher())
+
+
+def collect_all() -> List[Dict]:
+    """
+    Снимки метрик всех воркеров (синхронно, для view): свой - актуальный,
+    остальные - из Redis. Снимки без обновления дольше TTL уже удалены Redis.
+    """
+    snapshots = [registry.snapshot()]
+    try:
+        from base.redis_pool import get_sync_redis
+        r = get_sync_redis()
+        workers = [worker for worker in r.smembers(METRICS_WORKERS_KEY) if worker != WORKER_ID]
+        if workers:
+            for worker, data in zip(workers, r.mget([f'metrics:worker:{worker}' for worker in workers])):
+                if data:
+                    snapshots.append(codec.loads(data))
+                else:
+                    r.srem(METRICS_WORKERS_KEY, worker)
+    except Exception as e:
+        logger.warning(f'[Metrics] Error reading worker snapshots: {e}')
+    return snapshots
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_auto_20251114_0930'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='roommember',
+            name='room_name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-17 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_roommember_room_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='stroke_tolerance',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
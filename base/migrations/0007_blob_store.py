@@ -0,0 +1,38 @@
+# Generated by Django 3.2.8 on 2026-10-17 05:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_room_stroke_tolerance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('thumbnail', models.CharField(blank=True, max_length=255)),
+                ('width', models.IntegerField(blank=True, null=True)),
+                ('height', models.IntegerField(blank=True, null=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlobReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(db_index=True, max_length=255)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='references', to='base.blob')),
+            ],
+            options={
+                'unique_together': {('blob', 'owner')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.8 on 2026-10-17 06:02
+
+from django.db import migrations, models
+
+
+def _rekey(apps, make_key):
+    Blob = apps.get_model('base', 'Blob')
+    BlobReference = apps.get_model('base', 'BlobReference')
+    for blob in list(Blob.objects.all()):
+        key = make_key(blob)
+        if key == blob.digest:
+            continue
+        old_key = blob.digest
+        blob.digest = key
+        blob.save(force_insert=True)
+        BlobReference.objects.filter(blob_id=old_key).update(blob_id=key)
+        Blob.objects.filter(digest=old_key).delete()
+
+
+def add_kind_prefix(apps, schema_editor):
+    # Изображения доски - с миниатюрой, файлы обмена - без
+    _rekey(apps, lambda blob: blob.digest if ':' in blob.digest
+           else f"{'image' if blob.thumbnail else 'file'}:{blob.digest}")
+
+
+def remove_kind_prefix(apps, schema_editor):
+    _rekey(apps, lambda blob: blob.digest.partition(':')[2] or blob.digest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_blob_store'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='digest',
+            field=models.CharField(max_length=72, primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(add_kind_prefix, remove_kind_prefix),
+    ]
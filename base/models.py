@@ -9,6 +9,8 @@ class Room(models.Model):
     name = models.CharField(max_length=200, db_index=True)
     created_at = models.DateTimeField(default=timezone.now)
     is_active = models.BooleanField(default=True)
+    # Допуск упрощения штрихов доски в пикселях (None - STROKE_SIMPLIFY_TOLERANCE, 0 - не упрощать)
+    stroke_tolerance = models.FloatField(null=True, blank=True)
     
     class Meta:
         unique_together = [['name', 'is_active']]
@@ -23,9 +25,34 @@ class Room(models.Model):
 class RoomMember(models.Model):
     name = models.CharField(max_length=200)
     uid = models.CharField(max_length=1000)
-    room_name = models.CharField(max_length=200)
+    room_name = models.CharField(max_length=200, db_index=True)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True, related_name='members')
     insession = models.BooleanField(default=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class Blob(models.Model):
+    """Файл хранилища с адресацией по содержимому (MEDIA_ROOT/blobs/, см. base/blob_store.py)"""
+    digest = models.CharField(max_length=72, primary_key=True)  # <вид>:sha256 исходного содержимого
+    name = models.CharField(max_length=255)  # Путь относительно MEDIA_ROOT
+    thumbnail = models.CharField(max_length=255, blank=True)  # Миниатюра изображения
+    width = models.IntegerField(null=True, blank=True)
+    height = models.IntegerField(null=True, blank=True)
+    size = models.BigIntegerField(default=0)  # Байт на диске (все варианты)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
+
+
+class BlobReference(models.Model):
+    """Ссылка владельца на Blob: файл удаляется, когда ссылок не осталось"""
+    blob = models.ForeignKey(Blob, on_delete=models.CASCADE, related_name='references')
+    owner = models.CharField(max_length=255, db_index=True)  # whiteboard:<комната>, share:<ключ>
+
+    class Meta:
+        unique_together = [['blob', 'owner']]
+
+    def __str__(self):
+        return f"{self.owner} -> {self.blob_id}"
@@ -0,0 +1,234 @@
+# base/outbound_queue.py
+"""
+Исходящая очередь WebSocket соединения с приоритетными полосами.
+Обработчики событий channel layer не ждут self.send, а кладут готовый кадр в очередь;
+отдельная задача-писатель отправляет кадры клиенту в порядке приоритета:
+signaling -> media-state -> whiteboard -> cursor.
+
+У каждой полосы своя политика переполнения:
+- signaling (offer/answer/ICE) никогда не отбрасывается;
+- media-state отбрасывает самые старые сообщения;
+- whiteboard не отбрасывается (потеря изменения рассинхронизирует доску);
+- cursor хранит только последнюю позицию каждого отправителя.
+Если клиент безнадежно отстал (слишком много кадров или байт в очереди),
+соединение закрывается - клиент переподключится и получит актуальное состояние.
+"""
+
+from collections import OrderedDict, defaultdict, deque
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import weakref
+
+from base.rate_limiter import SIGNALING, MEDIA_STATE, WHITEBOARD, CURSOR, CONTROL, MESSAGE_CLASSES
+
+logger = logging.getLogger(__name__)
+
+# Полосы в порядке приоритета
+LANES = (SIGNALING, MEDIA_STATE, WHITEBOARD, CURSOR)
+
+# Полоса для класса сообщения (control - диагностика TURN от клиентов, идет вместе с media-state).
+# Типы без класса (кадры сервера: error, screen-share-started/-stopped/-state) - signaling
+LANE_FOR_CLASS = {
+    SIGNALING: SIGNALING,
+    MEDIA_STATE: MEDIA_STATE,
+    CONTROL: MEDIA_STATE,
+    WHITEBOARD: WHITEBOARD,
+    CURSOR: CURSOR,
+}
+
+# Политики переполнения полос
+NEVER_DROP = 'never'
+DROP_OLDEST = 'drop-oldest'
+COALESCE = 'coalesce'
+
+# Политика и максимальная длина полосы (None - без ограничения, действует общий порог)
+LANE_POLICIES = {
+    SIGNALING: (NEVER_DROP, None),
+    MEDIA_STATE: (DROP_OLDEST, 100),
+    WHITEBOARD: (NEVER_DROP, None),
+    CURSOR: (COALESCE, None),  # Не больше одной позиции на отправителя
+}
+
+# Порог "безнадежно отстал": при превышении соединение закрывается
+OUTBOUND_QUEUE_MAX_MESSAGES = int(os.environ.get('OUTBOUND_QUEUE_MAX_MESSAGES', '2000'))
+OUTBOUND_QUEUE_MAX_BYTES = int(os.environ.get('OUTBOUND_QUEUE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# Код закрытия WebSocket для отставшего клиента (клиент переподключается)
+OUTBOUND_QUEUE_CLOSE_CODE = 4008
+
+# Счетчики по полосам: {lane: {'enqueued', 'sent', 'dropped', 'coalesced'}}
+outbound_stats: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {'enqueued': 0, 'sent': 0, 'dropped': 0, 'coalesced': 0}
+)
+# Общие счетчики: закрытые из-за отставания соединения, ошибки отправки, максимальная глубина
+outbound_totals: Dict[str, int] = {'overflow_disconnects': 0, 'send_errors': 0, 'max_depth': 0}
+
+# Живые очереди (для текущей глубины в метриках)
+_active_queues = weakref.WeakSet()
+
+
+def get_lane(message_type: Optional[str]) -> str:
+    """Определить полосу по типу сообщения (тип без класса - signaling, чтобы не потерять)"""
+    message_class = MESSAGE_CLASSES.get(message_type)
+    if message_class is None:
+        return SIGNALING
+    return LANE_FOR_CLASS[message_class]
+
+
+class OutboundQueue:
+    """Исходящая очередь одного соединения"""
+
+    def __init__(self, send: Callable[[str], Awaitable[None]], on_overflow: Callable[[], None]):
+        """
+        Args:
+            send: Корутина отправки кадра клиенту
+            on_overflow: Вызывается один раз, если клиент безнадежно отстал
+        """
+        self._send = send
+        self._on_overflow = on_overflow
+        self._lanes = {lane: deque() for lane in LANES if LANE_POLICIES[lane][0] != COALESCE}
+        self._cursors: Dict[str, str] = OrderedDict()  # отправитель -> последний кадр
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()  # Очередь опустела до порога _drain_below
+        self._drain_below = None
+        self._writer_task = None
+        self.depth = 0
+        self.pending_bytes = 0
+        self.closed = False
+        _active_queues.add(self)
+
+    def put(self, text: str, lane: str, sender: Optional[str] = None) -> bool:
+        """
+        Поставить кадр в очередь (без ожидания).
+
+        Args:
+            text: Готовый текст кадра
+            lane: Полоса (см. get_lane)
+            sender: Отправитель (ключ объединения для полосы cursor)
+
+        Returns:
+            False если очередь закрыта или переполнена
+        """
+        if self.closed:
+            return False
+        stats = outbound_stats[lane]
+        stats['enqueued'] += 1
+        policy, max_len = LANE_POLICIES[lane]
+
+        if policy == COALESCE:
+            previous = self._cursors.get(sender)
+            if previous is not None:
+                # Промежуточные позиции курсора не нужны - заменяем последней
+                self._cursors[sender] = text
+                self.pending_bytes += len(text) - len(previous)
+                stats['coalesced'] += 1
+                return True
+            self._cursors[sender] = text
+        else:
+            queue = self._lanes[lane]
+            queue.append(text)
+            if max_len is not None and len(queue) > max_len:
+                dropped = queue.popleft()
+                self.pending_bytes -= len(dropped)
+                self.depth -= 1
+                stats['dropped'] += 1
+        self.depth += 1
+        self.pending_bytes += len(text)
+        if self.depth > outbound_totals['max_depth']:
+            outbound_totals['max_depth'] = self.depth
+
+        if self.depth > OUTBOUND_QUEUE_MAX_MESSAGES or self.pending_bytes > OUTBOUND_QUEUE_MAX_BYTES:
+            logger.warning(f'[OutboundQueue] Client is too far behind: {self.depth} messages, '
+                           f'{self.pending_bytes} bytes queued')
+            outbound_totals['overflow_disconnects'] += 1
+            self.close()
+            self._on_overflow()
+            return False
+
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+        self._wakeup.set()
+        return True
+
+    async def wait_writable(self, max_bytes: int) -> bool:
+        """
+        Flow control для массовой отправки: дождаться, пока в очереди останется
+        не больше max_bytes (писатель передал остальное в WebSocket).
+
+        Returns:
+            False если очередь закрыта
+        """
+        while not self.closed and self.pending_bytes > max_bytes:
+            self._drain_below = max_bytes
+            self._drained.clear()
+            await self._drained.wait()
+        return not self.closed
+
+    def _pop(self):
+        """Следующий кадр с наивысшим приоритетом: (полоса, текст) или None"""
+        for lane in LANES:
+            if lane == CURSOR:
+                if self._cursors:
+                    return lane, self._cursors.popitem(last=False)[1]
+            elif self._lanes[lane]:
+                return lane, self._lanes[lane].popleft()
+        return None
+
+    async def _writer(self):
+        """Задача-писатель: отправляет кадры клиенту в порядке приоритета"""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                # Приоритет выбирается заново перед каждым кадром: offer, пришедший
+                # во время отправки истории доски, обгоняет оставшиеся кадры доски
+                item = self._pop()
+                while item is not None and not self.closed:
+                    lane, text = item
+                    self.depth -= 1
+                    self.pending_bytes -= len(text)
+                    try:
+                        await self._send(text)
+                    except Exception as e:
+                        # Соединение уже закрыто - дальнейшая отправка бессмысленна
+                        outbound_totals['send_errors'] += 1
+                        logger.debug(f'[OutboundQueue] Send failed, stopping writer: {e}')
+                        self.close()
+                        return
+                    outbound_stats[lane]['sent'] += 1
+                    if self._drain_below is not None and self.pending_bytes <= self._drain_below:
+                        self._drain_below = None
+                        self._drained.set()
+                    item = self._pop()
+        except asyncio.CancelledError:
+            pass
+
+    def close(self):
+        """Закрыть очередь: остановить писателя и освободить неотправленные кадры"""
+        self.closed = True
+        for queue in self._lanes.values():
+            queue.clear()
+        self._cursors.clear()
+        self.depth = 0
+        self.pending_bytes = 0
+        self._drained.set()  # Ожидающий wait_writable получит False
+        if self._writer_task is not None and not self._writer_task.done() \
+                and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+        self._writer_task = None
+        _active_queues.discard(self)
+
+
+def get_outbound_stats() -> Dict:
+    """Метрики исходящих очередей: счетчики по полосам и текущая глубина"""
+    queues = list(_active_queues)
+    return {
+        'lanes': {lane: dict(outbound_stats[lane]) for lane in LANES},
+        'connections': len(queues),
+        'depth': sum(queue.depth for queue in queues),
+        'max_connection_depth': max((queue.depth for queue in queues), default=0),
+        'pending_bytes': sum(queue.pending_bytes for queue in queues),
+        **outbound_totals,
+    }
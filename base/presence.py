@@ -0,0 +1,180 @@
+# base/presence.py
+"""
+Реестр присутствия участников комнат.
+Для каждой комнаты в Redis хранится sorted set UID -> время последнего heartbeat
+и hash UID -> имя пользователя, а также hash UID -> channel_name соединения,
+которое последним прислало join: disconnect старого сокета после переподключения
+с тем же UID не удаляет участника. Heartbeat пишет VideoCallConsumer, а
+getRoomMembers/getMember читают отсюда вместо опроса таблицы RoomMember.
+Участники без heartbeat дольше PRESENCE_TIMEOUT удаляются sweep'ом за O(log n + m).
+"""
+
+from typing import Dict, List, Optional
+import time
+import logging
+
+from base.redis_pool import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Интервал heartbeat из consumer'а и время, после которого участник считается ушедшим
+PRESENCE_HEARTBEAT_INTERVAL = 15  # секунды
+PRESENCE_TIMEOUT = 45  # секунды (три пропущенных heartbeat)
+
+# TTL ключей присутствия: пустая/заброшенная комната исчезает сама
+PRESENCE_KEY_TTL = 24 * 60 * 60
+
+# KEYS[1] - sorted set присутствия, KEYS[2] - hash имен, KEYS[3] - hash каналов,
+# ARGV[1] - граница last-seen
+# Удаляет участников, не присылавших heartbeat, и возвращает их UID
+SWEEP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('HDEL', KEYS[2], unpack(expired))
+    redis.call('HDEL', KEYS[3], unpack(expired))
+end
+return expired
+"""
+
+# KEYS - как в SWEEP_SCRIPT, ARGV[1] - UID, ARGV[2] - channel_name уходящего соединения
+# Удаляет участника, только если он принадлежит этому соединению (или канал не записан).
+# Возвращает 1, если участник удален
+REMOVE_SCRIPT = """
+local owner = redis.call('HGET', KEYS[3], ARGV[1])
+if owner and owner ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return 1
+"""
+
+_async_client = None
+_sweep_script = None
+_remove_script = None
+
+
+def _get_async_client():
+    """Асинхронный Redis клиент для consumer'ов (общий пул процесса)"""
+    global _async_client, _sweep_script, _remove_script
+    client = get_redis()
+    if client is not _async_client:
+        _async_client = client
+        _sweep_script = client.register_script(SWEEP_SCRIPT)
+        _remove_script = client.register_script(REMOVE_SCRIPT)
+    return client
+
+
+def _get_sync_client():
+    """Синхронный Redis клиент для Django views (общий пул процесса)"""
+    return get_sync_redis()
+
+
+def _presence_key(room_name: str) -> str:
+    return f"presence:{room_name}"
+
+
+def _names_key(room_name: str) -> str:
+    return f"presence:{room_name}:names"
+
+
+def _channels_key(room_name: str) -> str:
+    return f"presence:{room_name}:channels"
+
+
+def _keys(room_name: str) -> List[str]:
+    return [_presence_key(room_name), _names_key(room_name), _channels_key(room_name)]
+
+
+class PresenceRegistry:
+    """Присутствие участников комнат"""
+
+    @staticmethod
+    async def touch(room_name: str, user_uid: str, name: Optional[str] = None,
+                    channel_name: Optional[str] = None):
+        """
+        Отметить, что пользователь в комнате (heartbeat).
+
+        Args:
+            room_name: Имя комнаты
+            user_uid: UID пользователя
+            name: Имя пользователя (передается при join)
+            channel_name: Канал соединения (передается при join, участник переходит к нему)
+        """
+        pipe = _get_async_client().pipeline(transaction=False)
+        pipe.zadd(_presence_key(room_name), {str(user_uid): time.time()})
+        pipe.expire(_presence_key(room_name), PRESENCE_KEY_TTL)
+        if name is not None:
+            pipe.hset(_names_key(room_name), str(user_uid), name)
+            pipe.expire(_names_key(room_name), PRESENCE_KEY_TTL)
+        if channel_name is not None:
+            pipe.hset(_channels_key(room_name), str(user_uid), channel_name)
+            pipe.expire(_channels_key(room_name), PRESENCE_KEY_TTL)
+        await pipe.execute()
+
+    @staticmethod
+    async def remove(room_name: str, user_uid: str, channel_name: str) -> bool:
+        """
+        Удалить пользователя из присутствия (при отключении), если запись принадлежит
+        этому соединению.
+
+        Args:
+            room_name: Имя комнаты
+            user_uid: UID пользователя
+            channel_name: Канал отключающегося соединения
+
+        Returns:
+            True, если участник удален
+        """
+        _get_async_client()
+        return bool(await _remove_script(keys=_keys(room_name), args=[str(user_uid), channel_name]))
+
+    @staticmethod
+    async def sweep(room_name: str) -> List[str]:
+        """
+        Удалить участников без heartbeat дольше PRESENCE_TIMEOUT.
+
+        Args:
+            room_name: Имя комнаты
+
+        Returns:
+            Список UID удаленных участников
+        """
+        _get_async_client()
+        cutoff = time.time() - PRESENCE_TIMEOUT
+        return await _sweep_script(keys=_keys(room_name), args=[cutoff])
+
+    @staticmethod
+    def get_members(room_name: str) -> List[Dict[str, str]]:
+        """
+        Получить активных участников комнаты (синхронно, для views).
+
+        Args:
+            room_name: Имя комнаты
+
+        Returns:
+            Список {'uid': str, 'name': str}
+        """
+        r = _get_sync_client()
+        cutoff = time.time() - PRESENCE_TIMEOUT
+        uids = r.zrangebyscore(_presence_key(room_name), cutoff, '+inf')
+        if not uids:
+            return []
+        names = r.hmget(_names_key(room_name), uids)
+        return [{'uid': uid, 'name': name or ''} for uid, name in zip(uids, names)]
+
+    @staticmethod
+    def get_member_name(room_name: str, user_uid: str) -> Optional[str]:
+        """
+        Получить имя участника комнаты (синхронно, для views).
+
+        Args:
+            room_name: Имя комнаты
+            user_uid: UID пользователя
+
+        Returns:
+            Имя или None, если пользователь не найден
+        """
+        return _get_sync_client().hget(_names_key(room_name), str(user_uid))
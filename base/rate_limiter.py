@@ -0,0 +1,203 @@
+# base/rate_limiter.py
+"""
+Rate limiting для WebSocket сообщений на основе token bucket.
+Каждая проверка выполняется за O(1): хранится только количество токенов
+и время последнего пополнения, без списков временных меток.
+
+Лимиты раздельные для классов сообщений (signaling, media-state, whiteboard,
+cursor, control), поэтому поток whiteboard-cursor не может вытеснить offer/answer.
+Дополнительно можно включить общий бюджет на комнату.
+
+До разбора кадра (тип еще неизвестен) can_accept проверяет, что кадр такого
+размера помещается в бюджет хотя бы одного класса: поток кадров сверх общего
+бюджета соединения отклоняется, не расходуя время на разбор.
+"""
+
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Классы сообщений
+SIGNALING = 'signaling'
+MEDIA_STATE = 'media-state'
+WHITEBOARD = 'whiteboard'
+CURSOR = 'cursor'
+CONTROL = 'control'
+
+MESSAGE_CLASSES = {
+    'join': SIGNALING, 'user-joined': SIGNALING, 'user-left': SIGNALING,
+    'offer': SIGNALING, 'answer': SIGNALING, 'ice-candidate': SIGNALING,
+    'screen-share-start': SIGNALING, 'screen-share-stop': SIGNALING,
+    'screen-share-request-state': SIGNALING,
+    'mic-active': MEDIA_STATE, 'mic-inactive': MEDIA_STATE,
+    'camera-enabled': MEDIA_STATE, 'camera-disabled': MEDIA_STATE,
+    'audio-enabled': MEDIA_STATE, 'audio-disabled': MEDIA_STATE,
+    'request-camera-states': MEDIA_STATE, 'request-audio-states': MEDIA_STATE,
+    'whiteboard-draw': WHITEBOARD, 'whiteboard-object': WHITEBOARD,
+    'whiteboard-clear': WHITEBOARD,
+    # Только сервер -> клиент: восстановление доски идет в полосе whiteboard исходящей очереди
+    'whiteboard-state-chunk': WHITEBOARD, 'whiteboard-state-restored': WHITEBOARD,
+    'whiteboard-cursor': CURSOR,
+    'turn-server-used': CONTROL, 'turn-test-start': CONTROL, 'turn-test-complete': CONTROL,
+}
+
+# Лимиты на соединение: (сообщений/сек, burst сообщений, байт/сек, burst байт)
+# Burst по байтам должен быть не меньше максимального размера сообщения класса
+RATE_LIMITS = {
+    SIGNALING: (50, 100, 256 * 1024, 512 * 1024),  # ICE кандидаты приходят пачками
+    MEDIA_STATE: (10, 20, 16 * 1024, 128 * 1024),
+    WHITEBOARD: (30, 60, 4 * 1024 * 1024, 12 * 1024 * 1024),  # Изображения до 10MB
+    CURSOR: (30, 30, 32 * 1024, 128 * 1024),
+    CONTROL: (5, 10, 64 * 1024, 256 * 1024),
+}
+
+# Общий бюджет комнаты (в рамках процесса), 0 - отключено
+ROOM_RATE_LIMIT_MESSAGES = float(os.environ.get('ROOM_RATE_LIMIT_MESSAGES', '0'))
+ROOM_RATE_LIMIT_BYTES = float(os.environ.get('ROOM_RATE_LIMIT_BYTES', '0'))
+
+# Класс в статистике для кадров, отклоненных до разбора (тип неизвестен)
+UNPARSED = 'unparsed'
+
+# Счетчики для настройки лимитов по данным продакшена
+# Формат: {class_name: {'allowed': int, 'rejected': int, 'bytes': int}}
+rate_limit_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {'allowed': 0, 'rejected': 0, 'bytes': 0})
+
+
+class TokenBucket:
+    """Token bucket: пополняется со скоростью rate, вмещает не более capacity токенов"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def can_consume(self, amount: float, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= amount
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+
+def get_message_class(message_type: Optional[str]) -> str:
+    """Определить класс сообщения по его типу"""
+    return MESSAGE_CLASSES.get(message_type, CONTROL)
+
+
+def _can_consume(buckets: Tuple[TokenBucket, TokenBucket], size: int, now: float) -> bool:
+    msg_bucket, byte_bucket = buckets
+    return msg_bucket.can_consume(1, now) and byte_bucket.can_consume(size, now)
+
+
+def _consume(buckets: Tuple[TokenBucket, TokenBucket], size: int):
+    msg_bucket, byte_bucket = buckets
+    msg_bucket.consume(1)
+    byte_bucket.consume(size)
+
+
+class ConnectionRateLimiter:
+    """Лимиты одного WebSocket соединения по классам сообщений"""
+
+    def __init__(self):
+        self.buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+
+    def _get_buckets(self, message_class: str) -> Tuple[TokenBucket, TokenBucket]:
+        buckets = self.buckets.get(message_class)
+        if buckets is None:
+            rate, burst, byte_rate, byte_burst = RATE_LIMITS[message_class]
+            buckets = (TokenBucket(rate, burst), TokenBucket(byte_rate, byte_burst))
+            self.buckets[message_class] = buckets
+        return buckets
+
+    def can_accept(self, size: int) -> bool:
+        """
+        Проверка до разбора кадра: кадр такого размера помещается в бюджет хотя бы
+        одного класса. Токены не списываются - это делает check после разбора.
+        """
+        now = time.monotonic()
+        for message_class in RATE_LIMITS:
+            if _can_consume(self._get_buckets(message_class), size, now):
+                return True
+        rate_limit_stats[UNPARSED]['rejected'] += 1
+        return False
+
+    def check(self, message_type: Optional[str], size: int, room_name: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        Проверить и учесть сообщение. Токены списываются, только если сообщение
+        помещается и в бюджет соединения, и в бюджет комнаты.
+
+        Args:
+            message_type: Тип сообщения
+            size: Размер сообщения в байтах
+            room_name: Имя комнаты для общего бюджета комнаты
+
+        Returns:
+            Tuple (allowed, message_class)
+        """
+        message_class = get_message_class(message_type)
+        now = time.monotonic()
+        stats = rate_limit_stats[message_class]
+
+        buckets = self._get_buckets(message_class)
+        room = RoomRateLimiter.get_buckets(room_name) if room_name is not None else None
+        allowed = _can_consume(buckets, size, now) and (room is None or _can_consume(room, size, now))
+
+        if allowed:
+            _consume(buckets, size)
+            if room is not None:
+                _consume(room, size)
+            stats['allowed'] += 1
+            stats['bytes'] += size
+        else:
+            stats['rejected'] += 1
+        return allowed, message_class
+
+
+# Общие бюджеты комнат: {room_name: (msg_bucket, byte_bucket)}
+room_buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+
+
+class RoomRateLimiter:
+    """Общий бюджет сообщений комнаты (опционально, в рамках процесса)"""
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return ROOM_RATE_LIMIT_MESSAGES > 0 or ROOM_RATE_LIMIT_BYTES > 0
+
+    @staticmethod
+    def get_buckets(room_name: str) -> Optional[Tuple[TokenBucket, TokenBucket]]:
+        """Бюджет комнаты (None, если общий бюджет отключен)"""
+        if not RoomRateLimiter.is_enabled():
+            return None
+        buckets = room_buckets.get(room_name)
+        if buckets is None:
+            msg_rate = ROOM_RATE_LIMIT_MESSAGES or float('inf')
+            byte_rate = ROOM_RATE_LIMIT_BYTES or float('inf')
+            # Burst комнаты - две секунды бюджета, но не меньше самого большого сообщения
+            byte_burst = max(byte_rate * 2, RATE_LIMITS[WHITEBOARD][3])
+            buckets = (TokenBucket(msg_rate, msg_rate * 2), TokenBucket(byte_rate, byte_burst))
+            room_buckets[room_name] = buckets
+        return buckets
+
+    @staticmethod
+    def cleanup_room(room_name: str):
+        """Удалить бюджет комнаты (когда комната опустела)"""
+        room_buckets.pop(room_name, None)
+
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, int]]:
+    """Получить копию счетчиков rate limiting по классам сообщений"""
+    return {message_class: dict(stats) for message_class, stats in rate_limit_stats.items()}
@@ -0,0 +1,157 @@
+# base/redis_cleanup.py
+"""
+Фоновая очистка ключей Redis при отключении.
+Consumer удаляет только известные ему ключи одним UNLINK, без SCAN по всему
+keyspace. Channel layer (channels_redis) хранит сообщения в общем ключе процесса,
+а членство канала в группе убирает group_discard, поэтому при обычном отключении
+удалять нечего. Когда комната опустела, удаляются ключи присутствия - атомарно и
+только если комната все еще пуста (ключа участников нет): новый участник мог
+войти, пока очистка ждала в пуле. Ключ группы channels_redis не удаляется:
+соединение, уже выполнившее group_add в connect, но еще не приславшее join,
+молча потеряло бы членство; участники упавших воркеров истекают по group_expiry.
+
+Очистки выполняются ограниченным пулом фоновых задач: при массовом отключении
+(перезапуск сервера) Redis не получает тысячи одновременных запросов.
+"""
+
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from base.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Одновременно выполняемые очистки и максимум ожидающих
+CLEANUP_MAX_CONCURRENCY = int(os.environ.get('CLEANUP_MAX_CONCURRENCY', '4'))
+CLEANUP_MAX_PENDING = int(os.environ.get('CLEANUP_MAX_PENDING', '1000'))
+
+# Счетчики очисток: запланировано, выполнено, ошибки, отброшено (пул переполнен),
+# удалено ключей, суммарное и максимальное время выполнения
+cleanup_stats: Dict[str, float] = {
+    'scheduled': 0, 'completed': 0, 'failed': 0, 'dropped': 0,
+    'keys_deleted': 0, 'total_time': 0.0, 'max_time': 0.0,
+}
+
+# Сильные ссылки на фоновые задачи (иначе незавершенная задача может быть собрана GC)
+_pending_tasks = set()
+_semaphore = None
+
+# KEYS[1] - ключ, пока существующий которого удалять нельзя (участники комнаты)
+# KEYS[2..] - удаляемые ключи. Возвращает количество удаленных ключей
+UNLINK_IF_ABSENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+return redis.call('UNLINK', unpack(KEYS, 2))
+"""
+
+_client = None
+_unlink_if_absent_script = None
+
+
+def _get_unlink_if_absent_script():
+    global _client, _unlink_if_absent_script
+    client = get_redis()
+    if client is not _client:
+        _client = client
+        _unlink_if_absent_script = client.register_script(UNLINK_IF_ABSENT_SCRIPT)
+    return _unlink_if_absent_script
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(CLEANUP_MAX_CONCURRENCY)
+    return _semaphore
+
+
+class RedisCleanup:
+    """Очистка ключей комнаты после отключения"""
+
+    @staticmethod
+    def room_keys(room_name: str) -> List[str]:
+        """
+        Ключи, принадлежащие опустевшей комнате (ключ группы channel layer не входит).
+
+        Args:
+            room_name: Имя комнаты
+
+        Returns:
+            Список ключей для удаления
+        """
+        return [f"presence:{room_name}", f"presence:{room_name}:names", f"presence:{room_name}:channels"]
+
+    @staticmethod
+    async def unlink(keys: List[str], guard_key: Optional[str] = None) -> int:
+        """
+        Удалить ключи одной командой UNLINK (освобождение памяти в фоне Redis).
+
+        Args:
+            keys: Удаляемые ключи
+            guard_key: Если указан, ключи удаляются атомарно и только пока этого ключа нет
+
+        Returns:
+            Количество удаленных ключей
+        """
+        if not keys:
+            return 0
+        start = time.perf_counter()
+        try:
+            if guard_key is None:
+                deleted = int(await get_redis().unlink(*keys))
+            else:
+                deleted = int(await _get_unlink_if_absent_script()(keys=[guard_key, *keys]))
+        except Exception:
+            cleanup_stats['failed'] += 1
+            raise
+        elapsed = time.perf_counter() - start
+        cleanup_stats['completed'] += 1
+        cleanup_stats['keys_deleted'] += deleted
+        cleanup_stats['total_time'] += elapsed
+        if elapsed > cleanup_stats['max_time']:
+            cleanup_stats['max_time'] = elapsed
+        return deleted
+
+    @staticmethod
+    def schedule(keys: List[str], guard_key: Optional[str] = None) -> bool:
+        """
+        Запланировать удаление ключей в фоновом пуле.
+
+        Args:
+            keys: Удаляемые ключи
+            guard_key: Ключи удаляются, только если этого ключа нет (см. unlink)
+
+        Returns:
+            False если пул переполнен (ключи все равно истекут по TTL)
+        """
+        if not keys:
+            return True
+        if len(_pending_tasks) >= CLEANUP_MAX_PENDING:
+            cleanup_stats['dropped'] += 1
+            logger.warning(f'[Cleanup] Cleanup pool is full, skipping {len(keys)} keys')
+            return False
+        cleanup_stats['scheduled'] += 1
+        task = asyncio.create_task(RedisCleanup._run(keys, guard_key))
+        _pending_tasks.add(task)
+        task.add_done_callback(_pending_tasks.discard)
+        return True
+
+    @staticmethod
+    async def _run(keys: List[str], guard_key: Optional[str]):
+        async with _get_semaphore():
+            try:
+                deleted = await RedisCleanup.unlink(keys, guard_key)
+                logger.info(f'[Cleanup] Unlinked {deleted}/{len(keys)} keys')
+            except Exception as e:
+                logger.warning(f'[Cleanup] Error in Redis cleanup (non-critical): {e}')
+
+    @staticmethod
+    def get_stats() -> Dict[str, float]:
+        """Счетчики очисток (со средним временем и текущим числом задач)"""
+        stats = dict(cleanup_stats)
+        stats['avg_time'] = stats['total_time'] / stats['completed'] if stats['completed'] else 0.0
+        stats['pending'] = len(_pending_tasks)
+        return stats
@@ -0,0 +1,78 @@
+# base/redis_pool.py
+"""
+Общий пул соединений Redis процесса.
+Все обращения к состоянию комнат (доска, участники, присутствие, демонстрация экрана)
+идут через один асинхронный клиент redis.asyncio с пулом соединений, поэтому
+consumer'ы не блокируют event loop и не открывают соединение на каждый запрос.
+Для синхронного кода (Django views) есть отдельный синхронный пул.
+
+Пулы блокирующие: когда заняты все REDIS_POOL_MAX_CONNECTIONS соединений, запрос
+ждет освобождения до REDIS_POOL_TIMEOUT секунд, а не сразу получает
+ConnectionError("Too many connections") - всплеск join'ов и heartbeat'ов не
+превращается в ошибки.
+
+Настройки: REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_POOL_MAX_CONNECTIONS,
+REDIS_POOL_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL, REDIS_SOCKET_TIMEOUT (mysite/settings.py).
+"""
+
+import asyncio
+import logging
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_async_client = None
+_async_client_loop = None
+_sync_client = None
+
+
+def _pool_kwargs():
+    return {
+        'host': getattr(settings, 'REDIS_HOST', '127.0.0.1'),
+        'port': getattr(settings, 'REDIS_PORT', 6379),
+        'db': getattr(settings, 'REDIS_DB', 0),
+        'max_connections': getattr(settings, 'REDIS_POOL_MAX_CONNECTIONS', 50),
+        # Ожидание свободного соединения пула
+        'timeout': getattr(settings, 'REDIS_POOL_TIMEOUT', 5),
+        # PING перед использованием соединения, простаивавшего дольше интервала
+        'health_check_interval': getattr(settings, 'REDIS_HEALTH_CHECK_INTERVAL', 30),
+        'socket_timeout': getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+        'socket_connect_timeout': getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+        'decode_responses': True,
+    }
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Асинхронный Redis клиент процесса (общий пул соединений).
+    Соединения redis.asyncio привязаны к event loop, поэтому клиент
+    пересоздается, если вызван из другого loop (например, в тестах).
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        pool = aioredis.BlockingConnectionPool(**_pool_kwargs())
+        _async_client = aioredis.Redis(connection_pool=pool)
+        _async_client_loop = loop
+        logger.info(f'[Redis] Created async connection pool (max {pool.max_connections} connections)')
+    return _async_client
+
+
+def get_sync_redis() -> redis.Redis:
+    """Синхронный Redis клиент процесса (для Django views)"""
+    global _sync_client
+    if _sync_client is None:
+        pool = redis.BlockingConnectionPool(**_pool_kwargs())
+        _sync_client = redis.Redis(connection_pool=pool)
+    return _sync_client
+
+
+async def close_redis():
+    """Закрыть соединения асинхронного пула (при остановке процесса)"""
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.connection_pool.disconnect()
+    _async_client = None
+    _async_client_loop = None
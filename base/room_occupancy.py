@@ -0,0 +1,180 @@
+# base/room_occupancy.py
+"""
+Учет участников комнат в Redis.
+Участники хранятся как hash UID -> channel_name соединения на комнату, изменения
+выполняются атомарными Lua скриптами, поэтому MAX_ROOM_SIZE соблюдается при
+нескольких воркерах Daphne, а повторный join того же UID не увеличивает счетчик.
+
+Повторный join того же UID (переподключение) передает место новому соединению.
+Выход удаляет UID, только если место принадлежит этому соединению: disconnect
+старого сокета, пришедший после переподключения, не освобождает место
+участника, который остался в комнате.
+
+Если Redis недоступен, вход в комнату отклоняется (OccupancyUnavailable): учет
+в памяти одного процесса не ограничил бы комнату на нескольких воркерах.
+Ошибки Redis считаются в метрике signaling_occupancy_errors_total.
+"""
+
+from typing import NamedTuple, Optional, Tuple
+import logging
+
+from base import metrics
+from base.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+# TTL множества участников: страховка от "зависших" UID при падении воркера
+OCCUPANCY_TTL = 24 * 60 * 60
+
+# KEYS[1] - hash UID -> channel_name комнаты
+# ARGV[1] - UID, ARGV[2] - максимальный размер комнаты, ARGV[3] - TTL, ARGV[4] - channel_name
+# Возвращает {admitted (0/1), размер комнаты}
+ADMIT_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return {1, redis.call('HLEN', KEYS[1])}
+end
+local size = redis.call('HLEN', KEYS[1])
+if size >= tonumber(ARGV[2]) then
+    return {0, size}
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, size + 1}
+"""
+
+# KEYS[1] - hash UID -> channel_name комнаты
+# ARGV[1] - UID, ARGV[2] - channel_name ('' - удалить независимо от соединения)
+# Возвращает {removed (0/1), размер комнаты, superseded (0/1 - UID занят другим соединением)}.
+# Пустой hash Redis удаляет сам.
+LEAVE_SCRIPT = """
+local owner = redis.call('HGET', KEYS[1], ARGV[1])
+if not owner then
+    return {0, redis.call('HLEN', KEYS[1]), 0}
+end
+if ARGV[2] ~= '' and owner ~= ARGV[2] then
+    return {0, redis.call('HLEN', KEYS[1]), 1}
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return {1, redis.call('HLEN', KEYS[1]), 0}
+"""
+
+# Ошибки Redis по операциям
+occupancy_errors_total = metrics.registry.counter(
+    'signaling_occupancy_errors_total', 'Room occupancy operations that failed in Redis', ('operation',))
+
+
+class OccupancyUnavailable(Exception):
+    """Учет участников недоступен (ошибка Redis) - вход в комнату не разрешается"""
+
+
+class LeaveResult(NamedTuple):
+    """Результат выхода из комнаты"""
+    removed: bool
+    size: int
+    # UID остался в комнате: он принадлежит другому (более новому) соединению
+    superseded: bool
+
+_client = None
+_admit_script = None
+_leave_script = None
+
+
+def _get_client():
+    """Асинхронный Redis клиент (общий пул процесса) с зарегистрированными скриптами"""
+    global _client, _admit_script, _leave_script
+    client = get_redis()
+    if client is not _client:
+        _client = client
+        _admit_script = client.register_script(ADMIT_SCRIPT)
+        _leave_script = client.register_script(LEAVE_SCRIPT)
+    return client
+
+
+def _occupancy_key(room_group_name: str) -> str:
+    return f"room_occupancy_channels:{room_group_name}"
+
+
+class RoomOccupancy:
+    """Атомарный учет участников комнаты"""
+
+    @staticmethod
+    def key(room_group_name: str) -> str:
+        """Ключ участников комнаты в Redis (пустая комната ключа не имеет)"""
+        return _occupancy_key(room_group_name)
+
+    @staticmethod
+    async def admit(room_group_name: str, user_uid: str, max_size: int, channel_name: str) -> Tuple[bool, int]:
+        """
+        Добавить пользователя в комнату, если есть место.
+        Повторный вызов для того же UID не увеличивает счетчик, место переходит к channel_name.
+
+        Args:
+            room_group_name: Имя группы комнаты
+            user_uid: UID пользователя
+            max_size: Максимальное количество участников
+            channel_name: Канал соединения пользователя
+
+        Returns:
+            Tuple (admitted, размер комнаты после операции)
+
+        Raises:
+            OccupancyUnavailable: Redis недоступен
+        """
+        try:
+            _get_client()
+            admitted, size = await _admit_script(
+                keys=[_occupancy_key(room_group_name)],
+                args=[str(user_uid), max_size, OCCUPANCY_TTL, channel_name]
+            )
+            return bool(admitted), int(size)
+        except Exception as e:
+            occupancy_errors_total.inc('admit')
+            logger.warning(f'[Occupancy] Redis admit failed, rejecting join: {e}')
+            raise OccupancyUnavailable(str(e)) from e
+
+    @staticmethod
+    async def leave(room_group_name: str, user_uid: str, channel_name: Optional[str] = None) -> LeaveResult:
+        """
+        Удалить пользователя из комнаты.
+
+        Args:
+            room_group_name: Имя группы комнаты
+            user_uid: UID пользователя
+            channel_name: Канал уходящего соединения: UID удаляется, только если место
+                принадлежит ему. None - удалить независимо от соединения (истекшее присутствие)
+
+        Returns:
+            LeaveResult (removed, размер комнаты после операции, superseded).
+            При ошибке Redis - (False, 0, False): место освободится по OCCUPANCY_TTL
+        """
+        try:
+            _get_client()
+            removed, size, superseded = await _leave_script(
+                keys=[_occupancy_key(room_group_name)],
+                args=[str(user_uid), channel_name or '']
+            )
+            return LeaveResult(bool(removed), int(size), bool(superseded))
+        except Exception as e:
+            occupancy_errors_total.inc('leave')
+            logger.warning(f'[Occupancy] Redis leave failed: {e}')
+            return LeaveResult(False, 0, False)
+
+    @staticmethod
+    async def size(room_group_name: str) -> int:
+        """
+        Получить текущее количество участников комнаты.
+
+        Args:
+            room_group_name: Имя группы комнаты
+
+        Returns:
+            Количество участников (0, если Redis недоступен)
+        """
+        try:
+            return int(await _get_client().hlen(_occupancy_key(room_group_name)))
+        except Exception as e:
+            occupancy_errors_total.inc('size')
+            logger.warning(f'[Occupancy] Redis size failed: {e}')
+            return 0
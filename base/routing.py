@@ -2,8 +2,14 @@
 from django.urls import re_path
 
 from . import consumers
+from .whiteboard_upload import WhiteboardImageUploadConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/video/(?P<room_name>\w+)/$", consumers.VideoCallConsumer.as_asgi()),
 ]
 
+
+# HTTP маршруты, обрабатываемые consumers до Django (остальные запросы - django_asgi_app)
+http_urlpatterns = [
+    re_path(r"^upload_whiteboard_image/(?P<room_name>\w+)/$", WhiteboardImageUploadConsumer.as_asgi()),
+]
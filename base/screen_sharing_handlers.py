@@ -37,7 +37,7 @@ class ScreenSharingHandlers:
             }
         
         # Проверяем через сервис
-        result = ScreenSharingService.start_sharing(room_name, user_uid)
+        result = await ScreenSharingService.start_sharing(room_name, user_uid)
         
         if result['success']:
             # Уведомляем всех пользователей в комнате
@@ -79,7 +79,7 @@ class ScreenSharingHandlers:
             }
         
         # Останавливаем через сервис
-        result = ScreenSharingService.stop_sharing(room_name, user_uid)
+        result = await ScreenSharingService.stop_sharing(room_name, user_uid)
         
         if result['success']:
             # Уведомляем всех пользователей в комнате
@@ -113,7 +113,7 @@ class ScreenSharingHandlers:
         room_name = consumer.room_name
         user_uid = message_data.get('from') or message_data.get('uid')
         
-        sharing_state = ScreenSharingService.get_sharing_state(room_name)
+        sharing_state = await ScreenSharingService.get_sharing_state(room_name)
         
         if sharing_state:
             return {
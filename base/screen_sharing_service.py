@@ -2,165 +2,347 @@
 """
 Сервис для управления демонстрацией экрана в комнатах.
 Обеспечивает, что только один пользователь может демонстрировать экран одновременно.
+
+Право на демонстрацию - это lease с TTL. В режиме нескольких воркеров lease хранится
+в Redis (SET NX PX) и продлевается heartbeat'ом из consumer'а демонстрирующего
+пользователя, поэтому после падения воркера блокировка снимается сама.
+Для однопроцессного режима доступно хранилище в памяти (SCREEN_SHARING_BACKEND=memory).
 """
 
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from datetime import datetime
+import time
 import logging
+from django.conf import settings
+
+from base.redis_pool import get_redis
 
 logger = logging.getLogger(__name__)
 
-# Хранилище состояния демонстрации экрана по комнатам
+# Время жизни lease демонстрации экрана и интервал его продления
+SCREEN_SHARING_LEASE_TTL_MS = 30 * 1000
+SCREEN_SHARING_HEARTBEAT_INTERVAL = 10  # секунды
+
+# Время жизни локального кэша состояния (запросы при join)
+SCREEN_SHARING_CACHE_TTL = 2.0  # секунды
+
+# Хранилище состояния демонстрации экрана по комнатам (backend 'memory')
 # Формат: {room_name: {'sharing_user_uid': str, 'started_at': datetime}}
 screen_sharing_state: Dict[str, Dict] = {}
 
+# Локальный кэш состояния для get_sharing_state
+# Формат: {room_name: (expires_at, state)}
+sharing_state_cache: Dict[str, Tuple[float, Optional[Dict]]] = {}
+
+# KEYS[1] - ключ lease, ARGV[1] - UID, ARGV[2] - TTL в мс
+# Продлевает lease, только если он принадлежит этому пользователю
+RENEW_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and string.sub(current, 1, string.len(ARGV[1]) + 1) == ARGV[1] .. '|' then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS[1] - ключ lease, ARGV[1] - UID
+# Удаляет lease, только если он принадлежит этому пользователю
+RELEASE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and string.sub(current, 1, string.len(ARGV[1]) + 1) == ARGV[1] .. '|' then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class InMemoryScreenSharingBackend:
+    """Хранилище lease в памяти процесса (однопроцессный режим)"""
+
+    async def acquire(self, room_name: str, user_uid: str) -> Optional[Dict]:
+        current = screen_sharing_state.get(room_name)
+        if current and current['sharing_user_uid'] != user_uid:
+            return current
+        if current is None:
+            screen_sharing_state[room_name] = {
+                'sharing_user_uid': user_uid,
+                'started_at': datetime.now()
+            }
+        return None
+
+    async def renew(self, room_name: str, user_uid: str) -> bool:
+        current = screen_sharing_state.get(room_name)
+        return bool(current and current['sharing_user_uid'] == user_uid)
+
+    async def release(self, room_name: str, user_uid: str) -> bool:
+        current = screen_sharing_state.get(room_name)
+        if current and current['sharing_user_uid'] == user_uid:
+            del screen_sharing_state[room_name]
+            return True
+        return False
+
+    async def get(self, room_name: str) -> Optional[Dict]:
+        return screen_sharing_state.get(room_name)
+
+    async def delete(self, room_name: str) -> Optional[Dict]:
+        return screen_sharing_state.pop(room_name, None)
+
+
+class RedisScreenSharingBackend:
+    """Хранилище lease в Redis: значение 'uid|started_at', TTL продлевается heartbeat'ом"""
+
+    def __init__(self):
+        self._client = None
+        self.renew_script = None
+        self.release_script = None
+
+    @property
+    def client(self):
+        """Клиент общего пула процесса (скрипты регистрируются при смене клиента)"""
+        client = get_redis()
+        if client is not self._client:
+            self._client = client
+            self.renew_script = client.register_script(RENEW_SCRIPT)
+            self.release_script = client.register_script(RELEASE_SCRIPT)
+        return client
+
+    @staticmethod
+    def _key(room_name: str) -> str:
+        return f"screen_sharing:{room_name}"
+
+    @staticmethod
+    def _decode(value: Optional[str]) -> Optional[Dict]:
+        if not value:
+            return None
+        user_uid, _, started_at = value.partition('|')
+        try:
+            started = datetime.fromisoformat(started_at)
+        except ValueError:
+            started = None
+        return {'sharing_user_uid': user_uid, 'started_at': started}
+
+    async def acquire(self, room_name: str, user_uid: str) -> Optional[Dict]:
+        key = self._key(room_name)
+        value = f"{user_uid}|{datetime.now().isoformat()}"
+        if await self.client.set(key, value, nx=True, px=SCREEN_SHARING_LEASE_TTL_MS):
+            return None
+        # Lease уже занят: если это тот же пользователь (переподключение) - продлеваем
+        if await self.renew(room_name, user_uid):
+            return None
+        current = self._decode(await self.client.get(key))
+        if current is None:
+            # Lease истек между SET и GET - пробуем еще раз
+            if await self.client.set(key, value, nx=True, px=SCREEN_SHARING_LEASE_TTL_MS):
+                return None
+            current = self._decode(await self.client.get(key))
+        return current
+
+    async def renew(self, room_name: str, user_uid: str) -> bool:
+        client = self.client
+        return bool(await self.renew_script(keys=[self._key(room_name)], args=[user_uid, SCREEN_SHARING_LEASE_TTL_MS],
+                                            client=client))
+
+    async def release(self, room_name: str, user_uid: str) -> bool:
+        client = self.client
+        return bool(await self.release_script(keys=[self._key(room_name)], args=[user_uid], client=client))
+
+    async def get(self, room_name: str) -> Optional[Dict]:
+        return self._decode(await self.client.get(self._key(room_name)))
+
+    async def delete(self, room_name: str) -> Optional[Dict]:
+        key = self._key(room_name)
+        # GET + DEL одной транзакцией (один round trip)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(key)
+        pipe.delete(key)
+        value, _ = await pipe.execute()
+        return self._decode(value)
+
+
+_backend = None
+
+
+def get_backend():
+    """Получить backend хранилища lease (выбирается через SCREEN_SHARING_BACKEND)"""
+    global _backend
+    if _backend is None:
+        backend_name = getattr(settings, 'SCREEN_SHARING_BACKEND', 'redis')
+        if backend_name == 'memory':
+            _backend = InMemoryScreenSharingBackend()
+        else:
+            _backend = RedisScreenSharingBackend()
+        logger.info(f'[ScreenSharing] Using {backend_name} backend')
+    return _backend
+
 
 class ScreenSharingService:
     """Сервис для управления демонстрацией экрана"""
-    
+
     @staticmethod
-    def start_sharing(room_name: str, user_uid: str) -> Dict:
+    async def start_sharing(room_name: str, user_uid: str) -> Dict:
         """
         Начать демонстрацию экрана пользователем.
-        
+
         Args:
             room_name: Имя комнаты
             user_uid: UID пользователя, который начинает демонстрацию
-            
+
         Returns:
             Dict с результатом операции:
             - success: bool - успешность операции
             - message: str - сообщение
             - current_sharing_user: Optional[str] - кто сейчас демонстрирует (если есть)
         """
-        # Проверяем, не демонстрирует ли уже кто-то другой
-        if room_name in screen_sharing_state:
-            current_sharing = screen_sharing_state[room_name]
-            if current_sharing['sharing_user_uid'] != user_uid:
-                return {
-                    'success': False,
-                    'message': f'Демонстрация экрана уже ведется пользователем {current_sharing["sharing_user_uid"]}',
-                    'current_sharing_user': current_sharing['sharing_user_uid']
-                }
-            # Если тот же пользователь пытается начать снова - разрешаем (переподключение)
-            logger.info(f'[ScreenSharing] User {user_uid} already sharing in room {room_name}, updating timestamp')
-        
-        # Начинаем или обновляем демонстрацию
-        screen_sharing_state[room_name] = {
-            'sharing_user_uid': user_uid,
-            'started_at': datetime.now()
-        }
-        
+        # Захватываем lease (если тот же пользователь начинает снова - продлеваем, это переподключение)
+        current_sharing = await get_backend().acquire(room_name, user_uid)
+        if current_sharing is not None:
+            return {
+                'success': False,
+                'message': f'Демонстрация экрана уже ведется пользователем {current_sharing["sharing_user_uid"]}',
+                'current_sharing_user': current_sharing['sharing_user_uid']
+            }
+
+        ScreenSharingService.invalidate_cache(room_name)
         logger.info(f'[ScreenSharing] User {user_uid} started sharing in room {room_name}')
-        
+
         return {
             'success': True,
             'message': 'Демонстрация экрана начата',
             'current_sharing_user': user_uid
         }
-    
+
+    @staticmethod
+    async def renew_sharing(room_name: str, user_uid: str) -> bool:
+        """
+        Продлить lease демонстрации экрана (heartbeat).
+
+        Args:
+            room_name: Имя комнаты
+            user_uid: UID демонстрирующего пользователя
+
+        Returns:
+            True если lease продлен, False если он истек или принадлежит другому пользователю
+        """
+        return await get_backend().renew(room_name, user_uid)
+
     @staticmethod
-    def stop_sharing(room_name: str, user_uid: str) -> Dict:
+    async def stop_sharing(room_name: str, user_uid: str) -> Dict:
         """
         Остановить демонстрацию экрана.
-        
+
         Args:
             room_name: Имя комнаты
             user_uid: UID пользователя, который останавливает демонстрацию
-            
+
         Returns:
             Dict с результатом операции
         """
-        if room_name not in screen_sharing_state:
-            return {
-                'success': False,
-                'message': 'Демонстрация экрана не активна'
-            }
-        
-        current_sharing = screen_sharing_state[room_name]
-        
-        # Проверяем, что останавливает тот же пользователь, который начал
-        if current_sharing['sharing_user_uid'] != user_uid:
+        backend = get_backend()
+        # Удаляем lease, только если он принадлежит этому пользователю
+        if not await backend.release(room_name, user_uid):
+            current_sharing = await backend.get(room_name)
+            if current_sharing is None:
+                return {
+                    'success': False,
+                    'message': 'Демонстрация экрана не активна'
+                }
             return {
                 'success': False,
                 'message': f'Только пользователь {current_sharing["sharing_user_uid"]} может остановить демонстрацию'
             }
-        
-        # Удаляем состояние
-        del screen_sharing_state[room_name]
-        
+
+        ScreenSharingService.invalidate_cache(room_name)
         logger.info(f'[ScreenSharing] User {user_uid} stopped sharing in room {room_name}')
-        
+
         return {
             'success': True,
             'message': 'Демонстрация экрана остановлена'
         }
-    
+
     @staticmethod
-    def get_sharing_state(room_name: str) -> Optional[Dict]:
+    async def get_sharing_state(room_name: str) -> Optional[Dict]:
         """
         Получить текущее состояние демонстрации экрана в комнате.
-        
+        Результат кэшируется локально на SCREEN_SHARING_CACHE_TTL секунд,
+        кэш сбрасывается событиями группы при старте/остановке демонстрации.
+
         Args:
             room_name: Имя комнаты
-            
+
         Returns:
             Dict с состоянием или None, если демонстрация не активна
         """
-        return screen_sharing_state.get(room_name)
-    
+        now = time.monotonic()
+        cached = sharing_state_cache.get(room_name)
+        if cached and cached[0] > now:
+            return cached[1]
+        state = await get_backend().get(room_name)
+        sharing_state_cache[room_name] = (now + SCREEN_SHARING_CACHE_TTL, state)
+        return state
+
     @staticmethod
-    def is_sharing_active(room_name: str) -> bool:
+    async def is_sharing_active(room_name: str) -> bool:
         """
         Проверить, активна ли демонстрация экрана в комнате.
-        
+
         Args:
             room_name: Имя комнаты
-            
+
         Returns:
             True если демонстрация активна, False иначе
         """
-        return room_name in screen_sharing_state
-    
+        return await ScreenSharingService.get_sharing_state(room_name) is not None
+
     @staticmethod
-    def get_sharing_user(room_name: str) -> Optional[str]:
+    async def get_sharing_user(room_name: str) -> Optional[str]:
         """
         Получить UID пользователя, который демонстрирует экран.
-        
+
         Args:
             room_name: Имя комнаты
-            
+
         Returns:
             UID пользователя или None
         """
-        if room_name in screen_sharing_state:
-            return screen_sharing_state[room_name]['sharing_user_uid']
+        state = await ScreenSharingService.get_sharing_state(room_name)
+        if state:
+            return state['sharing_user_uid']
         return None
-    
+
     @staticmethod
-    def cleanup_room(room_name: str):
+    def invalidate_cache(room_name: str):
+        """
+        Сбросить локальный кэш состояния комнаты.
+
+        Args:
+            room_name: Имя комнаты
+        """
+        sharing_state_cache.pop(room_name, None)
+
+    @staticmethod
+    async def cleanup_room(room_name: str):
         """
         Очистить состояние демонстрации экрана для комнаты.
         Используется при очистке комнаты.
-        
+
         Args:
             room_name: Имя комнаты
         """
-        if room_name in screen_sharing_state:
-            del screen_sharing_state[room_name]
+        ScreenSharingService.invalidate_cache(room_name)
+        if await get_backend().delete(room_name):
             logger.info(f'[ScreenSharing] Cleaned up sharing state for room {room_name}')
-    
+
     @staticmethod
-    def force_stop_sharing(room_name: str):
+    async def force_stop_sharing(room_name: str):
         """
         Принудительно остановить демонстрацию экрана.
         Используется при отключении пользователя или очистке комнаты.
-        
+
         Args:
             room_name: Имя комнаты
         """
-        if room_name in screen_sharing_state:
-            sharing_user = screen_sharing_state[room_name]['sharing_user_uid']
-            del screen_sharing_state[room_name]
-            logger.info(f'[ScreenSharing] Force stopped sharing for user {sharing_user} in room {room_name}')
-
+        ScreenSharingService.invalidate_cache(room_name)
+        current_sharing = await get_backend().delete(room_name)
+        if current_sharing:
+            logger.info(f'[ScreenSharing] Force stopped sharing for user {current_sharing["sharing_user_uid"]} in room {room_name}')
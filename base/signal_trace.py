@@ -0,0 +1,68 @@
+# base/signal_trace.py
+"""
+Трассировка сигнальных сообщений по участкам пути.
+
+Отметки времени ставятся на сервере и передаются в конверте события channel layer
+(не в payload клиента):
+- ts     - receive: кадр получен от клиента;
+- pub_ts - перед send/group_send в channel layer;
+- в webrtc_signal получателя - перед постановкой кадра в исходящую очередь.
+
+Из отметок строятся гистограммы по участкам (signaling_hop_seconds в /metrics)
+и sampled trace-лог. Клиент, подключившийся с ?trace=1 (нагрузочные тесты),
+получает отметки в поле _trace своего кадра и может вычислить задержку до клиента.
+
+Отметки - time.time(): между воркерами на разных хостах участок publish_to_deliver
+включает расхождение часов.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+from base import codec, metrics
+from base.structured_log import get_logger
+
+# Трассировка включена по умолчанию: две отметки времени на сообщение
+SIGNAL_TRACE_ENABLED = os.environ.get('SIGNAL_TRACE_ENABLED', '1') == '1'
+# Частота записей trace-лога (записей в секунду, уровень DEBUG категории trace)
+SIGNAL_TRACE_LOG_RATE = float(os.environ.get('SIGNAL_TRACE_LOG_RATE', '1'))
+
+hop_seconds = metrics.registry.histogram(
+    'signaling_hop_seconds', 'Signaling latency per hop from server trace stamps', ('hop', 'type'))
+
+log_trace = get_logger('trace')
+
+
+def stamp() -> Optional[float]:
+    """Отметка времени для конверта события (None, если трассировка выключена)"""
+    return time.time() if SIGNAL_TRACE_ENABLED else None
+
+
+def record(message_type: Optional[str], received_at: Optional[float],
+           published_at: Optional[float], delivered_at: float):
+    """Записать участки пути сообщения в гистограммы и sampled trace-лог"""
+    if received_at is None:
+        return
+    message_type = message_type or 'unknown'
+    metrics.receive_to_deliver_seconds.observe(delivered_at - received_at)
+    if published_at is None:
+        return
+    hop_seconds.observe(published_at - received_at, 'receive_to_publish', message_type)
+    hop_seconds.observe(delivered_at - published_at, 'publish_to_deliver', message_type)
+    if log_trace.isEnabledFor(logging.DEBUG):
+        log_trace.sampled(logging.DEBUG, 'signal trace', rate=SIGNAL_TRACE_LOG_RATE, type=message_type,
+                          receive_to_publish_ms=round((published_at - received_at) * 1000, 3),
+                          publish_to_deliver_ms=round((delivered_at - published_at) * 1000, 3))
+
+
+def attach(text: str, received_at: float, published_at: Optional[float], delivered_at: float) -> str:
+    """
+    Добавить отметки в кадр клиента, запросившего трассировку.
+    Кадр - уже сериализованный JSON объект, поле дописывается перед закрывающей скобкой.
+    """
+    trace = codec.dumps({'recv': received_at, 'pub': published_at, 'dlv': delivered_at})
+    body = text.rstrip()[:-1].rstrip()
+    separator = '' if body.endswith('{') else ','
+    return f'{body}{separator}"_trace":{trace}}}'
@@ -0,0 +1,220 @@
+# base/stroke_simplify.py
+"""
+Упрощение штрихов доски перед сохранением (whiteboard-draw).
+
+PencilBrush fabric.js записывает каждую точку движения мыши: штрих - это
+M, сотни команд Q (контрольная точка - предыдущая точка, конец - середина
+отрезка) и завершающая L, координаты - float с 13-15 знаками. Сохраненный
+штрих отдается каждому новому участнику как есть.
+
+Перед сохранением:
+- из команд каждого подпути удаляются те, конечные точки которых лежат ближе
+  tolerance пикселей к ломаной оставшихся (Ramer-Douglas-Peucker); первая и
+  последняя команды подпути сохраняются, оставшиеся команды не меняются;
+- все координаты округляются до STROKE_COORD_DECIMALS знаков.
+
+При tolerance <= 0.5px изменение не видно (ширина штриха от 1px, отрисовка со
+сглаживанием). Участникам, которые в комнате, штрих пересылается без изменений,
+упрощается только сохраненная копия.
+
+Вычисление расстояний векторизовано на NumPy (есть в requirements.txt); если
+NumPy не установлен, используется тот же алгоритм на чистом Python.
+
+Допуск задается для комнаты полем Room.stroke_tolerance (админка), по умолчанию -
+STROKE_SIMPLIFY_TOLERANCE; 0 отключает удаление точек (остается округление).
+"""
+
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+import os
+import time
+
+from channels.db import database_sync_to_async
+
+from base import codec
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy - медленнее, результат тот же
+    np = None
+    logging.getLogger(__name__).warning('NumPy is not installed, strokes are simplified in pure Python')
+
+logger = logging.getLogger(__name__)
+
+# Допуск по умолчанию, пиксели холста
+STROKE_SIMPLIFY_TOLERANCE = float(os.environ.get('STROKE_SIMPLIFY_TOLERANCE', '0.5'))
+# Знаков после запятой в координатах сохраненного штриха
+STROKE_COORD_DECIMALS = int(os.environ.get('STROKE_COORD_DECIMALS', '2'))
+# Штрихи длиннее упрощаются в пуле потоков, чтобы не задерживать event loop
+STROKE_SIMPLIFY_INLINE_POINTS = 256
+# Время жизни закэшированного допуска комнаты (секунды)
+ROOM_TOLERANCE_CACHE_TTL = 60
+
+# Команды SVG пути, у которых последние две координаты - конечная точка
+_DRAW_COMMANDS = frozenset('MLQCTS')
+
+# {room_name: (допуск, время истечения)}
+_room_tolerance_cache: Dict[str, Tuple[float, float]] = {}
+
+_stats = {
+    'strokes': 0,
+    'points_in': 0,
+    'points_out': 0,
+    'bytes_in': 0,
+    'bytes_out': 0,
+    'failed': 0,
+}
+
+
+def _rdp_mask_numpy(points: List[Tuple[float, float]], tolerance: float) -> List[bool]:
+    """Маска сохраняемых точек (RDP), расстояния до хорды считаются для всего отрезка сразу"""
+    xy = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = xy[start + 1:end] - xy[start]
+        dx, dy = xy[end] - xy[start]
+        chord = math.hypot(dx, dy)
+        if chord == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / chord
+        index = int(dist.argmax())
+        if dist[index] > tolerance:
+            index += start + 1
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep.tolist()
+
+
+def _rdp_mask_python(points: List[Tuple[float, float]], tolerance: float) -> List[bool]:
+    """Маска сохраняемых точек (RDP) без NumPy"""
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        ax, ay = points[start]
+        dx, dy = points[end][0] - ax, points[end][1] - ay
+        chord = math.hypot(dx, dy)
+        max_dist, index = -1.0, start
+        for i in range(start + 1, end):
+            px, py = points[i][0] - ax, points[i][1] - ay
+            dist = math.hypot(px, py) if chord == 0 else abs(dx * py - dy * px) / chord
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if max_dist > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+rdp_mask = _rdp_mask_numpy if np is not None else _rdp_mask_python
+
+
+def _quantize(command: list, decimals: int) -> list:
+    return [command[0], *(round(value, decimals) for value in command[1:])]
+
+
+def simplify_commands(commands: list, tolerance: float, decimals: int = STROKE_COORD_DECIMALS) -> list:
+    """
+    Упростить список команд пути fabric.js ([["M", x, y], ["Q", cx, cy, x, y], ...]).
+    Путь с неизвестными командами не прореживается, только округляется.
+    """
+    if tolerance <= 0 or len(commands) < 3 or any(
+            not command or command[0] not in _DRAW_COMMANDS or len(command) < 3 for command in commands):
+        return [_quantize(command, decimals) if command and isinstance(command[0], str) else command
+                for command in commands]
+
+    # Подпути начинаются с M; каждый прореживается отдельно
+    starts = [i for i, command in enumerate(commands) if command[0] == 'M'] or [0]
+    if starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = list(zip(starts, starts[1:] + [len(commands)]))
+
+    result = []
+    for start, end in bounds:
+        subpath = commands[start:end]
+        if len(subpath) < 3:
+            result.extend(_quantize(command, decimals) for command in subpath)
+            continue
+        points = [(float(command[-2]), float(command[-1])) for command in subpath]
+        mask = rdp_mask(points, tolerance)
+        result.extend(_quantize(command, decimals) for command, keep in zip(subpath, mask) if keep)
+    return result
+
+
+def simplify_draw(draw_data: dict, tolerance: float) -> dict:
+    """
+    Упростить штрих из data сообщения whiteboard-draw ({"path": {... "path": [...]}}).
+    Возвращает копию data с упрощенными командами; при ошибке формата - исходный data.
+    """
+    path = draw_data.get('path')
+    commands = path.get('path') if isinstance(path, dict) else path
+    if not isinstance(commands, list) or not commands:
+        return draw_data
+    try:
+        simplified = simplify_commands(commands, tolerance)
+    except (TypeError, ValueError, IndexError):
+        _stats['failed'] += 1
+        logger.debug("Stroke simplification skipped: malformed path")
+        return draw_data
+
+    _stats['strokes'] += 1
+    _stats['points_in'] += len(commands)
+    _stats['points_out'] += len(simplified)
+    _stats['bytes_in'] += len(codec.dumps(commands))
+    _stats['bytes_out'] += len(codec.dumps(simplified))
+    if isinstance(path, dict):
+        return dict(draw_data, path=dict(path, path=simplified))
+    return dict(draw_data, path=simplified)
+
+
+def stroke_points(draw_data: dict) -> int:
+    """Количество команд в штрихе (для выбора: упрощать в event loop или в пуле потоков)"""
+    path = draw_data.get('path')
+    commands = path.get('path') if isinstance(path, dict) else path
+    return len(commands) if isinstance(commands, list) else 0
+
+
+def _load_room_tolerance(room_name: str) -> Optional[float]:
+    from base.models import Room
+
+    return Room.objects.filter(name=room_name.upper(), is_active=True).values_list(
+        'stroke_tolerance', flat=True).first()
+
+
+async def get_room_tolerance(room_name: str) -> float:
+    """Допуск комнаты (Room.stroke_tolerance или значение по умолчанию), кэшируется на воркере"""
+    cached = _room_tolerance_cache.get(room_name)
+    now = time.monotonic()
+    if cached and cached[1] > now:
+        return cached[0]
+    try:
+        tolerance = await database_sync_to_async(_load_room_tolerance)(room_name)
+    except Exception as e:
+        logger.warning(f"Failed to load stroke tolerance for room {room_name}: {e}")
+        tolerance = None
+    if tolerance is None:
+        tolerance = STROKE_SIMPLIFY_TOLERANCE
+    _room_tolerance_cache[room_name] = (tolerance, now + ROOM_TOLERANCE_CACHE_TTL)
+    return tolerance
+
+
+def forget_room(room_name: str):
+    """Сбросить кэш допуска комнаты (комната опустела)"""
+    _room_tolerance_cache.pop(room_name, None)
+
+
+def get_stats() -> Dict[str, int]:
+    """Статистика упрощения штрихов на этом воркере"""
+    return dict(_stats)
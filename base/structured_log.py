@@ -0,0 +1,152 @@
+# base/structured_log.py
+"""
+Структурированное логирование для горячего пути сигнального сервера.
+
+- Категории: логгеры videochat.<категория> (signaling, whiteboard, turn, cleanup,
+  presence, screen_sharing, trace) с отдельными уровнями (LOG_LEVEL_<КАТЕГОРИЯ>).
+- Ленивое форматирование: запись - это имя события и поля key=value, строка
+  собирается в потоке QueueListener, а при выключенном уровне ничего не строится.
+- Sampling: частые события (перемещение объектов доски, превышение лимитов)
+  пишутся не чаще заданной частоты, пропущенные учитываются в поле suppressed.
+- NonBlockingQueueHandler: event loop только кладет запись в очередь,
+  вывод в stdout выполняет отдельный поток.
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+import logging
+import os
+import queue
+import sys
+import time
+
+from base import codec
+
+# Частота записи событий с sampling по умолчанию (событий в секунду на тип события)
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '5'))
+
+# Счетчики sampling: {'logged': int, 'suppressed': int}
+sampling_stats: Dict[str, int] = {'logged': 0, 'suppressed': 0}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Форматирует запись как 'время уровень логгер событие key=value ...' или JSON"""
+
+    def __init__(self, json: bool = False):
+        super().__init__()
+        self.json = json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, 'fields', None) or {}
+        if self.json:
+            data = {
+                'ts': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'event': record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                data['exc'] = self.formatException(record.exc_info)
+            return codec.dumps(data)
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler с собственным потоком вывода.
+    Запись не форматируется в вызывающем потоке (в отличие от стандартного
+    QueueHandler.prepare) - сообщение и поля собираются в потоке listener'а.
+    """
+
+    def __init__(self, json: bool = False, stream=None):
+        super().__init__(queue.SimpleQueue())
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(StructuredFormatter(json=json))
+        self.listener = QueueListener(self.queue, target, respect_handler_level=False)
+        self.listener.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def close(self):
+        # logging.shutdown() при выходе закрывает handler - дописываем очередь и останавливаем поток
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+class EventLogger:
+    """Логгер категории: события с полями, ленивое форматирование и sampling"""
+
+    __slots__ = ('logger', '_samplers')
+
+    def __init__(self, category: str):
+        self.logger = logging.getLogger(f'videochat.{category}')
+        # {event: [токены, время последнего пополнения, пропущено]}
+        self._samplers: Dict[str, list] = {}
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level: int, event: str, exc_info=None, **fields: Any):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event: str, **fields: Any):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields: Any):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields: Any):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, exc_info=None, **fields: Any):
+        self.log(logging.ERROR, event, exc_info=exc_info, **fields)
+
+    def sampled(self, level: int, event: str, rate: Optional[float] = None, **fields: Any) -> bool:
+        """
+        Записать событие не чаще rate раз в секунду (token bucket на тип события).
+        Количество пропущенных записей добавляется в поле suppressed следующей записи.
+
+        Returns:
+            True если запись выполнена
+        """
+        if not self.logger.isEnabledFor(level):
+            return False
+        rate = rate or LOG_SAMPLE_RATE
+        now = time.monotonic()
+        sampler = self._samplers.get(event)
+        if sampler is None:
+            sampler = self._samplers[event] = [rate, now, 0]
+        tokens = min(rate, sampler[0] + (now - sampler[1]) * rate)
+        sampler[1] = now
+        if tokens < 1:
+            sampler[0] = tokens
+            sampler[2] += 1
+            sampling_stats['suppressed'] += 1
+            return False
+        sampler[0] = tokens - 1
+        if sampler[2]:
+            fields['suppressed'] = sampler[2]
+            sampler[2] = 0
+        sampling_stats['logged'] += 1
+        self.logger.log(level, event, extra={'fields': fields})
+        return True
+
+
+_loggers: Dict[str, EventLogger] = {}
+
+
+def get_logger(category: str) -> EventLogger:
+    """Получить логгер категории (videochat.<category>)"""
+    event_logger = _loggers.get(category)
+    if event_logger is None:
+        event_logger = _loggers[category] = EventLogger(category)
+    return event_logger
@@ -0,0 +1,66 @@
+# base/tests/test_binary_protocol.py
+import msgpack
+from django.test import SimpleTestCase
+
+from base import binary_protocol, codec
+
+
+class RoundTripTests(SimpleTestCase):
+    def assertRoundTrip(self, message):
+        self.assertEqual(binary_protocol.unpack(binary_protocol.pack(message)), message)
+
+    def test_signaling_messages_round_trip(self):
+        self.assertRoundTrip({'type': 'offer', 'from': 'A', 'to': 'B',
+                              'offer': {'type': 'offer', 'sdp': 'v=0\r\n'}})
+        self.assertRoundTrip({'type': 'ice-candidate', 'from': 'A', 'to': 'B',
+                              'candidate': {'candidate': 'candidate:1', 'sdpMid': '0', 'sdpMLineIndex': 0}})
+
+    def test_envelope_keys_and_type_are_shortened(self):
+        frame = msgpack.unpackb(binary_protocol.pack({'type': 'join', 'uid': 'A', 'name': 'Ann'}))
+        self.assertEqual(frame, {'T': binary_protocol.MESSAGE_TYPE_CODES['join'], 'U': 'A', 'N': 'Ann'})
+
+    def test_whiteboard_object_keys_are_shortened(self):
+        message = {'type': 'whiteboard-object', 'data': {'eventType': 'object-added', 'object': {
+            'type': 'group', 'id': 'g1', 'objects': [{'type': 'rect', 'id': 'r1', 'fill': 'red'}]}}}
+        frame = msgpack.unpackb(binary_protocol.pack(message))
+        self.assertEqual(frame['D']['OB']['OS'][0], {'T': 'rect', 'I': 'r1', 'FL': 'red'})
+        self.assertRoundTrip(message)
+
+    def test_user_keys_matching_short_keys_are_preserved(self):
+        self.assertRoundTrip({'type': 'whiteboard-object', 'T': 1, '~S': 2, 'data': {
+            'eventType': 'object-added', 'I': 'x',
+            'object': {'type': 'rect', 'id': 'r1', 'T': 'custom', 'S': 1, 'P': [1, 2], '~': 0,
+                       'objects': [{'I': 3, 'type': 'circle'}]}}})
+
+    def test_payload_outside_known_fields_is_not_renamed(self):
+        message = {'type': 'turn-test-complete', 'message': {'T': 1, 'type': 2},
+                   'offer': {'type': 'offer', 'sdp': 'v=0', 'extra': {'S': 1, 'type': 'x'}}}
+        frame = msgpack.unpackb(binary_protocol.pack(message))
+        self.assertEqual(frame['MS'], {'T': 1, 'type': 2})
+        self.assertEqual(frame['OF']['extra'], {'S': 1, 'type': 'x'})
+        self.assertRoundTrip(message)
+
+    def test_path_coordinates_are_passed_as_is(self):
+        self.assertRoundTrip({'type': 'whiteboard-draw', 'data': {
+            'path': {'type': 'path', 'path': [['M', 0, 0], ['L', 1, 1]], 'stroke': '#000'}}})
+
+    def test_unknown_type_code_is_kept(self):
+        self.assertEqual(binary_protocol.unpack(msgpack.packb({'T': 999}))['type'], 999)
+
+    def test_text_to_frame_matches_pack(self):
+        message = {'type': 'user-joined', 'uid': 'A', 'data': {'T': 1}}
+        self.assertEqual(binary_protocol.unpack(binary_protocol.text_to_frame(codec.dumps(message))), message)
+
+
+class InvalidFrameTests(SimpleTestCase):
+    def test_when_frame_is_not_msgpack_then_decode_error(self):
+        with self.assertRaises(codec.DecodeError):
+            binary_protocol.unpack(b'\xc1')
+
+    def test_when_frame_has_binary_value_then_decode_error(self):
+        with self.assertRaises(codec.DecodeError):
+            binary_protocol.unpack(msgpack.packb({'T': 1, 'D': b'raw'}, use_bin_type=True))
+
+    def test_when_frame_has_non_string_key_then_decode_error(self):
+        with self.assertRaises(codec.DecodeError):
+            binary_protocol.unpack(msgpack.packb({'T': 1, 'D': {1: 'x'}}))
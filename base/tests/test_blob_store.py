@@ -0,0 +1,90 @@
+# base/tests/test_blob_store.py
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from base import blob_store, image_pipeline
+from base.models import Blob, BlobReference
+
+
+def fake_optimize(data, directory, name=None):
+    """image_pipeline.optimize без пула процессов: варианты - копии исходных байтов"""
+    os.makedirs(directory, exist_ok=True)
+    for suffix in ('.webp', '_thumb.webp'):
+        with open(os.path.join(directory, name + suffix), 'wb') as f:
+            f.write(data)
+    return image_pipeline.ImageVariants(f'{name}.webp', f'{name}_thumb.webp', 4, 3, len(data), 2 * len(data))
+
+
+class BlobStoreTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        root = blob_store.media_path(blob_store.BLOBS_DIR)
+        return sorted(str(path.relative_to(root)) for path in root.rglob('*') if path.is_file())
+
+    def test_same_file_is_stored_once(self):
+        first = blob_store.store_file(blob_store.share_owner('a'), [b'hello ', b'world'], 'Report.PDF')
+        second = blob_store.store_file(blob_store.share_owner('b'), [b'hello world'], 'copy.pdf')
+
+        self.assertEqual(first.digest, second.digest)
+        self.assertTrue(first.name.endswith('.pdf'))
+        self.assertEqual(blob_store.media_path(first.name).read_bytes(), b'hello world')
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(BlobReference.objects.filter(blob=first).count(), 2)
+
+    def test_unsafe_extension_is_dropped(self):
+        blob = blob_store.store_file(blob_store.share_owner('a'), [b'x'], 'name.p h/p')
+        self.assertEqual(os.path.splitext(blob.name)[1], '')
+
+    def test_release_deletes_file_only_after_last_reference(self):
+        blob = blob_store.store_file(blob_store.share_owner('a'), [b'data'])
+        blob_store.store_file(blob_store.share_owner('b'), [b'data'])
+
+        self.assertEqual(blob_store.release(blob_store.share_owner('a')), 0)
+        self.assertTrue(blob_store.media_path(blob.name).exists())
+
+        self.assertEqual(blob_store.release(blob_store.share_owner('b')), 1)
+        self.assertFalse(blob_store.media_path(blob.name).exists())
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_release_of_unknown_owner_is_noop(self):
+        self.assertEqual(blob_store.release(blob_store.share_owner('missing')), 0)
+
+    def test_same_content_as_image_and_file_gives_two_blobs(self):
+        with mock.patch.object(image_pipeline, 'optimize', side_effect=fake_optimize):
+            image = blob_store.store_image(blob_store.whiteboard_owner('room'), [b'pixels'])
+        shared = blob_store.store_file(blob_store.share_owner('a'), [b'pixels'])
+
+        self.assertNotEqual(image.digest, shared.digest)
+        self.assertTrue(image.digest.startswith(blob_store.IMAGE + ':'))
+        self.assertTrue(shared.digest.startswith(blob_store.FILE + ':'))
+
+    def test_duplicate_image_is_not_processed_again(self):
+        with mock.patch.object(image_pipeline, 'optimize', side_effect=fake_optimize) as optimize:
+            first = blob_store.store_image(blob_store.whiteboard_owner('one'), [b'pix', b'els'])
+            second = blob_store.store_image(blob_store.whiteboard_owner('two'), [b'pixels'])
+
+        self.assertEqual(optimize.call_count, 1)
+        self.assertEqual(first.digest, second.digest)
+        self.assertEqual(blob_store.release(blob_store.whiteboard_owner('ONE')), 0)
+        self.assertEqual(blob_store.release(blob_store.whiteboard_owner('TWO')), 1)
+        self.assertFalse(blob_store.media_path(first.thumbnail).exists())
+
+    def test_upload_spool_is_removed_after_store(self):
+        spool = blob_store.UploadSpool()
+        spool.write(b'pixels')
+        with mock.patch.object(image_pipeline, 'optimize', side_effect=fake_optimize):
+            blob = blob_store.store_image_upload(blob_store.whiteboard_owner('room'), spool)
+
+        self.assertIsNone(spool.path)
+        self.assertEqual(self.stored_files(), sorted(
+            os.path.relpath(name, blob_store.BLOBS_DIR) for name in (blob.name, blob.thumbnail)))
@@ -0,0 +1,28 @@
+# base/tests/test_codec.py
+import json
+
+from django.test import SimpleTestCase
+
+from base import codec
+
+
+class CodecTests(SimpleTestCase):
+    def test_round_trip_matches_stdlib(self):
+        message = {'type': 'offer', 'from': 'A', 'name': 'Аня 👋', 'offer': {'sdp': 'v=0\r\n', 'n': [1, 2.5, None]},
+                   'flag': True}
+        text = codec.dumps(message)
+        self.assertIsInstance(text, str)
+        self.assertEqual(codec.loads(text), message)
+        self.assertEqual(json.loads(text), message)
+
+    def test_values_outside_fast_backend_fall_back_to_json(self):
+        self.assertEqual(json.loads(codec.dumps({1: 'x'})), {'1': 'x'})
+        self.assertEqual(json.loads(codec.dumps({'n': 2 ** 70 + 1})), {'n': 2 ** 70 + 1})
+
+    def test_when_text_is_not_json_then_decode_error(self):
+        for text in ('{"type": ', 'not json', ''):
+            with self.subTest(text=text), self.assertRaises(codec.DecodeError):
+                codec.loads(text)
+
+    def test_backend_is_known(self):
+        self.assertIn(codec.BACKEND, ('orjson', 'ujson', 'json'))
@@ -0,0 +1,284 @@
+# base/tests/test_consumers.py
+import asyncio
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from base import consumers, metrics
+from base.rate_limiter import RATE_LIMITS
+from base.channel_registry import ChannelRegistry
+from base.consumers import VideoCallConsumer
+from base.outbound_queue import OutboundQueue
+from base.whiteboard_store import BoardState
+
+ROOM = 'ROOM'
+GROUP = f'video_call_{ROOM}'
+
+
+async def make_consumer(channel_layer, uid):
+    """Consumer участника комнаты без WebSocket: кадры клиенту собираются в consumer.sent"""
+    consumer = VideoCallConsumer()
+    consumer.channel_layer = channel_layer
+    consumer.channel_name = await channel_layer.new_channel()
+    consumer.room_name = ROOM
+    consumer.room_group_name = GROUP
+    consumer.user_uid = uid
+    consumer.sent = []
+
+    async def send(text):
+        consumer.sent.append(text)
+
+    consumer._send_frame = send
+    consumer.outbound = OutboundQueue(send, lambda: None)
+    await channel_layer.group_add(GROUP, consumer.channel_name)
+    return consumer
+
+
+async def receive_or_none(channel_layer, channel_name, timeout=0.1):
+    try:
+        return await asyncio.wait_for(channel_layer.receive(channel_name), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+class ServerMessageRoutingTests(SimpleTestCase):
+    async def test_when_screen_share_error_sent_then_only_requester_receives_it(self):
+        channel_layer = InMemoryChannelLayer()
+        requester = await make_consumer(channel_layer, 'alice')
+        other = await make_consumer(channel_layer, 'bob')
+
+        await requester._send_message_internal({
+            'type': 'screen-share-error', 'from': 'system', 'to': 'alice', 'message': 'busy'})
+        await asyncio.sleep(0)
+
+        self.assertEqual(len(requester.sent), 1)
+        self.assertIn('"screen-share-error"', requester.sent[0])
+        self.assertIn('"_target":"alice"', requester.sent[0].replace(' ', ''))
+        self.assertIsNone(await receive_or_none(channel_layer, other.channel_name))
+        self.assertIsNone(await receive_or_none(channel_layer, requester.channel_name))
+        requester.outbound.close()
+        other.outbound.close()
+
+    async def test_when_server_message_targets_other_user_then_event_carries_target(self):
+        channel_layer = InMemoryChannelLayer()
+        sender = await make_consumer(channel_layer, 'alice')
+        other = await make_consumer(channel_layer, 'bob')
+
+        await sender._send_message_internal({
+            'type': 'screen-share-state', 'from': 'system', 'to': 'bob', 'is_active': False})
+
+        event = await receive_or_none(channel_layer, other.channel_name)
+        self.assertIsNotNone(event)
+        self.assertEqual(event['target_id'], 'bob')
+        self.assertEqual(sender.sent, [])
+        sender.outbound.close()
+        other.outbound.close()
+
+    async def test_when_server_message_has_no_target_then_it_is_broadcast(self):
+        channel_layer = InMemoryChannelLayer()
+        sender = await make_consumer(channel_layer, 'alice')
+        other = await make_consumer(channel_layer, 'bob')
+
+        await sender._send_message_internal({
+            'type': 'screen-share-started', 'from': 'alice', 'room': ROOM, 'sharing_user': 'alice'})
+
+        event = await receive_or_none(channel_layer, other.channel_name)
+        self.assertIsNotNone(event)
+        self.assertIsNone(event['target_id'])
+        sender.outbound.close()
+        other.outbound.close()
+
+
+class DirectDeliveryTests(SimpleTestCase):
+    async def test_when_recipient_channel_is_full_then_offer_is_dropped_without_error(self):
+        channel_layer = InMemoryChannelLayer(capacity=1)
+        sender = await make_consumer(channel_layer, 'alice')
+        recipient = await make_consumer(channel_layer, 'bob')
+        ChannelRegistry.register(GROUP, 'bob', recipient.channel_name)
+        self.addCleanup(ChannelRegistry.unregister, GROUP, 'bob', recipient.channel_name)
+        dropped = metrics.dropped_messages_total.values.get(('offer',), 0)
+
+        for _ in range(2):
+            await sender._send_message_internal(
+                {'type': 'offer', 'from': 'alice', 'to': 'bob', 'offer': {'sdp': 'v=0'}})
+
+        self.assertEqual(metrics.dropped_messages_total.values.get(('offer',), 0), dropped + 1)
+        event = await receive_or_none(channel_layer, recipient.channel_name)
+        self.assertEqual(event['target_id'], 'bob')
+        self.assertIsNone(await receive_or_none(channel_layer, recipient.channel_name))
+        sender.outbound.close()
+        recipient.outbound.close()
+
+
+class ReceiveBudgetTests(SimpleTestCase):
+    async def test_when_frame_exceeds_size_or_budget_then_it_is_rejected_before_parsing(self):
+        consumer = await make_consumer(InMemoryChannelLayer(), 'alice')
+        for message_class in RATE_LIMITS:
+            for bucket in consumer.rate_limiter._get_buckets(message_class):
+                bucket.tokens = 0
+                bucket.rate = 0
+
+        with mock.patch.object(consumers.codec, 'loads', side_effect=AssertionError('parsed')):
+            await consumer.receive(text_data=' ' * (consumers.MAX_FRAME_SIZE + 1))
+            await consumer.receive(text_data='{"type": "offer"}')
+        await asyncio.sleep(0)
+
+        self.assertEqual(len(consumer.sent), 2)
+        self.assertIn('Message too large', consumer.sent[0])
+        self.assertIn('Rate limit exceeded', consumer.sent[1])
+        consumer.outbound.close()
+
+
+class WhiteboardRestoreTests(SimpleTestCase):
+    async def test_when_restore_waits_for_client_then_join_returns_and_offer_overtakes_board(self):
+        consumer = await make_consumer(InMemoryChannelLayer(), None)
+        released = asyncio.Event()
+
+        async def slow_send(text):
+            await released.wait()
+            consumer.sent.append(text)
+
+        consumer.outbound = OutboundQueue(slow_send, lambda: None)
+        data_json = '{"path": "%s"}' % ('x' * 200 * 1024)
+        state = BoardState([('p', f'path-{i}', data_json) for i in range(3)], [], 3)
+        with mock.patch.object(consumers, 'WHITEBOARD_STATE_MAX_BUFFERED', 0), \
+                mock.patch.object(consumers.WhiteboardStore, 'load', mock.AsyncMock(return_value=state)), \
+                mock.patch.object(consumers.RoomOccupancy, 'admit', mock.AsyncMock(return_value=(True, 1))), \
+                mock.patch.object(consumers.PresenceRegistry, 'touch', mock.AsyncMock()), \
+                mock.patch.object(consumers.ScreenSharingService, 'get_sharing_state',
+                                  mock.AsyncMock(return_value=None)), \
+                mock.patch.object(consumer, '_start_presence_heartbeat'):
+            await asyncio.wait_for(consumer.receive(text_data='{"type": "join", "uid": "alice"}'), 1)
+            await asyncio.sleep(0.01)
+            self.assertFalse(consumer.whiteboard_restore_task.done())
+
+            await consumer.webrtc_signal({'type': 'webrtc_signal', 'text': '{"type":"offer"}',
+                                          'msg_type': 'offer', 'sender_channel': 'other'})
+            released.set()
+            await asyncio.wait_for(consumer.whiteboard_restore_task, 1)
+            await asyncio.sleep(0.01)
+
+        types = [text[:40] for text in consumer.sent]
+        self.assertEqual(len(types), 5)
+        self.assertIn('whiteboard-state-chunk', types[0])
+        self.assertIn('offer', types[1])
+        self.assertIn('whiteboard-state-restored', types[-1])
+        consumer.outbound.close()
+        ChannelRegistry.unregister(GROUP, 'alice', consumer.channel_name)
+
+    async def test_restore_is_cancelled_on_disconnect(self):
+        consumer = await make_consumer(InMemoryChannelLayer(), None)
+        never = asyncio.Event()
+
+        async def load(room_name):
+            await never.wait()
+
+        with mock.patch.object(consumers.WhiteboardStore, 'load', load):
+            consumer._start_whiteboard_restore('alice')
+            task = consumer.whiteboard_restore_task
+            await asyncio.sleep(0)
+            consumer._cancel_whiteboard_restore()
+            await asyncio.sleep(0)
+        self.assertTrue(task.done())
+        self.assertIsNone(consumer.whiteboard_restore_task)
+        consumer.outbound.close()
+
+
+def ice_candidate(sender, target, index):
+    return {'type': 'ice-candidate', 'from': sender, 'to': target, 'candidate': {'candidate': f'c{index}'}}
+
+
+class IceBatchingTests(SimpleTestCase):
+    async def test_flush_interval_grows_with_room_size_up_to_ceiling(self):
+        consumer = await make_consumer(InMemoryChannelLayer(), 'alice')
+        for room_size, interval in ((2, consumers.ICE_BATCH_MIN_INTERVAL),
+                                    (10, consumers.ICE_BATCH_MIN_INTERVAL + 8 * consumers.ICE_BATCH_INTERVAL_STEP),
+                                    (1000, consumers.ICE_BATCH_MAX_INTERVAL)):
+            consumer.room_size = room_size
+            self.assertAlmostEqual(consumer._get_flush_interval(), interval)
+        consumer.outbound.close()
+
+    async def test_when_few_candidates_then_timer_sends_them_in_one_batch(self):
+        channel_layer = InMemoryChannelLayer()
+        sender = await make_consumer(channel_layer, 'alice')
+        recipient = await make_consumer(channel_layer, 'bob')
+        sender.room_size = 1000
+
+        for index in range(3):
+            await sender._send_message_internal(ice_candidate('alice', 'bob', index))
+        self.assertIsNone(await receive_or_none(channel_layer, recipient.channel_name, timeout=0.02))
+
+        event = await receive_or_none(channel_layer, recipient.channel_name, timeout=1)
+        self.assertEqual(event['type'], 'webrtc_signal_batch')
+        self.assertEqual([item['msg_type'] for item in event['messages']], ['ice-candidate'] * 3)
+        self.assertIsNone(await receive_or_none(channel_layer, recipient.channel_name))
+
+        await recipient.webrtc_signal_batch(event)
+        await asyncio.sleep(0)
+        self.assertEqual([f'"c{index}"' in text for index, text in enumerate(recipient.sent)], [True] * 3)
+        sender.outbound.close()
+        recipient.outbound.close()
+
+    async def test_when_threshold_reached_then_batch_goes_directly_without_timer(self):
+        channel_layer = InMemoryChannelLayer()
+        sender = await make_consumer(channel_layer, 'alice')
+        recipient = await make_consumer(channel_layer, 'bob')
+        ChannelRegistry.register(GROUP, 'bob', recipient.channel_name)
+        self.addCleanup(ChannelRegistry.unregister, GROUP, 'bob', recipient.channel_name)
+
+        for index in range(consumers.ICE_BATCH_FLUSH_THRESHOLD):
+            await sender._send_message_internal(ice_candidate('alice', 'bob', index))
+
+        self.assertEqual(sender.pending_messages, [])
+        event = await receive_or_none(channel_layer, recipient.channel_name)
+        self.assertEqual(len(event['messages']), consumers.ICE_BATCH_FLUSH_THRESHOLD)
+        self.assertIsNone(sender.flush_task)
+        sender.outbound.close()
+        recipient.outbound.close()
+
+    async def test_large_batch_is_split(self):
+        channel_layer = InMemoryChannelLayer()
+        sender = await make_consumer(channel_layer, 'alice')
+        recipient = await make_consumer(channel_layer, 'bob')
+        sender.pending_messages = [(ice_candidate('alice', 'bob', index), None)
+                                   for index in range(consumers.ICE_BATCH_MAX_SIZE + 1)]
+
+        await sender._flush_pending_messages(force=True)
+
+        first = await receive_or_none(channel_layer, recipient.channel_name)
+        second = await receive_or_none(channel_layer, recipient.channel_name)
+        self.assertEqual((len(first['messages']), len(second['messages'])), (consumers.ICE_BATCH_MAX_SIZE, 1))
+        sender.outbound.close()
+        recipient.outbound.close()
+
+
+class SerializeOnceTests(SimpleTestCase):
+    async def test_broadcast_is_encoded_once_and_forwarded_as_is(self):
+        channel_layer = InMemoryChannelLayer()
+        sender = await make_consumer(channel_layer, 'alice')
+        recipients = [await make_consumer(channel_layer, uid) for uid in ('bob', 'carol', 'dave')]
+
+        with mock.patch.object(consumers.codec, 'dumps', wraps=consumers.codec.dumps) as dumps:
+            await sender._send_message_internal({'type': 'camera-enabled', 'from': 'alice'})
+            for consumer in [sender, *recipients]:
+                await consumer.webrtc_signal(await receive_or_none(channel_layer, consumer.channel_name))
+            await asyncio.sleep(0)
+
+        self.assertEqual(dumps.call_count, 1)
+        self.assertEqual(sender.sent, [])
+        text = recipients[0].sent[0]
+        self.assertEqual([recipient.sent for recipient in recipients], [[text]] * 3)
+        self.assertEqual(consumers.codec.loads(text), {'type': 'camera-enabled', 'from': 'alice'})
+        for consumer in [sender, *recipients]:
+            consumer.outbound.close()
+
+    async def test_event_without_text_is_encoded_by_recipient(self):
+        recipient = await make_consumer(InMemoryChannelLayer(), 'bob')
+
+        await recipient.webrtc_signal({'type': 'webrtc_signal', 'message': {'type': 'answer', 'from': 'alice'},
+                                       'target_id': 'bob', 'sender_channel': 'other'})
+        await asyncio.sleep(0)
+
+        self.assertEqual(consumers.codec.loads(recipient.sent[0]), {'type': 'answer', 'from': 'alice', '_target': 'bob'})
+        recipient.outbound.close()
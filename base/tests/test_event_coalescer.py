@@ -0,0 +1,78 @@
+# base/tests/test_event_coalescer.py
+import asyncio
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from base import event_coalescer
+from base.event_coalescer import EventCoalescer, get_coalesce_key
+
+GROUP = 'video_call_ROOM'
+
+
+def moving(obj_id, left):
+    return {'type': 'whiteboard-object', 'data': {'eventType': 'object-moving', 'object': {'id': obj_id, 'left': left}}}
+
+
+class CoalesceKeyTests(SimpleTestCase):
+    def test_cursor_and_moving_objects_are_coalesced(self):
+        self.assertEqual(get_coalesce_key({'type': 'whiteboard-cursor', 'data': {'x': 1}}), 'cursor')
+        self.assertEqual(get_coalesce_key(moving('o1', 5)), ('object', 'o1'))
+
+    def test_other_events_are_sent_immediately(self):
+        for message in ({'type': 'offer'},
+                        {'type': 'whiteboard-object', 'data': {'eventType': 'object-modified', 'object': {'id': 'o1'}}},
+                        {'type': 'whiteboard-object', 'data': {'eventType': 'object-moving', 'object': {}}},
+                        {'type': 'whiteboard-object', 'data': None}):
+            self.assertIsNone(get_coalesce_key(message))
+
+
+class EventCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        self.channel_layer = InMemoryChannelLayer()
+        self.addCleanup(EventCoalescer.cleanup_room, GROUP)
+
+    async def receive(self, channel_name):
+        try:
+            return await asyncio.wait_for(self.channel_layer.receive(channel_name), 0.2)
+        except asyncio.TimeoutError:
+            return None
+
+    async def test_latest_state_per_sender_and_key_is_sent_in_one_batch(self):
+        channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(GROUP, channel_name)
+        for sender, key, text in (('a', 'cursor', 'a1'), ('b', 'cursor', 'b1'), ('a', ('object', 'o1'), 'o1'),
+                                  ('a', 'cursor', 'a2')):
+            EventCoalescer.add(self.channel_layer, GROUP, sender, key, {'text': text})
+
+        event = await self.receive(channel_name)
+        self.assertEqual(event['type'], 'webrtc_signal_batch')
+        self.assertEqual([item['text'] for item in event['messages']], ['a2', 'b1', 'o1'])
+        self.assertIsNone(await self.receive(channel_name))
+        self.assertNotIn(GROUP, event_coalescer.room_coalescers)
+
+    async def test_discard_drops_stale_object_state(self):
+        channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(GROUP, channel_name)
+        EventCoalescer.add(self.channel_layer, GROUP, 'a', ('object', 'o1'), {'text': 'o1'})
+        EventCoalescer.add(self.channel_layer, GROUP, 'a', ('object', 'o2'), {'text': 'o2'})
+
+        self.assertEqual(EventCoalescer.discard(GROUP, key=('object', 'o1')), 1)
+        event = await self.receive(channel_name)
+        self.assertEqual([item['text'] for item in event['messages']], ['o2'])
+
+    async def test_cleanup_cancels_pending_flush(self):
+        channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(GROUP, channel_name)
+        EventCoalescer.add(self.channel_layer, GROUP, 'a', 'cursor', {'text': 'a1'})
+        EventCoalescer.cleanup_room(GROUP)
+
+        self.assertIsNone(await self.receive(channel_name))
+        self.assertEqual(EventCoalescer.discard(GROUP), 0)
+
+    async def test_send_error_is_logged_not_raised(self):
+        channel_layer = mock.Mock(group_send=mock.AsyncMock(side_effect=RuntimeError('down')))
+        EventCoalescer.add(channel_layer, GROUP, 'a', 'cursor', {'text': 'a1'})
+        with self.assertLogs(event_coalescer.logger, 'WARNING'):
+            await event_coalescer.room_coalescers[GROUP].flush()
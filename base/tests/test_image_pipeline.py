@@ -0,0 +1,84 @@
+# base/tests/test_image_pipeline.py
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from PIL import Image
+from django.test import SimpleTestCase
+
+from base import image_pipeline
+from base.image_pipeline import ImagePipelineBusy, ImageRejected, process_image
+
+
+def image_bytes(size=(64, 48), image_format='PNG', mode='RGB', color='red', **options):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+class ProcessImageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def open(self, name):
+        return Image.open(os.path.join(self.directory, name))
+
+    def test_image_is_downscaled_to_webp_with_thumbnail(self):
+        with mock.patch.object(image_pipeline, 'IMAGE_MAX_DIMENSION', 100), \
+                mock.patch.object(image_pipeline, 'IMAGE_THUMBNAIL_DIMENSION', 20):
+            variants = process_image(image_bytes((400, 200)), self.directory, 'img')
+
+        self.assertEqual((variants['full'], variants['thumbnail']), ('img.webp', 'img.thumb.webp'))
+        self.assertEqual((variants['width'], variants['height']), (100, 50))
+        self.assertEqual(self.open('img.webp').format, 'WEBP')
+        self.assertEqual(self.open('img.thumb.webp').size, (20, 10))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['img.thumb.webp', 'img.webp'])
+
+    def test_transparency_is_kept(self):
+        process_image(image_bytes(mode='RGBA', color=(255, 0, 0, 0)), self.directory, 'img')
+        self.assertEqual(self.open('img.webp').mode, 'RGBA')
+
+    def test_animation_is_stored_as_is(self):
+        frames = [Image.new('RGB', (10, 10), color) for color in ('red', 'blue')]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:])
+
+        variants = process_image(buffer.getvalue(), self.directory, 'anim')
+        self.assertEqual(variants['full'], 'anim.gif')
+        with open(os.path.join(self.directory, 'anim.gif'), 'rb') as f:
+            self.assertEqual(f.read(), buffer.getvalue())
+
+    def test_invalid_images_are_rejected(self):
+        for data in (b'not an image', image_bytes(image_format='BMP'), image_bytes()[:60]):
+            with self.subTest(data=data[:8]), self.assertRaises(ImageRejected):
+                process_image(data, self.directory, 'img')
+
+    def test_decompression_bomb_is_rejected_before_decoding(self):
+        with mock.patch.object(image_pipeline, 'IMAGE_MAX_PIXELS', 100), self.assertRaises(ImageRejected):
+            process_image(image_bytes((20, 20)), self.directory, 'img')
+
+
+class PoolTests(SimpleTestCase):
+    def test_when_queue_is_full_then_image_is_rejected_immediately(self):
+        with mock.patch.object(image_pipeline, '_slots', threading.BoundedSemaphore(1)) as slots, \
+                mock.patch.object(image_pipeline, '_get_pool') as get_pool:
+            slots.acquire()
+            with self.assertRaises(ImagePipelineBusy):
+                image_pipeline.optimize(image_bytes(), tempfile.gettempdir())
+        get_pool.assert_not_called()
+
+    def test_broken_pool_is_recreated(self):
+        with mock.patch.object(image_pipeline, '_pool', mock.Mock()), self.assertLogs(image_pipeline.logger, 'ERROR'):
+            image_pipeline._record_error(BrokenProcessPool('worker died'))
+            self.assertIsNone(image_pipeline._pool)
+
+    def test_optimize_runs_in_worker_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            variants = image_pipeline.optimize(image_bytes(), directory, 'img')
+            self.assertEqual((variants.width, variants.height), (64, 48))
+            self.assertTrue(os.path.exists(os.path.join(directory, variants.thumbnail)))
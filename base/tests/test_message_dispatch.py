@@ -0,0 +1,53 @@
+# base/tests/test_message_dispatch.py
+from django.test import SimpleTestCase
+
+from base import consumers, message_dispatch
+from base.message_dispatch import MESSAGE_HANDLERS, dispatch_message, get_handler_spec, message_handler
+
+
+class HandlerTableTests(SimpleTestCase):
+    def test_every_valid_message_type_has_handler(self):
+        self.assertEqual(consumers.VALID_MESSAGE_TYPES - set(MESSAGE_HANDLERS), set())
+
+    def test_signaling_handlers_are_targeted(self):
+        for message_type in ('offer', 'answer'):
+            spec = get_handler_spec(message_type)
+            self.assertFalse(spec.broadcast)
+            self.assertTrue(spec.critical)
+        self.assertTrue(get_handler_spec('ice-candidate').batched)
+        self.assertTrue(get_handler_spec('whiteboard-draw').persisted)
+        self.assertIsNone(get_handler_spec('unknown'))
+
+    def test_max_size_can_depend_on_message(self):
+        spec = get_handler_spec('whiteboard-object')
+        self.assertGreater(spec.get_max_size({'data': {'object': {'src': 'data:image/png;base64,AA'}}}),
+                           spec.get_max_size({'data': {'object': {}}}))
+
+
+class DispatchTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+        @message_handler('test-ok', 'test-fail', broadcast=False)
+        async def handler(consumer, data, spec):
+            self.calls.append((consumer, data, spec.message_type))
+            if spec.message_type == 'test-fail':
+                raise RuntimeError('failed')
+
+        for message_type in ('test-ok', 'test-fail'):
+            self.addCleanup(MESSAGE_HANDLERS.pop, message_type)
+            self.addCleanup(message_dispatch.handler_stats.pop, message_type, None)
+
+    async def test_handler_is_called_and_timed(self):
+        await dispatch_message('consumer', get_handler_spec('test-ok'), {'type': 'test-ok'})
+
+        self.assertEqual(self.calls, [('consumer', {'type': 'test-ok'}, 'test-ok')])
+        stats = message_dispatch.get_handler_stats()['test-ok']
+        self.assertEqual((stats['calls'], stats['errors']), (1, 0))
+        self.assertEqual(stats['avg_time'], stats['total_time'])
+
+    async def test_handler_error_is_counted_and_raised(self):
+        with self.assertRaises(RuntimeError):
+            await dispatch_message('consumer', get_handler_spec('test-fail'), {})
+        stats = message_dispatch.get_handler_stats()['test-fail']
+        self.assertEqual((stats['calls'], stats['errors']), (1, 1))
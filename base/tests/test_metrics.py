@@ -0,0 +1,33 @@
+# base/tests/test_metrics.py
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import resolve
+
+from base import consumers, views
+from base.message_dispatch import get_handler_stats, handler_stats
+
+
+class ChangingSet:
+    """Множество, которое меняется во время каждого обхода (как WeakSet под записью из event loop)"""
+
+    def __iter__(self):
+        raise RuntimeError('Set changed size during iteration')
+
+    def __len__(self):
+        return 0
+
+
+class MetricsEndpointTests(SimpleTestCase):
+    def test_when_consumer_set_keeps_changing_then_snapshot_is_empty(self):
+        with mock.patch.object(consumers, 'active_consumers', ChangingSet()):
+            self.assertEqual(consumers._active_consumers_snapshot(), [])
+            self.assertEqual(consumers.metrics.pending_ice.snapshot()['values'], [[[], 0]])
+
+    def test_handler_stats_include_average_time(self):
+        handler_stats['test-type'].update(calls=2, total_time=0.5)
+        self.addCleanup(handler_stats.pop, 'test-type')
+        self.assertEqual(get_handler_stats()['test-type']['avg_time'], 0.25)
+
+    def test_metrics_route_has_trailing_slash(self):
+        self.assertIs(resolve('/metrics/').func, views.metrics)
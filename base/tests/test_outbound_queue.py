@@ -0,0 +1,143 @@
+# base/tests/test_outbound_queue.py
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import outbound_queue
+from base.outbound_queue import OutboundQueue, get_lane
+from base.rate_limiter import CURSOR, MEDIA_STATE, SIGNALING, WHITEBOARD
+
+
+class Client:
+    """Клиент очереди: сохраняет отправленные кадры"""
+
+    def __init__(self):
+        self.sent = []
+        self.overflows = 0
+        self.queue = OutboundQueue(self.send, self.on_overflow)
+
+    async def send(self, text):
+        self.sent.append(text)
+
+    def on_overflow(self):
+        self.overflows += 1
+
+
+class LaneTests(SimpleTestCase):
+    def test_lane_for_message_type(self):
+        self.assertEqual(get_lane('offer'), SIGNALING)
+        self.assertEqual(get_lane('camera-enabled'), MEDIA_STATE)
+        self.assertEqual(get_lane('turn-test-start'), MEDIA_STATE)
+        self.assertEqual(get_lane('whiteboard-state-chunk'), WHITEBOARD)
+        self.assertEqual(get_lane('whiteboard-cursor'), CURSOR)
+        # Кадры сервера без класса не должны теряться
+        self.assertEqual(get_lane('screen-share-state'), SIGNALING)
+        self.assertEqual(get_lane(None), SIGNALING)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    async def test_frames_are_sent_in_lane_priority_order(self):
+        client = Client()
+        client.queue.put('cursor', CURSOR, 'bob')
+        client.queue.put('board', WHITEBOARD)
+        client.queue.put('mic', MEDIA_STATE)
+        client.queue.put('offer', SIGNALING)
+        await asyncio.sleep(0)
+
+        self.assertEqual(client.sent, ['offer', 'mic', 'board', 'cursor'])
+        self.assertEqual((client.queue.depth, client.queue.pending_bytes), (0, 0))
+        client.queue.close()
+
+    async def test_cursor_lane_keeps_last_position_per_sender(self):
+        client = Client()
+        for text, sender in (('a1', 'a'), ('b1', 'b'), ('a2', 'a'), ('a3', 'a')):
+            client.queue.put(text, CURSOR, sender)
+        self.assertEqual(client.queue.depth, 2)
+        self.assertEqual(client.queue.pending_bytes, 4)
+        await asyncio.sleep(0)
+
+        self.assertEqual(client.sent, ['a3', 'b1'])
+        client.queue.close()
+
+    async def test_media_state_lane_drops_oldest(self):
+        client = Client()
+        max_len = outbound_queue.LANE_POLICIES[MEDIA_STATE][1]
+        for index in range(max_len + 5):
+            client.queue.put(str(index), MEDIA_STATE)
+        self.assertEqual(client.queue.depth, max_len)
+        await asyncio.sleep(0)
+
+        self.assertEqual(client.sent[0], '5')
+        self.assertEqual(len(client.sent), max_len)
+        client.queue.close()
+
+    async def test_signaling_and_whiteboard_are_never_dropped(self):
+        client = Client()
+        for index in range(300):
+            client.queue.put(f's{index}', SIGNALING)
+            client.queue.put(f'w{index}', WHITEBOARD)
+        await asyncio.sleep(0)
+        self.assertEqual(len(client.sent), 600)
+        client.queue.close()
+
+    async def test_when_client_is_too_far_behind_then_queue_closes_once(self):
+        client = Client()
+        with mock.patch.object(outbound_queue, 'OUTBOUND_QUEUE_MAX_MESSAGES', 3), \
+                self.assertLogs(outbound_queue.logger, 'WARNING'):
+            results = [client.queue.put(str(index), SIGNALING) for index in range(5)]
+
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertTrue(client.queue.closed)
+        self.assertEqual(client.overflows, 1)
+        self.assertEqual((client.queue.depth, client.queue.pending_bytes), (0, 0))
+        await asyncio.sleep(0)
+        self.assertEqual(client.sent, [])
+
+    async def test_byte_limit_also_closes_queue(self):
+        client = Client()
+        with mock.patch.object(outbound_queue, 'OUTBOUND_QUEUE_MAX_BYTES', 10), \
+                self.assertLogs(outbound_queue.logger, 'WARNING'):
+            self.assertTrue(client.queue.put('x' * 10, WHITEBOARD))
+            self.assertFalse(client.queue.put('x', WHITEBOARD))
+        self.assertEqual(client.overflows, 1)
+
+    async def test_wait_writable_waits_until_writer_drains(self):
+        released = asyncio.Event()
+        sent = []
+
+        async def slow_send(text):
+            await released.wait()
+            sent.append(text)
+
+        queue = OutboundQueue(slow_send, lambda: None)
+        for index in range(3):
+            queue.put('x' * 10, WHITEBOARD)
+        waiter = asyncio.create_task(queue.wait_writable(10))
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+
+        released.set()
+        self.assertTrue(await asyncio.wait_for(waiter, 1))
+        self.assertLessEqual(queue.pending_bytes, 10)
+        queue.close()
+
+    async def test_wait_writable_returns_false_when_closed(self):
+        queue = OutboundQueue(asyncio.Event().wait, lambda: None)
+        queue.put('x' * 10, WHITEBOARD)
+        queue.put('x' * 10, WHITEBOARD)
+        waiter = asyncio.create_task(queue.wait_writable(0))
+        await asyncio.sleep(0)
+        queue.close()
+        self.assertFalse(await asyncio.wait_for(waiter, 1))
+
+    async def test_send_error_stops_writer(self):
+        send = mock.AsyncMock(side_effect=RuntimeError('closed'))
+        queue = OutboundQueue(send, lambda: None)
+        queue.put('a', SIGNALING)
+        queue.put('b', SIGNALING)
+        await asyncio.sleep(0)
+
+        self.assertTrue(queue.closed)
+        send.assert_awaited_once_with('a')
+        self.assertFalse(queue.put('c', SIGNALING))
@@ -0,0 +1,67 @@
+# base/tests/test_presence.py
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from base import presence
+from base.models import RoomMember
+from base.presence import PresenceRegistry
+from base.redis_cleanup import RedisCleanup
+
+
+class PresenceRegistryTests(SimpleTestCase):
+    def test_cleanup_removes_every_presence_key(self):
+        self.assertEqual(presence._keys('ROOM'), RedisCleanup.room_keys('ROOM'))
+
+    async def test_join_touch_records_name_and_channel(self):
+        client = mock.Mock()
+        pipe = client.pipeline.return_value
+        pipe.execute = mock.AsyncMock()
+        with mock.patch.object(presence, 'get_redis', return_value=client):
+            await PresenceRegistry.touch('ROOM', 7, 'Alice', 'channel')
+
+        pipe.zadd.assert_called_once()
+        self.assertEqual(list(pipe.zadd.call_args.args[1]), ['7'])
+        pipe.hset.assert_has_calls([mock.call('presence:ROOM:names', '7', 'Alice'),
+                                    mock.call('presence:ROOM:channels', '7', 'channel')])
+        pipe.execute.assert_awaited_once()
+
+    async def test_heartbeat_touch_only_updates_last_seen(self):
+        client = mock.Mock()
+        pipe = client.pipeline.return_value
+        pipe.execute = mock.AsyncMock()
+        with mock.patch.object(presence, 'get_redis', return_value=client):
+            await PresenceRegistry.touch('ROOM', 'alice')
+        pipe.hset.assert_not_called()
+
+    def test_members_are_read_only_within_timeout(self):
+        client = mock.Mock()
+        client.zrangebyscore.return_value = ['alice', 'bob']
+        client.hmget.return_value = ['Alice', None]
+        with mock.patch.object(presence, 'get_sync_redis', return_value=client):
+            members = PresenceRegistry.get_members('ROOM')
+
+        self.assertEqual(members, [{'uid': 'alice', 'name': 'Alice'}, {'uid': 'bob', 'name': ''}])
+        key, cutoff, _ = client.zrangebyscore.call_args.args
+        self.assertEqual(key, 'presence:ROOM')
+        self.assertAlmostEqual(cutoff, time.time() - presence.PRESENCE_TIMEOUT, delta=5)
+
+
+class PresenceViewTests(TestCase):
+    def test_room_members_come_from_presence(self):
+        with mock.patch.object(PresenceRegistry, 'get_members', return_value=[{'uid': 'alice', 'name': 'Alice'}]):
+            response = self.client.get('/get_room_members/', {'room_name': 'ROOM'})
+        self.assertEqual(response.json(), {'members': [{'uid': 'alice', 'name': 'Alice'}]})
+
+    def test_when_presence_fails_then_database_is_used(self):
+        RoomMember.objects.create(name='Bob', uid='bob', room_name='ROOM')
+        RoomMember.objects.create(name='Gone', uid='gone', room_name='ROOM', insession=False)
+        with mock.patch.object(PresenceRegistry, 'get_members', side_effect=ConnectionError('down')), \
+                mock.patch.object(PresenceRegistry, 'get_member_name', side_effect=ConnectionError('down')), \
+                self.assertLogs('base.views', 'WARNING'):
+            members = self.client.get('/get_room_members/', {'room_name': 'ROOM'}).json()
+            member = self.client.get('/get_member/', {'room_name': 'ROOM', 'UID': 'bob'}).json()
+
+        self.assertEqual(members, {'members': [{'uid': 'bob', 'name': 'Bob'}]})
+        self.assertEqual(member, {'name': 'Bob'})
@@ -0,0 +1,72 @@
+# base/tests/test_rate_limiter.py
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import rate_limiter
+from base.rate_limiter import (
+    ConnectionRateLimiter, RoomRateLimiter, TokenBucket, RATE_LIMITS, CURSOR, WHITEBOARD, room_buckets
+)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_bucket_starts_full_and_refills_at_rate_up_to_capacity(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        now = bucket.updated_at
+        self.assertTrue(bucket.can_consume(5, now))
+        bucket.consume(5)
+        self.assertFalse(bucket.can_consume(1, now))
+        self.assertTrue(bucket.can_consume(1, now + 0.1))
+        self.assertFalse(bucket.can_consume(2, now + 0.1))
+        self.assertTrue(bucket.can_consume(5, now + 60))
+        self.assertEqual(bucket.tokens, 5)
+
+    def test_time_going_backwards_does_not_remove_tokens(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        bucket.consume(1)
+        self.assertTrue(bucket.can_consume(2, bucket.updated_at - 10))
+        self.assertEqual(bucket.tokens, 2)
+
+
+class ConnectionRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(rate_limiter.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_message_classes_have_separate_budgets(self):
+        limiter = ConnectionRateLimiter()
+        burst = RATE_LIMITS[CURSOR][1]
+        for _ in range(burst):
+            self.assertEqual(limiter.check('whiteboard-cursor', 10), (True, CURSOR))
+        self.assertEqual(limiter.check('whiteboard-cursor', 10), (False, CURSOR))
+        self.assertTrue(limiter.check('offer', 10)[0])
+
+    def test_rejected_message_consumes_nothing(self):
+        limiter = ConnectionRateLimiter()
+        byte_burst = RATE_LIMITS[WHITEBOARD][3]
+        self.assertFalse(limiter.check('whiteboard-draw', byte_burst + 1)[0])
+        self.assertTrue(limiter.check('whiteboard-draw', byte_burst)[0])
+
+    def test_room_rejection_does_not_spend_connection_budget(self):
+        self.addCleanup(room_buckets.clear)
+        with mock.patch.object(rate_limiter, 'ROOM_RATE_LIMIT_MESSAGES', 1):
+            limiter = ConnectionRateLimiter()
+            # Бюджет комнаты - две секунды (2 сообщения), соединения - больше
+            self.assertTrue(limiter.check('offer', 10, 'room')[0])
+            self.assertTrue(limiter.check('offer', 10, 'room')[0])
+            connection_tokens = limiter.buckets['signaling'][0].tokens
+            self.assertFalse(limiter.check('offer', 10, 'room')[0])
+            self.assertEqual(limiter.buckets['signaling'][0].tokens, connection_tokens)
+            self.assertIsNotNone(RoomRateLimiter.get_buckets('room'))
+
+    def test_can_accept_rejects_frames_beyond_every_class_budget(self):
+        limiter = ConnectionRateLimiter()
+        largest_burst = max(limits[3] for limits in RATE_LIMITS.values())
+        self.assertTrue(limiter.can_accept(largest_burst))
+        self.assertFalse(limiter.can_accept(largest_burst + 1))
+        # Проверка до разбора ничего не списывает
+        self.assertTrue(limiter.check('whiteboard-draw', RATE_LIMITS[WHITEBOARD][3])[0])
+        self.assertFalse(limiter.can_accept(RATE_LIMITS[WHITEBOARD][3]))
+        self.assertTrue(limiter.can_accept(1024))
@@ -0,0 +1,27 @@
+# base/tests/test_redis_cleanup.py
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import redis_cleanup
+from base.redis_cleanup import RedisCleanup
+from base.room_occupancy import RoomOccupancy
+
+
+class RedisCleanupTests(SimpleTestCase):
+    def test_room_keys_do_not_include_channel_layer_group(self):
+        keys = RedisCleanup.room_keys('ROOM')
+        self.assertEqual(keys, ['presence:ROOM', 'presence:ROOM:names', 'presence:ROOM:channels'])
+        self.assertFalse(any('video_call_ROOM' in key for key in keys))
+
+    async def test_guarded_unlink_runs_atomically_with_occupancy_key_first(self):
+        client = mock.Mock()
+        script = mock.AsyncMock(return_value=0)
+        client.register_script.return_value = script
+        with mock.patch.object(redis_cleanup, 'get_redis', return_value=client):
+            deleted = await RedisCleanup.unlink(['presence:ROOM'], RoomOccupancy.key('video_call_ROOM'))
+
+        self.assertEqual(deleted, 0)
+        client.unlink.assert_not_called()
+        script.assert_awaited_once_with(keys=['room_occupancy_channels:video_call_ROOM', 'presence:ROOM'])
+        self.assertIn("EXISTS', KEYS[1]", redis_cleanup.UNLINK_IF_ABSENT_SCRIPT)
@@ -0,0 +1,45 @@
+# base/tests/test_redis_pool.py
+import asyncio
+from unittest import mock
+
+import redis
+import redis.asyncio as aioredis
+from django.test import SimpleTestCase, override_settings
+
+from base import redis_pool
+
+
+@override_settings(REDIS_HOST='redis.internal', REDIS_POOL_MAX_CONNECTIONS=7, REDIS_POOL_TIMEOUT=3)
+class RedisPoolTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(redis_pool, _async_client=None, _async_client_loop=None, _sync_client=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_async_client_is_shared_within_event_loop(self):
+        client = redis_pool.get_redis()
+        self.assertIs(redis_pool.get_redis(), client)
+
+        pool = client.connection_pool
+        self.assertIsInstance(pool, aioredis.BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, 7)
+        self.assertEqual(pool.timeout, 3)
+        self.assertEqual(pool.connection_kwargs['host'], 'redis.internal')
+
+        await redis_pool.close_redis()
+        self.assertIsNone(redis_pool._async_client)
+        self.assertIsNot(redis_pool.get_redis(), client)
+
+    def test_async_client_is_recreated_for_another_loop(self):
+        async def get_client():
+            return redis_pool.get_redis()
+
+        first = asyncio.run(get_client())
+        second = asyncio.run(get_client())
+        self.assertIsNot(first, second)
+
+    def test_sync_client_uses_blocking_pool(self):
+        client = redis_pool.get_sync_redis()
+        self.assertIs(redis_pool.get_sync_redis(), client)
+        self.assertIsInstance(client.connection_pool, redis.BlockingConnectionPool)
+        self.assertEqual(client.connection_pool.max_connections, 7)
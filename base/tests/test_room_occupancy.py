@@ -0,0 +1,37 @@
+# base/tests/test_room_occupancy.py
+from unittest import mock
+
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from base import room_occupancy
+from base.room_occupancy import LeaveResult, OccupancyUnavailable, RoomOccupancy, occupancy_errors_total
+from base.tests.test_consumers import make_consumer
+
+
+def redis_down():
+    return mock.patch.object(room_occupancy, 'get_redis', side_effect=ConnectionError('redis is down'))
+
+
+class RoomOccupancyRedisErrorTests(SimpleTestCase):
+    async def test_when_redis_fails_then_admit_is_rejected_and_counted(self):
+        errors = occupancy_errors_total.values.get(('admit',), 0)
+        with redis_down(), self.assertRaises(OccupancyUnavailable):
+            await RoomOccupancy.admit('video_call_ROOM', 'alice', 2, 'channel')
+        self.assertEqual(occupancy_errors_total.values[('admit',)], errors + 1)
+
+    async def test_when_redis_fails_then_leave_reports_nothing_removed(self):
+        with redis_down():
+            self.assertEqual(await RoomOccupancy.leave('video_call_ROOM', 'alice', 'channel'),
+                             LeaveResult(False, 0, False))
+
+    async def test_when_occupancy_is_unavailable_then_join_is_closed_for_retry(self):
+        consumer = await make_consumer(InMemoryChannelLayer(), None)
+        consumer.close = mock.AsyncMock()
+        with redis_down():
+            await consumer.receive(text_data='{"type": "join", "uid": "alice", "name": "Alice"}')
+
+        consumer.close.assert_awaited_once_with(code=1011)
+        self.assertIn('temporarily unavailable', consumer.sent[0])
+        self.assertIsNone(consumer.user_uid)
+        consumer.outbound.close()
@@ -0,0 +1,81 @@
+# base/tests/test_screen_sharing_service.py
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import screen_sharing_service
+from base.screen_sharing_service import (
+    InMemoryScreenSharingBackend, RedisScreenSharingBackend, ScreenSharingService,
+)
+
+
+class ScreenSharingServiceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(screen_sharing_service, '_backend', InMemoryScreenSharingBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(screen_sharing_service.screen_sharing_state.pop, 'ROOM', None)
+        self.addCleanup(ScreenSharingService.invalidate_cache, 'ROOM')
+
+    async def test_only_one_user_shares_at_a_time(self):
+        self.assertTrue((await ScreenSharingService.start_sharing('ROOM', 'alice'))['success'])
+        result = await ScreenSharingService.start_sharing('ROOM', 'bob')
+        self.assertFalse(result['success'])
+        self.assertEqual(result['current_sharing_user'], 'alice')
+        # Переподключение того же пользователя продлевает lease
+        self.assertTrue((await ScreenSharingService.start_sharing('ROOM', 'alice'))['success'])
+
+    async def test_only_owner_stops_sharing(self):
+        await ScreenSharingService.start_sharing('ROOM', 'alice')
+        self.assertFalse((await ScreenSharingService.stop_sharing('ROOM', 'bob'))['success'])
+        self.assertTrue(await ScreenSharingService.renew_sharing('ROOM', 'alice'))
+
+        self.assertTrue((await ScreenSharingService.stop_sharing('ROOM', 'alice'))['success'])
+        self.assertFalse(await ScreenSharingService.renew_sharing('ROOM', 'alice'))
+        self.assertFalse((await ScreenSharingService.stop_sharing('ROOM', 'alice'))['success'])
+
+    async def test_state_is_cached_until_invalidated(self):
+        self.assertIsNone(await ScreenSharingService.get_sharing_user('ROOM'))
+        await screen_sharing_service._backend.acquire('ROOM', 'alice')
+        self.assertIsNone(await ScreenSharingService.get_sharing_user('ROOM'))
+
+        ScreenSharingService.invalidate_cache('ROOM')
+        self.assertEqual(await ScreenSharingService.get_sharing_user('ROOM'), 'alice')
+
+    async def test_start_and_stop_invalidate_cache(self):
+        self.assertFalse(await ScreenSharingService.is_sharing_active('ROOM'))
+        await ScreenSharingService.start_sharing('ROOM', 'alice')
+        self.assertTrue(await ScreenSharingService.is_sharing_active('ROOM'))
+        await ScreenSharingService.stop_sharing('ROOM', 'alice')
+        self.assertFalse(await ScreenSharingService.is_sharing_active('ROOM'))
+
+
+class RedisBackendTests(SimpleTestCase):
+    def backend(self, client):
+        backend = RedisScreenSharingBackend()
+        client.register_script.side_effect = lambda script: mock.AsyncMock(return_value=0)
+        patcher = mock.patch.object(screen_sharing_service, 'get_redis', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return backend
+
+    async def test_acquire_sets_lease_with_ttl(self):
+        client = mock.Mock(set=mock.AsyncMock(return_value=True))
+        self.assertIsNone(await self.backend(client).acquire('ROOM', 'alice'))
+
+        (key, value), kwargs = client.set.await_args
+        self.assertEqual(key, 'screen_sharing:ROOM')
+        self.assertTrue(value.startswith('alice|'))
+        self.assertEqual(kwargs, {'nx': True, 'px': screen_sharing_service.SCREEN_SHARING_LEASE_TTL_MS})
+
+    async def test_acquire_returns_current_owner_when_lease_is_taken(self):
+        client = mock.Mock(set=mock.AsyncMock(return_value=False),
+                           get=mock.AsyncMock(return_value='bob|2026-01-02T03:04:05'))
+        current = await self.backend(client).acquire('ROOM', 'alice')
+        self.assertEqual(current['sharing_user_uid'], 'bob')
+        self.assertEqual(current['started_at'].year, 2026)
+
+    def test_decode_tolerates_bad_timestamp(self):
+        self.assertIsNone(RedisScreenSharingBackend._decode(None))
+        self.assertEqual(RedisScreenSharingBackend._decode('alice|garbage'),
+                         {'sharing_user_uid': 'alice', 'started_at': None})
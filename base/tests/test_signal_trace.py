@@ -0,0 +1,44 @@
+# base/tests/test_signal_trace.py
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import metrics, signal_trace
+
+
+class SignalTraceTests(SimpleTestCase):
+    def test_attach_adds_trace_field(self):
+        for text in ('{"type":"offer","from":"A"}', '{"type": "offer", "from": "A"}', '{}'):
+            with self.subTest(text=text):
+                data = json.loads(signal_trace.attach(text, 1.0, 1.5, 2.0))
+                self.assertEqual(data.pop('_trace'), {'recv': 1.0, 'pub': 1.5, 'dlv': 2.0})
+                self.assertEqual(data, json.loads(text))
+
+    def test_record_observes_each_hop(self):
+        hops = signal_trace.hop_seconds.values
+        before = {key: hops[key][0][:] for key in (('receive_to_publish', 'offer'), ('publish_to_deliver', 'offer'))
+                  if key in hops}
+
+        signal_trace.record('offer', 10.0, 10.001, 10.003)
+
+        for key in (('receive_to_publish', 'offer'), ('publish_to_deliver', 'offer')):
+            counts = hops[key][0]
+            self.assertEqual(sum(counts) - sum(before.get(key, [0])), 1)
+
+    def test_record_without_receive_stamp_is_ignored(self):
+        with mock.patch.object(metrics.receive_to_deliver_seconds, 'observe') as observe:
+            signal_trace.record('offer', None, None, 1.0)
+        observe.assert_not_called()
+
+    def test_record_without_publish_stamp_records_total_only(self):
+        with mock.patch.object(metrics.receive_to_deliver_seconds, 'observe') as observe, \
+                mock.patch.object(signal_trace.hop_seconds, 'observe') as hop:
+            signal_trace.record(None, 1.0, None, 1.25)
+        observe.assert_called_once_with(0.25)
+        hop.assert_not_called()
+
+    def test_stamp_respects_switch(self):
+        with mock.patch.object(signal_trace, 'SIGNAL_TRACE_ENABLED', False):
+            self.assertIsNone(signal_trace.stamp())
+        self.assertIsInstance(signal_trace.stamp(), float)
@@ -0,0 +1,65 @@
+# base/tests/test_stroke_simplify.py
+import random
+import unittest
+
+from django.test import SimpleTestCase
+
+from base import stroke_simplify
+from base.stroke_simplify import simplify_commands, simplify_draw
+
+
+def freehand_stroke(points=300, seed=1):
+    """Штрих PencilBrush: M, команды Q по случайному блужданию, завершающая L"""
+    rng = random.Random(seed)
+    x, y = 100.0, 100.0
+    commands = [['M', x, y]]
+    for _ in range(points):
+        nx, ny = x + rng.uniform(0, 3), y + rng.uniform(-1.5, 1.5)
+        commands.append(['Q', x, y, (x + nx) / 2, (y + ny) / 2])
+        x, y = nx, ny
+    commands.append(['L', x, y])
+    return commands
+
+
+class RdpTests(SimpleTestCase):
+    def test_collinear_points_are_removed_and_corners_kept(self):
+        points = [(0, 0), (1, 0), (2, 0), (3, 0), (3, 1), (3, 2)]
+        self.assertEqual(stroke_simplify._rdp_mask_python(points, 0.5), [True, False, False, True, False, True])
+
+    def test_distance_to_chord_uses_tolerance(self):
+        points = [(0, 0), (5, 0.4), (10, 0)]
+        self.assertEqual(stroke_simplify._rdp_mask_python(points, 0.5), [True, False, True])
+        self.assertEqual(stroke_simplify._rdp_mask_python(points, 0.3), [True, True, True])
+
+    @unittest.skipIf(stroke_simplify.np is None, 'NumPy is not installed')
+    def test_numpy_and_python_masks_agree(self):
+        for seed in range(5):
+            points = [(command[-2], command[-1]) for command in freehand_stroke(seed=seed)]
+            self.assertEqual(stroke_simplify._rdp_mask_numpy(points, 0.5),
+                             stroke_simplify._rdp_mask_python(points, 0.5))
+
+
+class SimplifyCommandsTests(SimpleTestCase):
+    def test_stroke_keeps_endpoints_and_rounds_coordinates(self):
+        commands = freehand_stroke()
+        simplified = simplify_commands(commands, 0.5, decimals=2)
+
+        self.assertLess(len(simplified), len(commands))
+        self.assertEqual(simplified[0], ['M', 100.0, 100.0])
+        self.assertEqual(simplified[-1], ['L', round(commands[-1][1], 2), round(commands[-1][2], 2)])
+        for command in simplified:
+            self.assertTrue(all(value == round(value, 2) for value in command[1:]))
+
+    def test_zero_tolerance_only_rounds(self):
+        commands = [['M', 1.23456, 2.0], ['L', 3.0, 4.98765], ['L', 5.0, 6.0]]
+        self.assertEqual(simplify_commands(commands, 0, decimals=1),
+                         [['M', 1.2, 2.0], ['L', 3.0, 5.0], ['L', 5.0, 6.0]])
+
+    def test_subpaths_are_simplified_separately(self):
+        commands = [['M', 0, 0], ['L', 1, 0], ['L', 2, 0], ['M', 10, 10], ['L', 11, 10], ['L', 12, 10]]
+        self.assertEqual(simplify_commands(commands, 0.5),
+                         [['M', 0, 0], ['L', 2, 0], ['M', 10, 10], ['L', 12, 10]])
+
+    def test_malformed_path_is_returned_unchanged(self):
+        draw_data = {'path': {'path': [['M', 'x', 0], ['L', 1, 0], ['L', 2, 0]]}}
+        self.assertIs(simplify_draw(draw_data, 0.5), draw_data)
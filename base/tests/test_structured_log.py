@@ -0,0 +1,70 @@
+# base/tests/test_structured_log.py
+import io
+import json
+import logging
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import structured_log
+from base.structured_log import EventLogger, NonBlockingQueueHandler, StructuredFormatter
+
+
+def make_record(fields=None):
+    record = logging.LogRecord('videochat.signaling', logging.WARNING, __file__, 1, 'rate limit exceeded', (), None)
+    record.fields = fields
+    return record
+
+
+class FormatterTests(SimpleTestCase):
+    def test_text_format_appends_fields(self):
+        line = StructuredFormatter().format(make_record({'user': 'alice', 'size': 10}))
+        self.assertTrue(line.endswith('WARNING videochat.signaling rate limit exceeded user=alice size=10'))
+
+    def test_json_format(self):
+        data = json.loads(StructuredFormatter(json=True).format(make_record({'user': 'alice'})))
+        self.assertEqual({key: data[key] for key in ('level', 'logger', 'event', 'user')},
+                         {'level': 'WARNING', 'logger': 'videochat.signaling', 'event': 'rate limit exceeded',
+                          'user': 'alice'})
+
+
+class EventLoggerTests(SimpleTestCase):
+    def setUp(self):
+        self.event_logger = EventLogger('test')
+        self.event_logger.logger.setLevel(logging.INFO)
+        self.addCleanup(self.event_logger.logger.setLevel, logging.NOTSET)
+
+    def test_disabled_level_builds_nothing(self):
+        with mock.patch.object(self.event_logger.logger, 'log') as log:
+            self.event_logger.debug('frame', size=1)
+        log.assert_not_called()
+
+    def test_fields_are_passed_to_record(self):
+        with self.assertLogs('videochat.test', 'INFO') as logs:
+            self.event_logger.info('user joined', user='alice')
+        self.assertEqual(logs.records[0].fields, {'user': 'alice'})
+
+    def test_sampled_event_is_rate_limited_and_reports_suppressed(self):
+        now = 100.0
+        with mock.patch.object(structured_log.time, 'monotonic', side_effect=lambda: now), \
+                self.assertLogs('videochat.test', 'WARNING') as logs:
+            results = [self.event_logger.sampled(logging.WARNING, 'dropped', rate=2) for _ in range(5)]
+            now += 1
+            self.assertTrue(self.event_logger.sampled(logging.WARNING, 'dropped', rate=2))
+
+        self.assertEqual(results, [True, True, False, False, False])
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(logs.records[-1].fields, {'suppressed': 3})
+
+    def test_get_logger_returns_category_singleton(self):
+        self.assertIs(structured_log.get_logger('signaling'), structured_log.get_logger('signaling'))
+        self.assertEqual(structured_log.get_logger('signaling').logger.name, 'videochat.signaling')
+
+
+class NonBlockingQueueHandlerTests(SimpleTestCase):
+    def test_records_are_written_by_listener_thread(self):
+        stream = io.StringIO()
+        handler = NonBlockingQueueHandler(stream=stream)
+        handler.handle(make_record({'user': 'alice'}))
+        handler.close()
+        self.assertIn('rate limit exceeded user=alice', stream.getvalue())
@@ -0,0 +1,61 @@
+# base/tests/test_whiteboard_media.py
+import base64
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import image_pipeline, whiteboard_media
+from base.whiteboard_media import InlineImageError, decode_data_url, has_inline_images, offload_inline_images
+
+PNG_URL = 'data:image/png;base64,' + base64.b64encode(b'png bytes').decode()
+
+
+def saved_urls(room_name, chunks):
+    name = b''.join(chunks).decode().replace(' ', '-')
+    return f'/media/blobs/{name}.webp', f'/media/blobs/{name}_thumb.webp', None
+
+
+class DataUrlTests(SimpleTestCase):
+    def test_inline_images_are_found_in_group_members(self):
+        self.assertTrue(has_inline_images({'type': 'image', 'src': PNG_URL}))
+        self.assertTrue(has_inline_images({'type': 'group', 'objects': [{'type': 'rect'}, {'src': PNG_URL}]}))
+        self.assertFalse(has_inline_images({'type': 'image', 'src': '/media/blobs/a.webp'}))
+        self.assertFalse(has_inline_images(None))
+
+    def test_decode_data_url(self):
+        self.assertEqual(decode_data_url(PNG_URL), (b'png bytes', '.png'))
+
+    def test_unsupported_or_broken_data_url_is_rejected(self):
+        for data_url in ('data:image/svg+xml;base64,PHN2Zz4=', 'data:image/png,rawdata',
+                         'data:image/png;base64,', 'data:image/png;base64,@@@'):
+            with self.subTest(data_url=data_url), self.assertRaises(InlineImageError):
+                decode_data_url(data_url)
+
+
+class OffloadTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(whiteboard_media, 'save_room_image', side_effect=saved_urls)
+        self.save = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_data_urls_are_replaced_with_thumbnail_and_full_links(self):
+        obj = {'type': 'group', 'objects': [{'type': 'image', 'src': PNG_URL}, {'type': 'rect'}]}
+
+        self.assertEqual(offload_inline_images('ROOM', obj), 1)
+        self.assertEqual(obj['objects'][0], {'type': 'image', 'src': '/media/blobs/png-bytes_thumb.webp',
+                                             'fullSrc': '/media/blobs/png-bytes.webp'})
+        self.assertFalse(has_inline_images(obj))
+
+    def test_connection_cache_avoids_saving_same_image_twice(self):
+        saved = {}
+        offload_inline_images('ROOM', {'src': PNG_URL}, saved)
+        obj = {'src': PNG_URL}
+        offload_inline_images('ROOM', obj, saved)
+
+        self.assertEqual(self.save.call_count, 1)
+        self.assertEqual(obj['src'], '/media/blobs/png-bytes_thumb.webp')
+
+    def test_rejected_image_raises_inline_image_error(self):
+        self.save.side_effect = image_pipeline.ImageRejected('not an image')
+        with self.assertRaises(InlineImageError):
+            offload_inline_images('ROOM', {'src': PNG_URL})
@@ -0,0 +1,142 @@
+# base/tests/test_whiteboard_store.py
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from base import whiteboard_store
+from base.whiteboard_store import (
+    OP_ADD, OP_MODIFY, OP_PATH, OP_REMOVE, WhiteboardStore, decode_op, encode_op, iter_state_chunks, state_item_text,
+)
+
+
+class OperationTests(SimpleTestCase):
+    def test_encode_decode_round_trip(self):
+        for kind, item_id, data in ((OP_PATH, 'p1', '{"path":[["M",0,0]]}'),
+                                    (OP_ADD, 'идентификатор:1', '{"text":"Привет: мир"}'),
+                                    (OP_REMOVE, 'o1', ''),
+                                    (OP_MODIFY, '', '{}')):
+            with self.subTest(item_id=item_id):
+                self.assertEqual(decode_op(encode_op(kind, item_id, data)), (kind, item_id, data))
+
+    def test_id_length_is_in_bytes_for_lua(self):
+        self.assertEqual(encode_op(OP_ADD, 'я', '{}'), 'a2:я{}')
+
+    def test_state_items_are_valid_messages(self):
+        path = json.loads(state_item_text('ROOM', OP_PATH, 'p1', '{"path":[]}'))
+        self.assertEqual(path, {'type': 'whiteboard-draw', 'room': 'ROOM', 'from': 'system', 'data': {'path': []}})
+
+        for kind, event_type in ((OP_ADD, 'object-added'), (OP_MODIFY, 'object-modified')):
+            message = json.loads(state_item_text('ROOM', kind, 'o1', '{"id":"o1","left":5}'))
+            self.assertEqual(message['data'], {'eventType': event_type, 'object': {'id': 'o1', 'left': 5}})
+
+        removed = json.loads(state_item_text('ROOM', OP_REMOVE, 'o"1', ''))
+        self.assertEqual(removed['data'], {'eventType': 'object-removed', 'object': {'id': 'o"1'}})
+
+
+class LoadTests(SimpleTestCase):
+    async def load(self, version, order, data, ops):
+        client = mock.Mock()
+        client.pipeline.return_value.execute = mock.AsyncMock(return_value=[version, order, data, ops])
+        with mock.patch.object(whiteboard_store, 'get_redis', return_value=client):
+            return await WhiteboardStore.load('ROOM')
+
+    async def test_snapshot_items_follow_order(self):
+        state = await self.load('5', ['p:p1', 'o:o1', 'o:gone'], {'p:p1': '{"p":1}', 'o:o1': '{"o":1}'}, [])
+        self.assertEqual(state.items, [(OP_PATH, 'p1', '{"p":1}'), (OP_ADD, 'o1', '{"o":1}')])
+        self.assertEqual(state.version, 5)
+
+    async def test_tail_skips_changes_of_unknown_items(self):
+        ops = [encode_op(OP_MODIFY, 'o1', '{"o":2}'), encode_op(OP_MODIFY, 'missing', '{}'),
+               encode_op(OP_REMOVE, 'missing'), encode_op(OP_ADD, 'o2', '{"o":3}'),
+               encode_op(OP_REMOVE, 'p1'), encode_op(OP_REMOVE, 'p1')]
+        state = await self.load(None, ['p:p1', 'o:o1'], {'p:p1': '{}', 'o:o1': '{}'}, ops)
+
+        self.assertEqual(state.tail, [(OP_MODIFY, 'o1', '{"o":2}'), (OP_ADD, 'o2', '{"o":3}'), (OP_REMOVE, 'p1', '')])
+        # Версия считается по всем операциям хвоста, в том числе пропущенным
+        self.assertEqual(state.version, len(ops))
+
+
+class CompactionTests(SimpleTestCase):
+    async def test_long_tail_schedules_one_compaction(self):
+        client = mock.Mock()
+        client.pipeline.return_value.execute = mock.AsyncMock(
+            return_value=[whiteboard_store.WHITEBOARD_COMPACT_OPS, True, True, True, True])
+        with mock.patch.object(whiteboard_store, 'get_redis', return_value=client), \
+                mock.patch.object(WhiteboardStore, 'compact', mock.AsyncMock(return_value=0)) as compact:
+            await WhiteboardStore.add_object('ROOM', 'o1', '{}')
+            await WhiteboardStore.add_object('ROOM', 'o2', '{}')
+            await whiteboard_store._compacting['ROOM']
+
+        compact.assert_awaited_once_with('ROOM')
+        self.assertNotIn('ROOM', whiteboard_store._compacting)
+
+    async def test_compaction_runs_script_until_tail_is_folded(self):
+        client = mock.Mock()
+        script = mock.AsyncMock(side_effect=[whiteboard_store.WHITEBOARD_COMPACT_BATCH, 3])
+        client.register_script.return_value = script
+        with mock.patch.object(whiteboard_store, 'get_redis', return_value=client):
+            folded = await WhiteboardStore.compact('ROOM')
+
+        self.assertEqual(folded, whiteboard_store.WHITEBOARD_COMPACT_BATCH + 3)
+        self.assertEqual(script.await_count, 2)
+
+
+class StateChunkTests(SimpleTestCase):
+    def test_items_are_grouped_under_limit_in_order(self):
+        texts = [json.dumps({'type': 'whiteboard-draw', 'data': {'n': index}}) for index in range(10)]
+        chunks = list(iter_state_chunks('ROOM', texts, 42, max_bytes=3 * len(texts[0]) + 3))
+
+        messages = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual([message['data']['seq'] for message in messages], [0, 1, 2, 3])
+        self.assertTrue(all(message['data']['version'] == 42 for message in messages))
+        items = [item for message in messages for item in message['data']['items']]
+        self.assertEqual(items, [json.loads(text) for text in texts])
+
+    def test_large_item_is_sent_as_is_between_chunks(self):
+        large = json.dumps({'type': 'whiteboard-object', 'data': {'src': 'x' * 100}})
+        chunks = list(iter_state_chunks('ROOM', ['{"a":1}', large, '{"b":2}'], 1, max_bytes=50))
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(json.loads(chunks[0])['data']['items'], [{'a': 1}])
+        self.assertEqual(chunks[1], large)
+        self.assertEqual(json.loads(chunks[2])['data'], {'seq': 1, 'version': 1, 'items': [{'b': 2}]})
+
+    def test_empty_board_gives_no_chunks(self):
+        self.assertEqual(list(iter_state_chunks('ROOM', [], 0)), [])
+
+
+class WriteTests(SimpleTestCase):
+    async def appended(self, call):
+        client = mock.Mock()
+        pipe = client.pipeline.return_value
+        pipe.execute = mock.AsyncMock(return_value=[1, True, True, True, True])
+        with mock.patch.object(whiteboard_store, 'get_redis', return_value=client):
+            await call
+        pipe.rpush.assert_called_once()
+        key, op = pipe.rpush.call_args.args
+        self.assertEqual(key, 'whiteboard_state:ROOM:ops')
+        self.assertEqual(pipe.expire.call_count, 4)
+        return decode_op(op)
+
+    async def test_each_change_is_one_operation(self):
+        self.assertEqual(await self.appended(WhiteboardStore.add_path('ROOM', 'p1', '{"p":1}')),
+                         (OP_PATH, 'p1', '{"p":1}'))
+        self.assertEqual(await self.appended(WhiteboardStore.modify_object('ROOM', 'o1', '{"o":2}')),
+                         (OP_MODIFY, 'o1', '{"o":2}'))
+        self.assertEqual(await self.appended(WhiteboardStore.remove_object('ROOM', 'o1')), (OP_REMOVE, 'o1', ''))
+
+    async def test_items_without_id_get_generated_id(self):
+        first = await self.appended(WhiteboardStore.add_object('ROOM', None, '{}'))
+        second = await self.appended(WhiteboardStore.add_object('ROOM', None, '{}'))
+        self.assertTrue(first[1].startswith('_anon:'))
+        self.assertNotEqual(first[1], second[1])
+
+    async def test_clear_deletes_all_board_keys(self):
+        client = mock.Mock(delete=mock.AsyncMock())
+        with mock.patch.object(whiteboard_store, 'get_redis', return_value=client):
+            await WhiteboardStore.clear('ROOM')
+        keys = client.delete.await_args.args
+        self.assertIn('whiteboard_state:ROOM', keys)
+        self.assertIn('whiteboard_state:ROOM:object_order', keys)
+        self.assertIn('whiteboard_state:ROOM:ops', keys)
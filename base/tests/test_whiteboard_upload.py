@@ -0,0 +1,72 @@
+# base/tests/test_whiteboard_upload.py
+import json
+import tempfile
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import ApplicationCommunicator, HttpCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from base import whiteboard_upload
+from base.routing import http_urlpatterns
+
+PATH = '/upload_whiteboard_image/ROOM/'
+HEADERS = [(b'host', b'testserver'), (b'content-type', b'image/png')]
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], USE_X_FORWARDED_HOST=False)
+class UploadCheckTests(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        room_exists = mock.patch.object(whiteboard_upload, 'room_exists', mock.AsyncMock(return_value=True))
+        room_exists.start()
+        self.addCleanup(room_exists.stop)
+
+    async def request(self, headers=HEADERS, body=b'', method='POST'):
+        communicator = HttpCommunicator(URLRouter(http_urlpatterns), method, PATH, body=body, headers=headers)
+        response = await communicator.get_response()
+        return response['status'], json.loads(response['body'])
+
+    async def test_when_host_is_not_allowed_then_400(self):
+        status, payload = await self.request([(b'host', b'evil.example'), (b'content-type', b'image/png')])
+        self.assertEqual((status, payload), (400, {'error': 'Invalid host'}))
+
+    async def test_when_origin_is_foreign_then_403(self):
+        for origin in (b'https://evil.example', b'null'):
+            status, payload = await self.request(HEADERS + [(b'origin', origin)])
+            self.assertEqual((status, payload), (403, {'error': 'Invalid origin'}))
+
+    async def test_when_origin_is_allowed_then_checks_continue(self):
+        status, _ = await self.request(HEADERS + [(b'origin', b'https://testserver:8443')], method='GET')
+        self.assertEqual(status, 405)
+
+    async def test_when_content_type_is_not_image_then_400(self):
+        status, payload = await self.request([(b'host', b'testserver'), (b'content-type', b'text/plain')])
+        self.assertEqual((status, payload), (400, {'error': 'File is not an image'}))
+
+    async def test_when_content_length_is_too_large_then_413_before_body(self):
+        with mock.patch.object(whiteboard_upload.blob_store, 'UploadSpool') as spool:
+            status, _ = await self.request(HEADERS + [(b'content-length', b'%d' % (
+                whiteboard_upload.WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE + 1))])
+        self.assertEqual(status, 413)
+        spool.assert_not_called()
+
+    async def test_when_streamed_body_exceeds_limit_then_413(self):
+        with mock.patch.object(whiteboard_upload, 'WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE', 10):
+            communicator = ApplicationCommunicator(URLRouter(http_urlpatterns), {
+                'type': 'http', 'method': 'POST', 'path': PATH, 'headers': HEADERS})
+            await communicator.send_input({'type': 'http.request', 'body': b'x' * 6, 'more_body': True})
+            await communicator.send_input({'type': 'http.request', 'body': b'x' * 6, 'more_body': True})
+            start = await communicator.receive_output()
+        self.assertEqual(start['status'], 413)
+
+    async def test_when_save_fails_then_500_without_details(self):
+        with mock.patch.object(whiteboard_upload.blob_store, 'UploadSpool',
+                               side_effect=OSError('/srv/media/secret')), \
+                self.assertLogs(whiteboard_upload.logger, 'ERROR'):
+            status, payload = await self.request(body=b'data')
+        self.assertEqual((status, payload), (500, {'error': 'Failed to save image'}))
@@ -14,4 +14,5 @@ urlpatterns = [
     path('delete_member/', views.deleteMember),
     path('get_room_members/', views.getRoomMembers),
     path('upload_whiteboard_image/', views.upload_whiteboard_image),
+    path('metrics/', views.metrics),  # Prometheus scrape endpoint
 ]
\ No newline at end of file
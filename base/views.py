@@ -2,14 +2,19 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse, HttpResponse
 import random
 from .models import RoomMember, Room
+from .presence import PresenceRegistry
+from .whiteboard_media import (
+    room_images_dir, save_room_image, release_room_images, WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE
+)
+from . import image_pipeline
 import json
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 import os
-import uuid
-from django.conf import settings
-from pathlib import Path
 import shutil
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -84,6 +89,14 @@ def getMember(request):
     uid = request.GET.get('UID')
     room_name = request.GET.get('room_name')
 
+    # Сначала ищем в реестре присутствия (Redis), затем в базе
+    try:
+        name = PresenceRegistry.get_member_name(room_name, uid)
+        if name:
+            return JsonResponse({'name': name}, safe=False)
+    except Exception as e:
+        logger.warning(f"[Presence] Error reading member: {e}")
+
     try:
         member = RoomMember.objects.get(
             uid=uid,
@@ -109,6 +122,11 @@ def deleteMember(request):
 
 def getRoomMembers(request):
     room_name = request.GET.get('room_name')
+    # Активные участники из реестра присутствия (обновляется heartbeat'ом WebSocket соединений)
+    try:
+        return JsonResponse({'members': PresenceRegistry.get_members(room_name)}, safe=False)
+    except Exception as e:
+        logger.warning(f"[Presence] Error reading room members, falling back to database: {e}")
     try:
         members = RoomMember.objects.filter(room_name=room_name, insession=True)
         members_list = [{'uid': member.uid, 'name': member.name} for member in members]
@@ -183,66 +201,57 @@ def upload_whiteboard_image(request):
         if not image_file.content_type.startswith('image/'):
             return JsonResponse({'error': 'File is not an image'}, status=400)
         
-        # Создаем директорию для комнаты если её нет
-        room_images_dir = Path(settings.MEDIA_ROOT) / 'whiteboard' / room_name
-        room_images_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Получаем расширение файла из оригинального имени или content_type
-        original_name = image_file.name
-        file_extension = os.path.splitext(original_name)[1].lower() if original_name else '.jpg'
+        if image_file.size > WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE:
+            return JsonResponse({'error': 'Image is too large'}, status=413)
         
-        # Если расширение не определено, определяем по content_type
-        if not file_extension or file_extension == '.':
-            content_type = image_file.content_type
-            if 'jpeg' in content_type or 'jpg' in content_type:
-                file_extension = '.jpg'
-            elif 'png' in content_type:
-                file_extension = '.png'
-            elif 'gif' in content_type:
-                file_extension = '.gif'
-            elif 'webp' in content_type:
-                file_extension = '.webp'
-            else:
-                file_extension = '.jpg'  # По умолчанию JPEG
-        
-        # Генерируем уникальное имя файла с сохранением оригинального расширения
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = room_images_dir / unique_filename
-        
-        # Сохраняем файл без сжатия (изображение уже сжато на клиенте)
+        # Хэш содержимого; новое изображение - WebP и миниатюра в пуле процессов image_pipeline,
+        # повторное (в любой комнате) - ссылка на уже сохраненные варианты
         try:
-            with open(file_path, 'wb') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
-            
-            file_size = file_path.stat().st_size
-            print(f"[Whiteboard] Image saved: {unique_filename}, file size: {file_size} bytes")
-            
+            full_url, thumbnail_url, blob = save_room_image(room_name, image_file.chunks())
+            logger.info(f"[Whiteboard] Image saved: {blob.name} ({blob.width}x{blob.height}), "
+                        f"{image_file.size} -> {blob.size} bytes")
+        except image_pipeline.ImageRejected as e:
+            return JsonResponse({'error': f'Invalid image: {e}'}, status=400)
+        except image_pipeline.ImagePipelineBusy:
+            response = JsonResponse({'error': 'Image processing is busy, try again'}, status=503)
+            response['Retry-After'] = '2'
+            return response
         except Exception as e:
-            print(f"[Whiteboard] Error saving image: {e}")
-            return JsonResponse({'error': f'Failed to save image: {str(e)}'}, status=500)
-        
-        # Формируем URL для доступа к изображению
-        image_url = f"/media/whiteboard/{room_name}/{unique_filename}"
+            logger.exception(f"[Whiteboard] Error saving image: {e}")
+            return JsonResponse({'error': 'Failed to save image'}, status=500)
         
+        # Участники сначала загружают миниатюру, полный вариант - в фоне
         return JsonResponse({
             'success': True,
-            'url': image_url,
-            'filename': unique_filename
+            'url': full_url,
+            'thumbnail_url': thumbnail_url,
+            'filename': os.path.basename(blob.name),
+            'width': blob.width,
+            'height': blob.height
         })
     
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def metrics(request):
+    """Метрики сигнального сервера в формате Prometheus (сумма по всем воркерам)"""
+    from base.metrics import collect_all, render as render_metrics
+    return HttpResponse(render_metrics(collect_all()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def cleanup_room_images(room_name):
-    """Удалить все изображения комнаты"""
+    """
+    Освободить изображения комнаты: удаляются только файлы, на которые не ссылаются
+    другие комнаты и файлы обмена (blob_store), и каталог изображений прежнего формата
+    """
     try:
-        room_images_dir = Path(settings.MEDIA_ROOT) / 'whiteboard' / room_name.upper()
-        if room_images_dir.exists():
-            shutil.rmtree(room_images_dir)
+        deleted = release_room_images(room_name)
+        images_dir = room_images_dir(room_name)
+        if images_dir.exists():
+            shutil.rmtree(images_dir)
             return True
+        return deleted > 0
     except Exception as e:
         print(f"Error cleaning up room images: {e}")
-        return False
-    return False
\ No newline at end of file
+        return False
\ No newline at end of file
@@ -0,0 +1,157 @@
+# base/whiteboard_media.py
+"""
+Изображения доски.
+
+Клиент, вставивший изображение без загрузки через upload_whiteboard_image,
+присылает его в whiteboard-object как data URL (base64 в src). Такой кадр
+принимается (до WHITEBOARD_INLINE_IMAGE_MAX_SIZE) только для того, чтобы
+вынести изображение в файл: участникам пересылается и в Redis сохраняется
+объект со ссылкой /media/blobs/..., остальные кадры
+whiteboard-object ограничены обычным лимитом сообщения.
+
+Изображение проходит image_pipeline (WebP + миниатюра) и сохраняется в
+blob_store (одинаковое содержимое - один файл для всех комнат): в src объекта
+записывается миниатюра, в fullSrc - полный вариант. offload_inline_images -
+синхронная функция для run_in_executor: декодирование base64 выполняется в потоке,
+перекодирование - в пуле процессов image_pipeline.
+"""
+
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import base64
+import binascii
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+from django.conf import settings
+
+from base import blob_store, image_pipeline
+from base.models import Blob
+
+logger = logging.getLogger(__name__)
+
+# Максимальный кадр whiteboard-object с изображениями в data URL
+WHITEBOARD_INLINE_IMAGE_MAX_SIZE = int(os.environ.get('WHITEBOARD_INLINE_IMAGE_MAX_SIZE', str(10 * 1024 * 1024)))
+
+# Максимальный размер файла, загружаемого через upload_whiteboard_image
+WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE = int(os.environ.get('WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE', str(10 * 1024 * 1024)))
+
+# Форматы, которые выносятся в файл (SVG не принимается: может содержать скрипты)
+INLINE_IMAGE_TYPES = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+DATA_URL_PREFIX = 'data:image/'
+
+# Изображений в кэше вынесенных data URL одного соединения
+INLINE_IMAGE_CACHE_SIZE = 32
+
+_stats = {
+    'images': 0,
+    'reused': 0,
+    'bytes': 0,
+    'rejected': 0,
+}
+
+
+class InlineImageError(ValueError):
+    """data URL нельзя вынести в файл (неподдерживаемый формат или испорченный base64)"""
+
+
+def room_images_dir(room_name: str) -> Path:
+    """Каталог изображений комнаты прежнего формата (до blob_store)"""
+    return Path(settings.MEDIA_ROOT) / 'whiteboard' / room_name.upper()
+
+
+def _inline_fields(obj: dict) -> Iterator[Tuple[dict, str]]:
+    """(объект, поле) для строк data:image/... в объекте и во вложенных объектах группы"""
+    for key, value in obj.items():
+        if isinstance(value, str) and value.startswith(DATA_URL_PREFIX):
+            yield obj, key
+    for child in obj.get('objects') or ():
+        if isinstance(child, dict):
+            yield from _inline_fields(child)
+
+
+def has_inline_images(obj: dict) -> bool:
+    """Есть ли в объекте доски изображения в data URL"""
+    return isinstance(obj, dict) and next(_inline_fields(obj), None) is not None
+
+
+def decode_data_url(data_url: str) -> Tuple[bytes, str]:
+    """Байты изображения и заявленное расширение из data:image/<type>;base64,<data>"""
+    header, _, payload = data_url.partition(',')
+    mime_type, _, encoding = header[len('data:'):].partition(';')
+    extension = INLINE_IMAGE_TYPES.get(mime_type.lower())
+    if extension is None or encoding.lower() != 'base64' or not payload:
+        raise InlineImageError(f"unsupported data URL: {header[:64]}")
+    try:
+        return base64.b64decode(payload, validate=True), extension
+    except (binascii.Error, ValueError) as e:
+        raise InlineImageError(f"invalid base64 image: {e}") from e
+
+
+def save_room_image(room_name: str, chunks: Iterable[bytes]) -> Tuple[str, str, Blob]:
+    """Сохранить изображение комнаты, вернуть URL (полный, миниатюра) и blob"""
+    blob = blob_store.store_image(blob_store.whiteboard_owner(room_name), chunks)
+    return blob_store.media_url(blob.name), blob_store.media_url(blob.thumbnail or blob.name), blob
+
+
+def save_room_upload(room_name: str, spool: blob_store.UploadSpool) -> Tuple[str, str, Blob]:
+    """save_room_image для изображения, записанного потоковой загрузкой во временный файл"""
+    blob = blob_store.store_image_upload(blob_store.whiteboard_owner(room_name), spool)
+    return blob_store.media_url(blob.name), blob_store.media_url(blob.thumbnail or blob.name), blob
+
+
+def release_room_images(room_name: str) -> int:
+    """Освободить изображения комнаты (файлы, используемые другими владельцами, остаются)"""
+    return blob_store.release(blob_store.whiteboard_owner(room_name))
+
+
+def offload_inline_images(room_name: str, obj: dict, saved: Optional[Dict[str, Tuple[str, str]]] = None) -> int:
+    """
+    Заменить data URL изображений в объекте доски (на месте) ссылкой на миниатюру,
+    ссылку на полный вариант записать в fullSrc.
+    saved - кэш {sha1 data URL: (URL, URL миниатюры)} соединения: object-modified того же изображения
+    не создает новый файл. Возвращает количество замененных data URL.
+    Бросает InlineImageError, если изображение нельзя сохранить,
+    ImagePipelineBusy - если очередь обработки заполнена.
+    """
+    replaced = 0
+    for owner, key in list(_inline_fields(obj)):
+        data_url = owner[key]
+        digest = hashlib.sha1(data_url.encode()).hexdigest()
+        urls = saved.get(digest) if saved is not None else None
+        if urls is None:
+            try:
+                data, _ = decode_data_url(data_url)
+                urls = save_room_image(room_name, [data])[:2]
+            except image_pipeline.ImageRejected as e:
+                _stats['rejected'] += 1
+                raise InlineImageError(str(e)) from e
+            except InlineImageError:
+                _stats['rejected'] += 1
+                raise
+            _stats['images'] += 1
+            _stats['bytes'] += len(data)
+            logger.debug(f"Inline image saved for room {room_name}: {urls[0]} ({len(data)} bytes)")
+            if saved is not None:
+                if len(saved) >= INLINE_IMAGE_CACHE_SIZE:
+                    saved.clear()
+                saved[digest] = urls
+        else:
+            _stats['reused'] += 1
+        owner[key] = urls[1]
+        owner['fullSrc'] = urls[0]
+        replaced += 1
+    return replaced
+
+
+def get_stats() -> Dict[str, int]:
+    """Статистика выноса изображений на этом воркере"""
+    return dict(_stats)
@@ -0,0 +1,313 @@
+# base/whiteboard_store.py
+"""
+Хранилище состояния доски в Redis: снимок + хвост операций.
+
+- Хвост (:ops) - список операций в порядке поступления: добавление пути,
+  добавление/изменение/удаление объекта. Правка доски - один RPUSH, O(1).
+- Снимок - материализованное состояние на версии snapshot_version: hash
+  (элемент -> JSON) и sorted set с порядком элементов (z-order). Элементы -
+  пути ('p:<id>') и объекты ('o:<id>'); измененный объект хранится один раз,
+  удаленный (в том числе стертый путь) - не хранится.
+- Компакция - Lua скрипт, атомарно применяющий начало хвоста к снимку и
+  обрезающий хвост. Запускается в фоне, когда хвост длиннее WHITEBOARD_COMPACT_OPS.
+
+Новый участник получает снимок и короткий хвост, поэтому память Redis и время
+восстановления определяются текущим размером доски, а не ее историей.
+Версия состояния = snapshot_version + длина хвоста.
+"""
+
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import os
+import uuid
+
+from base import codec
+from base.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+# TTL состояния доски
+WHITEBOARD_STATE_TTL = 86400  # 24 часа
+
+# Длина хвоста операций, после которой запускается компакция
+WHITEBOARD_COMPACT_OPS = int(os.environ.get('WHITEBOARD_COMPACT_OPS', '200'))
+# Максимум операций, применяемых одним вызовом скрипта (ограничивает блокировку Redis)
+WHITEBOARD_COMPACT_BATCH = 1000
+
+# Восстановление доски: размер пакета whiteboard-state-chunk (символов JSON)
+WHITEBOARD_STATE_CHUNK_BYTES = int(os.environ.get('WHITEBOARD_STATE_CHUNK_BYTES', str(256 * 1024)))
+
+# Виды операций хвоста
+OP_PATH = 'p'
+OP_ADD = 'a'
+OP_MODIFY = 'm'
+OP_REMOVE = 'r'
+
+# KEYS[1] - хвост операций, KEYS[2] - hash элементов снимка, KEYS[3] - порядок элементов,
+# KEYS[4] - hash метаданных снимка (version, seq)
+# ARGV[1] - максимум операций, ARGV[2] - TTL
+# Операция: <вид><длина id в байтах>:<id><JSON>
+# Возвращает количество примененных операций
+COMPACT_SCRIPT = """
+local ops = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #ops == 0 then
+    return 0
+end
+local seq = tonumber(redis.call('HGET', KEYS[4], 'seq') or '0')
+for _, op in ipairs(ops) do
+    local kind = string.sub(op, 1, 1)
+    local colon = string.find(op, ':', 2, true)
+    local id_end = colon + tonumber(string.sub(op, 2, colon - 1))
+    local id = string.sub(op, colon + 1, id_end)
+    local data = string.sub(op, id_end + 1)
+    if kind == 'p' or kind == 'a' then
+        local member = (kind == 'p' and 'p:' or 'o:') .. id
+        seq = seq + 1
+        redis.call('ZADD', KEYS[3], seq, member)
+        redis.call('HSET', KEYS[2], member, data)
+    elseif kind == 'm' then
+        if redis.call('HEXISTS', KEYS[2], 'o:' .. id) == 1 then
+            redis.call('HSET', KEYS[2], 'o:' .. id, data)
+        end
+    elseif kind == 'r' then
+        redis.call('HDEL', KEYS[2], 'o:' .. id, 'p:' .. id)
+        redis.call('ZREM', KEYS[3], 'o:' .. id, 'p:' .. id)
+    end
+end
+redis.call('LTRIM', KEYS[1], #ops, -1)
+redis.call('HSET', KEYS[4], 'seq', seq)
+redis.call('HINCRBY', KEYS[4], 'version', #ops)
+for i = 1, 4 do
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return #ops
+"""
+
+_client = None
+_compact_script = None
+
+# Комнаты с запущенной компакцией и сильные ссылки на ее задачи
+_compacting: Dict[str, asyncio.Task] = {}
+
+# Счетчики компакции
+compaction_stats: Dict[str, int] = {'runs': 0, 'ops_folded': 0, 'failed': 0}
+
+
+def _get_client():
+    """Асинхронный Redis клиент (общий пул процесса) с зарегистрированными скриптами"""
+    global _client, _compact_script
+    client = get_redis()
+    if client is not _client:
+        _client = client
+        _compact_script = client.register_script(COMPACT_SCRIPT)
+    return client
+
+
+def _keys(room_name: str) -> List[str]:
+    """Ключи доски: хвост операций, элементы снимка, порядок элементов, метаданные снимка"""
+    room_key = f"whiteboard_state:{room_name}"
+    return [f"{room_key}:ops", f"{room_key}:snapshot_data", f"{room_key}:snapshot_order", f"{room_key}:snapshot_meta"]
+
+
+def encode_op(kind: str, item_id: str, data: str = '') -> str:
+    """Операция хвоста: вид, длина id в байтах, id, JSON (разбирается Lua без cjson)"""
+    return f"{kind}{len(item_id.encode('utf-8'))}:{item_id}{data}"
+
+
+def decode_op(op: str) -> Tuple[str, str, str]:
+    """Операция хвоста -> (вид, id, JSON)"""
+    colon = op.index(':', 1)
+    raw = op[colon + 1:].encode('utf-8')
+    id_end = int(op[1:colon])
+    return op[0], raw[:id_end].decode('utf-8'), raw[id_end:].decode('utf-8')
+
+
+# События объектов для операций хвоста
+_OBJECT_EVENTS = {OP_ADD: 'object-added', OP_MODIFY: 'object-modified', OP_REMOVE: 'object-removed'}
+
+
+def state_item_text(room_name: str, kind: str, item_id: str, data_json: str) -> str:
+    """
+    Сообщение восстановления доски для элемента снимка или операции хвоста.
+    JSON элемента из Redis вставляется как есть, без разбора и повторной сериализации
+    (room_name проверен ROOM_NAME_PATTERN при подключении).
+    """
+    if kind == OP_PATH:
+        return f'{{"type":"whiteboard-draw","room":"{room_name}","from":"system","data":{data_json}}}'
+    if kind == OP_REMOVE:
+        data_json = codec.dumps({"id": item_id})
+    return (f'{{"type":"whiteboard-object","room":"{room_name}","from":"system",'
+            f'"data":{{"eventType":"{_OBJECT_EVENTS[kind]}","object":{data_json}}}}}')
+
+
+def iter_state_chunks(room_name: str, texts: Iterable[str], version: int,
+                      max_bytes: int = WHITEBOARD_STATE_CHUNK_BYTES) -> Iterator[str]:
+    """
+    Сгруппировать сообщения восстановления в пакеты whiteboard-state-chunk
+    не больше max_bytes. Элемент больше лимита (изображение) отправляется
+    обычным сообщением - для клиента это тот же кадр, что при исходной отправке.
+    """
+    seq = 0
+    chunk: List[str] = []
+    size = 0
+    for text in texts:
+        if len(text) > max_bytes:
+            if chunk:
+                yield _chunk_text(room_name, seq, version, chunk)
+                seq += 1
+                chunk = []
+                size = 0
+            yield text
+            continue
+        if chunk and size + len(text) > max_bytes:
+            yield _chunk_text(room_name, seq, version, chunk)
+            seq += 1
+            chunk = []
+            size = 0
+        chunk.append(text)
+        size += len(text) + 1
+    if chunk:
+        yield _chunk_text(room_name, seq, version, chunk)
+
+
+def _chunk_text(room_name: str, seq: int, version: int, items: List[str]) -> str:
+    return (f'{{"type":"whiteboard-state-chunk","room":"{room_name}","from":"system",'
+            f'"data":{{"seq":{seq},"version":{version},"items":[{",".join(items)}]}}}}')
+
+
+class BoardState(NamedTuple):
+    """Состояние доски для нового участника"""
+    items: List[Tuple[str, str, str]]  # Снимок: [(OP_PATH или OP_ADD, id, JSON)] в порядке элементов
+    tail: List[Tuple[str, str, str]]  # Операции после снимка: [(вид, id, JSON)]
+    version: int  # Версия состояния (snapshot_version + длина хвоста)
+
+
+class WhiteboardStore:
+    """Состояние доски комнаты: снимок и хвост операций"""
+
+    @staticmethod
+    def keys(room_name: str) -> List[str]:
+        """Все ключи доски комнаты (включая ключи прежних форматов)"""
+        room_key = f"whiteboard_state:{room_name}"
+        return [
+            room_key, f"{room_key}:objects", f"{room_key}:paths",
+            f"{room_key}:object_data", f"{room_key}:object_order",
+            *_keys(room_name),
+        ]
+
+    @staticmethod
+    async def _append(room_name: str, op: str):
+        """Добавить операцию в хвост; длинный хвост сворачивается в снимок в фоне"""
+        keys = _keys(room_name)
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.rpush(keys[0], op)
+        for key in keys:
+            pipe.expire(key, WHITEBOARD_STATE_TTL)
+        tail_length = (await pipe.execute())[0]
+        if tail_length >= WHITEBOARD_COMPACT_OPS:
+            WhiteboardStore.schedule_compaction(room_name)
+
+    @staticmethod
+    async def add_path(room_name: str, path_id: Optional[str], path_json: str):
+        """Добавить путь рисования (путь без id сохраняется под сгенерированным id)"""
+        await WhiteboardStore._append(room_name, encode_op(OP_PATH, path_id or f"_anon:{uuid.uuid4().hex}", path_json))
+
+    @staticmethod
+    async def add_object(room_name: str, obj_id: Optional[str], obj_json: str):
+        """
+        Добавить объект поверх остальных.
+        Объект без id сохраняется под сгенерированным id (изменить его нельзя).
+        """
+        await WhiteboardStore._append(room_name, encode_op(OP_ADD, obj_id or f"_anon:{uuid.uuid4().hex}", obj_json))
+
+    @staticmethod
+    async def modify_object(room_name: str, obj_id: str, obj_json: str):
+        """Заменить объект на его месте (объект, удаленный раньше, не воскрешается)"""
+        await WhiteboardStore._append(room_name, encode_op(OP_MODIFY, obj_id, obj_json))
+
+    @staticmethod
+    async def remove_object(room_name: str, obj_id: str):
+        """Удалить объект или стертый путь с этим id"""
+        await WhiteboardStore._append(room_name, encode_op(OP_REMOVE, obj_id))
+
+    @staticmethod
+    async def clear(room_name: str):
+        """Удалить состояние доски (одна команда на все ключи)"""
+        await get_redis().delete(*WhiteboardStore.keys(room_name))
+
+    @staticmethod
+    async def compact(room_name: str) -> int:
+        """
+        Свернуть хвост операций в снимок.
+
+        Returns:
+            Количество примененных операций
+        """
+        _get_client()
+        keys = _keys(room_name)
+        folded = 0
+        while True:
+            count = int(await _compact_script(keys=keys, args=[WHITEBOARD_COMPACT_BATCH, WHITEBOARD_STATE_TTL]))
+            folded += count
+            if count < WHITEBOARD_COMPACT_BATCH:
+                break
+        compaction_stats['runs'] += 1
+        compaction_stats['ops_folded'] += folded
+        return folded
+
+    @staticmethod
+    def schedule_compaction(room_name: str):
+        """Запустить компакцию комнаты в фоне (одна задача на комнату в процессе)"""
+        task = _compacting.get(room_name)
+        if task is not None and not task.done():
+            return
+        _compacting[room_name] = asyncio.create_task(WhiteboardStore._run_compaction(room_name))
+
+    @staticmethod
+    async def _run_compaction(room_name: str):
+        try:
+            folded = await WhiteboardStore.compact(room_name)
+            logger.debug(f'[Whiteboard] Compacted {folded} ops in {room_name}')
+        except Exception as e:
+            compaction_stats['failed'] += 1
+            logger.warning(f'[Whiteboard] Compaction failed for {room_name}: {e}')
+        finally:
+            _compacting.pop(room_name, None)
+
+    @staticmethod
+    async def load(room_name: str) -> BoardState:
+        """Прочитать снимок и хвост одной транзакцией"""
+        ops_key, data_key, order_key, meta_key = _keys(room_name)
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.hget(meta_key, 'version')
+        pipe.zrange(order_key, 0, -1)
+        pipe.hgetall(data_key)
+        pipe.lrange(ops_key, 0, -1)
+        version, order, data, ops = await pipe.execute()
+        items = [
+            (OP_PATH if member.startswith('p:') else OP_ADD, member[2:], data[member])
+            for member in order if member in data
+        ]
+        # Изменения и удаления отсутствующих элементов компакция пропускает - клиенту их тоже не шлем
+        known = {(kind == OP_PATH, item_id) for kind, item_id, _ in items}
+        tail = []
+        for op in ops:
+            kind, item_id, data_json = decode_op(op)
+            if kind in (OP_PATH, OP_ADD):
+                known.add((kind == OP_PATH, item_id))
+            elif kind == OP_MODIFY:
+                if (False, item_id) not in known:
+                    continue
+            elif (False, item_id) in known or (True, item_id) in known:
+                known.discard((False, item_id))
+                known.discard((True, item_id))
+            else:
+                continue
+            tail.append((kind, item_id, data_json))
+        return BoardState(items, tail, int(version or 0) + len(ops))
+
+    @staticmethod
+    def get_stats() -> Dict[str, int]:
+        """Счетчики компакции"""
+        return dict(compaction_stats, running=len(_compacting))
@@ -0,0 +1,252 @@
+# base/whiteboard_upload.py
+"""
+Потоковая загрузка изображений доски: POST /upload_whiteboard_image/<КОМНАТА>/.
+
+Тело запроса - само изображение (Content-Type: image/*), без multipart.
+views.upload_whiteboard_image - sync view: под ASGI он выполняется в одном общем
+thread-sensitive потоке вместе со всеми остальными sync views, и большая загрузка
+задерживает их все. Здесь загрузка обрабатывается AsyncHttpConsumer на event loop:
+- комната проверяется по кэшу воркера (ROOM_CACHE_TTL), запрос к БД - только при
+  промахе и не в thread-sensitive потоке;
+- Host и Origin проверяются по ALLOWED_HOSTS (Django middleware не выполняется);
+- Content-Length больше WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE отклоняется (413) до чтения
+  тела; лимит проверяется и по мере получения частей (без Content-Length, chunked);
+- части тела пишутся во временный файл (blob_store.UploadSpool) в пуле потоков
+  порциями до UPLOAD_WRITE_BUFFER байт, следующая часть принимается после записи -
+  в памяти держится не больше одной порции;
+- обработка (image_pipeline) и запись в blob_store - в пуле потоков, файлы
+  вариантов переименовываются на место атомарно.
+
+Ответ совпадает с upload_whiteboard_image.
+"""
+
+from typing import Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
+from django.conf import settings
+from django.http.request import split_domain_port, validate_host
+
+from base import blob_store, image_pipeline
+from base.models import Room
+from base.whiteboard_media import WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE, save_room_upload
+
+logger = logging.getLogger(__name__)
+
+# Время жизни записи кэша комнат (секунды); отсутствующая комната кэшируется
+# ненадолго - ее могут создать сразу после ошибки
+ROOM_CACHE_TTL = float(os.environ.get('WHITEBOARD_UPLOAD_ROOM_CACHE_TTL', '60'))
+ROOM_CACHE_MISS_TTL = 5.0
+ROOM_CACHE_SIZE = 1024
+
+# Части тела копятся в памяти до этого размера и записываются на диск одним вызовом
+UPLOAD_WRITE_BUFFER = 256 * 1024
+
+_room_cache: Dict[str, Tuple[bool, float]] = {}
+
+_stats = {
+    'uploads': 0,
+    'bytes': 0,
+    'too_large': 0,
+    'room_not_found': 0,
+    'rejected': 0,
+    'busy': 0,
+    'failed': 0,
+    'aborted': 0,
+    'room_cache_hits': 0,
+    'room_cache_misses': 0,
+}
+
+
+class UploadRejected(Exception):
+    """Загрузка отклонена: ответ с кодом status и текстом ошибки"""
+
+    def __init__(self, status: int, error: str):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+
+
+def _allowed_hosts():
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return allowed_hosts
+
+
+def _load_room_exists(room_name: str) -> bool:
+    return Room.objects.filter(name=room_name, is_active=True).exists()
+
+
+async def room_exists(room_name: str) -> bool:
+    """Есть ли активная комната (кэшируется на воркере)"""
+    now = time.monotonic()
+    cached = _room_cache.get(room_name)
+    if cached and cached[1] > now:
+        _stats['room_cache_hits'] += 1
+        return cached[0]
+    _stats['room_cache_misses'] += 1
+    exists = await database_sync_to_async(_load_room_exists, thread_sensitive=False)(room_name)
+    if len(_room_cache) >= ROOM_CACHE_SIZE:
+        _room_cache.clear()
+    _room_cache[room_name] = (exists, now + (ROOM_CACHE_TTL if exists else ROOM_CACHE_MISS_TTL))
+    return exists
+
+
+async def _run_io(func, *args):
+    """Файловая операция в пуле потоков (не в event loop)"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+class WhiteboardImageUploadConsumer(AsyncHttpConsumer):
+    """Загрузка изображения доски потоком во временный файл"""
+
+    # Сообщения групп не нужны: без канального слоя запрос не создает канал в Redis
+    channel_layer_alias = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.room_name = ''
+        self.spool: Optional[blob_store.UploadSpool] = None
+        self.pending = []
+        self.pending_size = 0
+        self.received = 0
+
+    def _header(self, name: bytes) -> str:
+        for key, value in self.scope.get('headers', ()):
+            if key.lower() == name:
+                return value.decode('latin1')
+        return ''
+
+    def _host_allowed(self) -> bool:
+        """
+        Проверка Host по ALLOWED_HOSTS, как HttpRequest.get_host: запрос не проходит
+        через Django middleware, которое обычно ее выполняет.
+        """
+        host = settings.USE_X_FORWARDED_HOST and self._header(b'x-forwarded-host') or self._header(b'host')
+        if not host:
+            server = self.scope.get('server')
+            host = server[0] if server else ''
+        domain, _ = split_domain_port(host)
+        return bool(domain) and validate_host(domain, _allowed_hosts())
+
+    def _origin_allowed(self) -> bool:
+        """
+        Проверка Origin по ALLOWED_HOSTS, как AllowedHostsOriginValidator у WebSocket:
+        CSRF middleware сюда не доходит, а браузер отправляет Origin с каждым
+        POST из fetch. Запросы без Origin (не из браузера) пропускаются.
+        """
+        origin = self._header(b'origin')
+        if not origin:
+            return True
+        parsed = urlparse(origin)
+        # 'null' - sandbox iframe или file://
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            return False
+        return validate_host(parsed.hostname, _allowed_hosts())
+
+    async def _check_request(self):
+        """Проверки до чтения тела: хост, метод, тип, заявленный размер, комната"""
+        if not self._host_allowed():
+            raise UploadRejected(400, 'Invalid host')
+        if not self._origin_allowed():
+            raise UploadRejected(403, 'Invalid origin')
+        if self.scope['method'] != 'POST':
+            raise UploadRejected(405, 'Method not allowed')
+        self.room_name = self.scope['url_route']['kwargs']['room_name'].upper()
+        if not self._header(b'content-type').lower().startswith('image/'):
+            raise UploadRejected(400, 'File is not an image')
+        content_length = self._header(b'content-length')
+        if content_length.isdigit() and int(content_length) > WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE:
+            _stats['too_large'] += 1
+            raise UploadRejected(413, 'Image is too large')
+        if not await room_exists(self.room_name):
+            _stats['room_not_found'] += 1
+            raise UploadRejected(404, 'Room not found')
+
+    async def _flush(self):
+        if self.pending:
+            data = b''.join(self.pending)
+            self.pending, self.pending_size = [], 0
+            await _run_io(self.spool.write, data)
+
+    async def _save(self) -> Dict:
+        try:
+            full_url, thumbnail_url, blob = await database_sync_to_async(save_room_upload, thread_sensitive=False)(
+                self.room_name, self.spool)
+        except image_pipeline.ImageRejected as e:
+            _stats['rejected'] += 1
+            raise UploadRejected(400, f'Invalid image: {e}') from e
+        except image_pipeline.ImagePipelineBusy as e:
+            _stats['busy'] += 1
+            raise UploadRejected(503, 'Image processing is busy, try again') from e
+        _stats['uploads'] += 1
+        _stats['bytes'] += self.received
+        logger.info(f"[WhiteboardUpload] Image saved for room {self.room_name}: {blob.name} "
+                    f"({blob.width}x{blob.height}), {self.received} -> {blob.size} bytes")
+        # Участники сначала загружают миниатюру, полный вариант - в фоне
+        return {
+            'success': True,
+            'url': full_url,
+            'thumbnail_url': thumbnail_url,
+            'filename': os.path.basename(blob.name),
+            'width': blob.width,
+            'height': blob.height,
+        }
+
+    async def http_request(self, message):
+        try:
+            if self.spool is None:
+                await self._check_request()
+                self.spool = await _run_io(blob_store.UploadSpool)
+            chunk = message.get('body', b'')
+            self.received += len(chunk)
+            if self.received > WHITEBOARD_IMAGE_MAX_UPLOAD_SIZE:
+                _stats['too_large'] += 1
+                raise UploadRejected(413, 'Image is too large')
+            if chunk:
+                self.pending.append(chunk)
+                self.pending_size += len(chunk)
+                if self.pending_size >= UPLOAD_WRITE_BUFFER:
+                    await self._flush()
+            if message.get('more_body'):
+                return
+            await self._flush()
+            status, payload = 200, await self._save()
+        except UploadRejected as e:
+            status, payload = e.status, {'error': e.error}
+        except Exception as e:
+            _stats['failed'] += 1
+            logger.exception(f"[WhiteboardUpload] Error saving image for room {self.room_name}: {e}")
+            status, payload = 500, {'error': 'Failed to save image'}
+
+        await self.disconnect()
+        headers = [(b'Content-Type', b'application/json')]
+        if status == 503:
+            headers.append((b'Retry-After', b'2'))
+        await self.send_response(status, json.dumps(payload).encode(), headers=headers)
+        raise StopConsumer()
+
+    async def http_disconnect(self, message):
+        if self.spool is not None:
+            _stats['aborted'] += 1
+        await super().http_disconnect(message)
+
+    async def disconnect(self):
+        """Удалить временный файл (после сохранения - уже удален blob_store)"""
+        spool, self.spool = self.spool, None
+        self.pending = []
+        if spool is not None and spool.path is not None:
+            await _run_io(spool.discard)
+
+
+def get_stats() -> Dict[str, int]:
+    """Статистика потоковых загрузок на этом воркере"""
+    return dict(_stats)
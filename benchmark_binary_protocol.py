@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark бинарного протокола сигнализации (vc.msgpack.v2) против JSON.
+На наборе сообщений из benchmark_json_codec.py показывает размер кадра
+и CPU время (разбор входящего + сериализация исходящего) для обоих протоколов.
+
+Запуск: python benchmark_binary_protocol.py [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_json_codec import build_message_mix
+from base import codec, binary_protocol
+
+
+def bench(func, iterations):
+    """CPU время (мкс) на один вызов"""
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary signaling protocol benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    mix = build_message_mix()
+    total_weight = sum(weight for _, weight, _ in mix)
+    print(f"JSON codec: {codec.BACKEND}")
+    print(f"\n{'message':<20}{'json B':>10}{'msgpack B':>12}{'saved':>8}{'json us':>10}{'msgpack us':>12}")
+    print("-" * 72)
+    weighted = {"json_bytes": 0.0, "msgpack_bytes": 0.0, "json_us": 0.0, "msgpack_us": 0.0}
+    for name, weight, message in mix:
+        text = codec.dumps(message)
+        frame = binary_protocol.pack(message)
+        # Большие сообщения редкие - меньше итераций
+        iterations = max(20, args.iterations * 1024 // max(len(text), 1024))
+        json_us = bench(lambda: codec.dumps(codec.loads(text)), iterations)
+        msgpack_us = bench(lambda: binary_protocol.pack(binary_protocol.unpack(frame)), iterations)
+        json_bytes = len(text.encode("utf-8"))
+        saved = (1 - len(frame) / json_bytes) * 100
+        print(f"{name:<20}{json_bytes:>10}{len(frame):>12}{saved:>7.0f}%{json_us:>10.1f}{msgpack_us:>12.1f}")
+        share = weight / total_weight
+        weighted["json_bytes"] += json_bytes * share
+        weighted["msgpack_bytes"] += len(frame) * share
+        weighted["json_us"] += json_us * share
+        weighted["msgpack_us"] += msgpack_us * share
+
+    print("-" * 72)
+    print(f"{'weighted mix':<20}{weighted['json_bytes']:>10.0f}{weighted['msgpack_bytes']:>12.0f}"
+          f"{(1 - weighted['msgpack_bytes'] / weighted['json_bytes']) * 100:>7.0f}%"
+          f"{weighted['json_us']:>10.1f}{weighted['msgpack_us']:>12.1f}")
+
+    # Без учета изображений (их base64 в обоих протоколах одинаков)
+    signaling = [(name, weight, message) for name, weight, message in mix if name != "whiteboard-object"]
+    sig_weight = sum(weight for _, weight, _ in signaling)
+    json_avg = sum(len(codec.dumps(m).encode("utf-8")) * w for _, w, m in signaling) / sig_weight
+    msgpack_avg = sum(len(binary_protocol.pack(m)) * w for _, w, m in signaling) / sig_weight
+    print(f"signaling + paths: {json_avg:.0f} B -> {msgpack_avg:.0f} B per message "
+          f"({(1 - msgpack_avg / json_avg) * 100:.0f}% less on the wire)")
+
+    # Перекодирование для бинарного клиента на стороне получателя (с кэшем и без)
+    ice_text = codec.dumps(next(m for name, _, m in mix if name == "ice-candidate"))
+    cached_us = bench(lambda: binary_protocol.text_to_frame(ice_text), args.iterations * 10)
+    uncached_us = bench(lambda: binary_protocol.pack(codec.loads(ice_text)), args.iterations * 10)
+    print(f"receiver transcode (ice-candidate): {uncached_us:.2f}us, cached {cached_us:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON кодеков для сигнального сервера.
+Сравнивает json / ujson / orjson на типичном наборе сообщений VideoCallConsumer
+и показывает CPU время на одно сообщение (разбор входящего + сериализация исходящего).
+
+Запуск: python benchmark_json_codec.py [--iterations 2000]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import time
+
+# Набор сообщений: (имя, вес в потоке, сообщение)
+def build_message_mix():
+    random.seed(42)
+    sdp = "\r\n".join(
+        f"a=candidate:{i} 1 udp 2122260223 192.168.1.{i % 255} {50000 + i} typ host generation 0"
+        for i in range(40)
+    ) + "\r\n" + "a=rtpmap:111 opus/48000/2\r\n" * 30
+    ice = {
+        "type": "ice-candidate", "from": "user_a", "to": "user_b",
+        "candidate": {
+            "candidate": "candidate:842163049 1 udp 1677729535 93.184.216.34 54321 typ srflx raddr 0.0.0.0 rport 0",
+            "sdpMLineIndex": 0, "sdpMid": "0",
+        },
+    }
+    path = [["M", 10.5, 20.25]] + [
+        ["Q", random.uniform(0, 1920), random.uniform(0, 1080), random.uniform(0, 1920), random.uniform(0, 1080)]
+        for _ in range(300)
+    ]
+    image_src = "data:image/jpeg;base64," + base64.b64encode(os.urandom(300 * 1024)).decode()
+    return [
+        ("offer", 2, {"type": "offer", "from": "user_a", "to": "user_b", "offer": {"type": "offer", "sdp": sdp}}),
+        ("answer", 2, {"type": "answer", "from": "user_b", "to": "user_a", "answer": {"type": "answer", "sdp": sdp}}),
+        ("ice-candidate", 40, ice),
+        ("mic-active", 10, {"type": "mic-active", "from": "user_a", "room": "ROOM"}),
+        ("whiteboard-cursor", 30, {"type": "whiteboard-cursor", "from": "user_a", "data": {"x": 512.5, "y": 300.25}}),
+        ("whiteboard-draw", 5, {"type": "whiteboard-draw", "from": "user_a", "data": {
+            "id": "path_1", "eventType": "path-created", "path": path, "stroke": "#000000", "strokeWidth": 3}}),
+        ("whiteboard-object", 1, {"type": "whiteboard-object", "from": "user_a", "data": {
+            "eventType": "object-added", "object": {"id": "img_1", "type": "image", "left": 100, "top": 100,
+                                                    "src": image_src}}}),
+    ]
+
+
+def get_backends():
+    backends = [("json", json.loads, json.dumps)]
+    try:
+        import ujson
+        backends.append(("ujson", ujson.loads, lambda obj: ujson.dumps(obj, ensure_ascii=False)))
+    except ImportError:
+        print("ujson не установлен - пропускаем")
+    try:
+        import orjson
+        backends.append(("orjson", orjson.loads, lambda obj: orjson.dumps(obj).decode("utf-8")))
+    except ImportError:
+        print("orjson не установлен - пропускаем")
+    return backends
+
+
+def bench(loads, dumps, text, iterations):
+    """CPU время (мкс) на один цикл: разбор входящего кадра + сериализация исходящего"""
+    start = time.process_time()
+    for _ in range(iterations):
+        dumps(loads(text))
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON codec benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    mix = build_message_mix()
+    backends = get_backends()
+    total_weight = sum(weight for _, weight, _ in mix)
+
+    print(f"\n{'message':<20}{'size':>10}" + "".join(f"{name:>12}" for name, _, _ in backends))
+    print("-" * (30 + 12 * len(backends)))
+    weighted = {name: 0.0 for name, _, _ in backends}
+    for msg_name, weight, message in mix:
+        text = json.dumps(message)
+        # Большие сообщения редкие - меньше итераций
+        iterations = max(20, args.iterations * 1024 // max(len(text), 1024))
+        row = f"{msg_name:<20}{len(text):>10}"
+        for name, loads, dumps in backends:
+            us = bench(loads, dumps, text, iterations)
+            weighted[name] += us * weight / total_weight
+            row += f"{us:>10.1f}us"
+        print(row)
+
+    print("-" * (30 + 12 * len(backends)))
+    baseline = weighted["json"]
+    print(f"{'weighted mix':<30}" + "".join(f"{weighted[name]:>10.1f}us" for name, _, _ in backends))
+    for name, _, _ in backends[1:]:
+        saved = baseline - weighted[name]
+        print(f"{name}: {saved:.1f}us CPU saved per message ({saved / baseline * 100:.0f}% vs json)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark логирования горячего пути: перетаскивание изображения на доске.
+Сравнивает время event loop, которое уходит на логирование одного события:
+- print: прежние строки '[Whiteboard] 📤 Forwarding' / '📥 Received' с src_preview;
+- structured (INFO): категория whiteboard на уровне INFO, DEBUG записи не строятся;
+- structured (DEBUG, sampled): DEBUG включен, sampling + NonBlockingQueueHandler.
+
+Вывод пишется в файл с построчной буферизацией (как stdout под systemd/supervisor).
+
+Запуск: python benchmark_logging.py [--events 20000] [--output /tmp/benchmark_logging.log]
+"""
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from base.structured_log import NonBlockingQueueHandler, get_logger, sampling_stats
+
+
+def build_drag_events(count):
+    """События object-modified для изображения (каждое несет src целиком)"""
+    src = "data:image/jpeg;base64," + base64.b64encode(os.urandom(200 * 1024)).decode()
+    return [
+        {"type": "whiteboard-object", "from": "user_a", "data": {
+            "eventType": "object-modified",
+            "object": {"id": "img_1", "type": "image", "left": i % 1920, "top": i % 1080, "src": src}}}
+        for i in range(count)
+    ]
+
+
+def log_with_print(message, stream):
+    """Прежний путь: две строки print на событие"""
+    event_data = message.get("data", {})
+    event_type = event_data.get("eventType")
+    obj_data = event_data.get("object", {})
+    for direction in ("📤 Forwarding", "📥 Received"):
+        obj_type = obj_data.get('type', 'unknown')
+        obj_id = obj_data.get('id', 'no-id')
+        has_src = 'src' in obj_data
+        src_length = len(obj_data.get('src', '')) if has_src else 0
+        src_preview = obj_data.get('src', '')[:100] if has_src else ''
+        print(f"[Whiteboard] {direction} {event_type}: type={obj_type}, id={obj_id}, has_src={has_src}, "
+              f"src_length={src_length}, src_preview={src_preview}", file=stream)
+
+
+def log_structured(message, log):
+    """Новый путь: поля собираются, только если DEBUG включен; запись с sampling"""
+    if log.isEnabledFor(logging.DEBUG):
+        obj_data = message["data"].get("object", {})
+        src = obj_data.get('src') or ''
+        log.sampled(logging.DEBUG, 'forwarding object', event_type=message["data"].get("eventType"),
+                    obj_type=obj_data.get('type', 'unknown'), obj_id=obj_data.get('id', 'no-id'),
+                    src_length=len(src), src_preview=src[:100])
+        log.sampled(logging.DEBUG, 'received object-modified',
+                    obj_type=obj_data.get('type', 'unknown'), obj_id=obj_data.get('id', 'no-id'))
+
+
+async def run(events, func, *args):
+    """Время event loop (мкс) на одно событие; между событиями loop отдает управление"""
+    busy = 0.0
+    for message in events:
+        start = time.perf_counter()
+        func(message, *args)
+        busy += time.perf_counter() - start
+        await asyncio.sleep(0)
+    return busy / len(events) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path logging benchmark")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--output", default="/tmp/benchmark_logging.log")
+    args = parser.parse_args()
+
+    events = build_drag_events(args.events)
+    stream = open(args.output, "w", buffering=1, encoding="utf-8")
+
+    handler = NonBlockingQueueHandler(stream=stream)
+    base_logger = logging.getLogger("videochat")
+    base_logger.addHandler(handler)
+    base_logger.propagate = False
+    log = get_logger("whiteboard")
+
+    print_us = asyncio.run(run(events, log_with_print, stream))
+
+    log.logger.setLevel(logging.INFO)
+    info_us = asyncio.run(run(events, log_structured, log))
+
+    log.logger.setLevel(logging.DEBUG)
+    debug_us = asyncio.run(run(events, log_structured, log))
+    handler.close()
+    stream.close()
+
+    total_s = lambda us: us * args.events / 1e6
+    print(f"\n{args.events} drag events, 2 log lines per event in the old code")
+    print(f"{'mode':<28}{'us/event':>10}{'loop time':>12}")
+    print("-" * 50)
+    print(f"{'print':<28}{print_us:>10.2f}{total_s(print_us):>11.3f}s")
+    print(f"{'structured (INFO)':<28}{info_us:>10.2f}{total_s(info_us):>11.3f}s")
+    print(f"{'structured (DEBUG, sampled)':<28}{debug_us:>10.2f}{total_s(debug_us):>11.3f}s")
+    print("-" * 50)
+    print(f"event loop time recovered: {(1 - info_us / print_us) * 100:.1f}% at INFO, "
+          f"{(1 - debug_us / print_us) * 100:.1f}% with DEBUG sampling "
+          f"({sampling_stats['logged']} logged, {sampling_stats['suppressed']} suppressed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark упрощения штрихов доски (base/stroke_simplify.py).
+
+Для каждого допуска выводит:
+- количество команд пути до/после;
+- размер сохраняемых JSON штрихов до/после (то, что лежит в Redis и отдается
+  новому участнику);
+- максимальное отклонение исходных точек от упрощенной ломаной, px (RDP гарантирует
+  не больше допуска; многоподпутевые штрихи считаются одним подпутем);
+- время упрощения на штрих (NumPy и чистый Python, если NumPy установлен).
+
+Источник штрихов:
+- --room NAME: записанная доска комнаты из Redis (WhiteboardStore.load);
+- --file dump.json: JSON список сообщений whiteboard-draw или их data;
+- по умолчанию - синтетические штрихи PencilBrush (точка на каждое событие мыши
+  с шагом 1-4px и дрожанием руки, координаты с полной точностью float).
+
+Запуск: python benchmark_stroke_simplify.py [--room NAME | --file dump.json]
+        [--strokes 2000] [--tolerances 0.25,0.5,1]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from base import codec, stroke_simplify  # noqa: E402
+from base.whiteboard_store import OP_PATH, WhiteboardStore  # noqa: E402
+
+
+def synthetic_stroke(rng):
+    """Штрих PencilBrush: M, Q (контроль - предыдущая точка, конец - середина отрезка), L"""
+    x, y = rng.uniform(100, 1800), rng.uniform(100, 1000)
+    heading = rng.uniform(0, 2 * math.pi)
+    turn = rng.uniform(-0.05, 0.05)
+    points = []
+    for _ in range(rng.randint(40, 900)):
+        step = rng.uniform(1, 4)
+        turn += rng.uniform(-0.02, 0.02)
+        heading += turn
+        x += step * math.cos(heading) + rng.gauss(0, 0.2)
+        y += step * math.sin(heading) + rng.gauss(0, 0.2)
+        points.append((x, y))
+    commands = [["M", points[0][0], points[0][1]]]
+    for (px, py), (nx, ny) in zip(points, points[1:]):
+        commands.append(["Q", px, py, (px + nx) / 2, (py + ny) / 2])
+    commands.append(["L", points[-1][0], points[-1][1]])
+    return {
+        "eventType": "path-created",
+        "path": {"type": "path", "id": f"path_{rng.random()}", "stroke": "#000000", "strokeWidth": 3,
+                 "fill": None, "left": points[0][0], "top": points[0][1], "path": commands},
+    }
+
+
+def load_file(path):
+    with open(path) as f:
+        messages = json.load(f)
+    return [message.get('data', message) if message.get('type') == 'whiteboard-draw' else message
+            for message in messages]
+
+
+async def load_room(room_name):
+    state = await WhiteboardStore.load(room_name)
+    return [json.loads(data_json) for kind, _, data_json in state.items + state.tail if kind == OP_PATH]
+
+
+def commands_of(draw_data):
+    path = draw_data.get('path')
+    return path.get('path') if isinstance(path, dict) else path
+
+
+def max_deviation(original, tolerance):
+    """Максимальное расстояние исходной конечной точки до отрезка упрощенной ломаной (до округления)"""
+    points = [(float(command[-2]), float(command[-1])) for command in original]
+    if tolerance <= 0 or len(points) < 3:
+        return 0.0
+    kept = [i for i, keep in enumerate(stroke_simplify.rdp_mask(points, tolerance)) if keep]
+    worst = 0.0
+    for a, b in zip(kept, kept[1:]):
+        (ax, ay), (bx, by) = points[a], points[b]
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        for px, py in points[a + 1:b]:
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+            worst = max(worst, math.hypot(px - ax - t * dx, py - ay - t * dy))
+    return worst
+
+
+def run(strokes, tolerance, mask_function):
+    stroke_simplify.rdp_mask = mask_function
+    points_in = points_out = bytes_in = bytes_out = 0
+    deviation = 0.0
+    start = time.perf_counter()
+    results = [stroke_simplify.simplify_draw(draw_data, tolerance) for draw_data in strokes]
+    elapsed = time.perf_counter() - start
+    for draw_data, result in zip(strokes, results):
+        original, simplified = commands_of(draw_data), commands_of(result)
+        points_in += len(original)
+        points_out += len(simplified)
+        bytes_in += len(codec.dumps(draw_data))
+        bytes_out += len(codec.dumps(result))
+        deviation = max(deviation, max_deviation(original, tolerance))
+    return points_in, points_out, bytes_in, bytes_out, deviation, elapsed / max(1, len(strokes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whiteboard stroke simplification benchmark")
+    parser.add_argument("--room", help="recorded board from Redis")
+    parser.add_argument("--file", help="JSON dump of whiteboard-draw messages")
+    parser.add_argument("--strokes", type=int, default=2000, help="synthetic strokes")
+    parser.add_argument("--tolerances", default="0,0.25,0.5,1")
+    args = parser.parse_args()
+
+    if args.room:
+        strokes = asyncio.run(load_room(args.room))
+        source = f"room {args.room}"
+    elif args.file:
+        strokes = load_file(args.file)
+        source = args.file
+    else:
+        rng = random.Random(21)
+        strokes = [synthetic_stroke(rng) for _ in range(args.strokes)]
+        source = "synthetic PencilBrush strokes"
+    strokes = [draw_data for draw_data in strokes if isinstance(commands_of(draw_data), list)]
+
+    implementations = [("python", stroke_simplify._rdp_mask_python)]
+    if stroke_simplify.np is not None:
+        implementations.insert(0, ("numpy", stroke_simplify._rdp_mask_numpy))
+
+    print(f"{len(strokes)} strokes from {source}, coordinates rounded to {stroke_simplify.STROKE_COORD_DECIMALS} decimals")
+    print(f"\n{'tol px':>7}{'points':>10}{'kept':>10}{'points %':>10}{'MB in':>8}{'MB out':>8}"
+          f"{'bytes %':>9}{'max dev':>9}" + "".join(f"{name + ' ms':>11}" for name, _ in implementations))
+    print("-" * (71 + 11 * len(implementations)))
+    for tolerance in (float(value) for value in args.tolerances.split(",")):
+        timings = []
+        for _, mask_function in implementations:
+            points_in, points_out, bytes_in, bytes_out, deviation, per_stroke = run(strokes, tolerance, mask_function)
+            timings.append(per_stroke)
+        print(f"{tolerance:>7g}{points_in:>10}{points_out:>10}{100 * (1 - points_out / points_in):>9.1f}%"
+              f"{bytes_in / 1e6:>8.2f}{bytes_out / 1e6:>8.2f}{100 * (1 - bytes_out / bytes_in):>8.1f}%"
+              f"{deviation:>9.2f}" + "".join(f"{value * 1000:>11.3f}" for value in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark восстановления доски для нового участника в зависимости от размера доски.
+Сравнивает:
+- per-item: каждый путь/объект - отдельный кадр, asyncio.sleep(0.01) между кадрами
+  и 0.1s перед whiteboard-state-restored (прежний _send_whiteboard_state);
+- chunked: пакеты whiteboard-state-chunk по WHITEBOARD_STATE_CHUNK_BYTES
+  с flow control по исходящей очереди (OutboundQueue.wait_writable).
+
+Клиент моделируется отправкой кадров через OutboundQueue в "сокет" с заданной
+пропускной способностью. Время восстановления - от начала отправки до передачи
+whiteboard-state-restored в сокет.
+
+Запуск: python benchmark_whiteboard_restore.py [--sizes 100,500,2000,5000] [--mbit 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from base.outbound_queue import OutboundQueue, get_lane
+from base.whiteboard_store import OP_ADD, OP_PATH, iter_state_chunks, state_item_text
+
+ROOM = "BENCH"
+MAX_BUFFERED = 1024 * 1024  # WHITEBOARD_STATE_MAX_BUFFERED по умолчанию
+
+
+def build_board(size):
+    """Элементы доски: 90% штрихов (~60 точек), 10% фигур"""
+    random.seed(size)
+    items = []
+    for i in range(size):
+        if i % 10:
+            path = [["M", 10, 10]] + [["Q", random.randint(0, 1920), random.randint(0, 1080), 1, 1] for _ in range(60)]
+            data = {"id": f"path_{i}", "eventType": "path-created", "path": path, "stroke": "#000", "strokeWidth": 3}
+            items.append((OP_PATH, data["id"], json.dumps(data)))
+        else:
+            data = {"id": f"rect_{i}", "type": "rect", "left": i, "top": i, "width": 100, "height": 50, "fill": "#f00"}
+            items.append((OP_ADD, data["id"], json.dumps(data)))
+    return items
+
+
+class Socket:
+    """WebSocket клиента с ограниченной пропускной способностью"""
+
+    def __init__(self, mbit):
+        self.bytes_per_s = mbit * 1e6 / 8
+        self.frames = 0
+        self.restored_at = None
+
+    async def send(self, text):
+        await asyncio.sleep(len(text) / self.bytes_per_s)
+        self.frames += 1
+        if '"whiteboard-state-restored"' in text:
+            self.restored_at = time.perf_counter()
+
+
+async def restore_per_item(items, socket):
+    queue = OutboundQueue(socket.send, lambda: None)
+    for kind, item_id, data_json in items:
+        text = state_item_text(ROOM, kind, item_id, data_json)
+        queue.put(text, get_lane("whiteboard-object"))
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    queue.put('{"type":"whiteboard-state-restored"}', get_lane("whiteboard-state-restored"))
+
+
+async def restore_chunked(items, socket):
+    queue = OutboundQueue(socket.send, lambda: None)
+    texts = (state_item_text(ROOM, kind, item_id, data_json) for kind, item_id, data_json in items)
+    for chunk_text in iter_state_chunks(ROOM, texts, len(items)):
+        await queue.wait_writable(MAX_BUFFERED)
+        queue.put(chunk_text, get_lane("whiteboard-state-chunk"))
+    queue.put('{"type":"whiteboard-state-restored"}', get_lane("whiteboard-state-restored"))
+
+
+async def measure(restore, items, mbit):
+    socket = Socket(mbit)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await restore(items, socket)
+    while socket.restored_at is None:
+        await asyncio.sleep(0.001)
+    return socket.restored_at - start, time.process_time() - cpu_start, socket.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whiteboard state restore benchmark")
+    parser.add_argument("--sizes", default="100,500,2000,5000")
+    parser.add_argument("--mbit", type=float, default=50, help="client bandwidth, Mbit/s")
+    args = parser.parse_args()
+
+    print(f"client bandwidth: {args.mbit:g} Mbit/s")
+    print(f"\n{'items':>7}{'board MB':>10}{'per-item s':>12}{'frames':>8}{'chunked s':>11}{'frames':>8}{'cpu ms':>9}{'speedup':>9}")
+    print("-" * 74)
+    for size in (int(value) for value in args.sizes.split(",")):
+        items = build_board(size)
+        board_mb = sum(len(data_json) for _, _, data_json in items) / 1e6
+        old_s, _, old_frames = asyncio.run(measure(restore_per_item, items, args.mbit))
+        new_s, new_cpu, new_frames = asyncio.run(measure(restore_chunked, items, args.mbit))
+        print(f"{size:>7}{board_mb:>10.2f}{old_s:>12.2f}{old_frames:>8}{new_s:>11.3f}{new_frames:>8}"
+              f"{new_cpu * 1000:>9.1f}{old_s / new_s:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
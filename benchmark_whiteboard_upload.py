@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Benchmark загрузки изображений доски под конкурентной нагрузкой:
+- multipart: прежний sync view upload_whiteboard_image (POST /upload_whiteboard_image/);
+- stream: потоковая загрузка WhiteboardImageUploadConsumer (POST /upload_whiteboard_image/<КОМНАТА>/).
+
+Запросы подаются прямо в ASGI приложение (mysite.asgi.application), тело - частями
+по --chunk байт, как его передает сервер. Для каждого варианта выводит:
+- загрузок в секунду и задержку загрузки p50/p95;
+- задержку легкого sync view (/get_token/), который опрашивается во время загрузок:
+  sync views используют тот же thread-sensitive поток, что и прежний view загрузки;
+- прирост пикового RSS процесса за прогон.
+
+По умолчанию все загрузки одного изображения (после первой - дубликат в blob_store),
+то есть измеряется прием и запись тела, а не перекодирование. --unique - разные
+изображения (каждое проходит image_pipeline; очередь ограничена
+IMAGE_PIPELINE_MAX_PENDING, лишние загрузки получают 503).
+
+Используется настроенная БД: создается комната BENCHUPLOAD, изображения пишутся во
+временный MEDIA_ROOT; в конце ссылки комнаты освобождаются, комната удаляется.
+
+Запуск: python benchmark_whiteboard_upload.py [--uploads 64] [--concurrency 16]
+        [--megapixels 2] [--chunk 65536] [--unique]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+
+ROOM = 'BENCHUPLOAD'
+BOUNDARY = b'----benchmarkboundary'
+
+
+def make_image(megapixels, seed):
+    """PNG с шумом (плохо сжимается - размер файла близок к реальной фотографии)"""
+    from PIL import Image
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def multipart_request(data):
+    body = b''.join([
+        b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="room_name"\r\n\r\n' + ROOM.encode() + b'\r\n',
+        b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="image"; filename="image.png"\r\n'
+        b'Content-Type: image/png\r\n\r\n' + data + b'\r\n',
+        b'--' + BOUNDARY + b'--\r\n',
+    ])
+    return '/upload_whiteboard_image/', b'multipart/form-data; boundary=' + BOUNDARY, body
+
+
+def stream_request(data):
+    return f'/upload_whiteboard_image/{ROOM}/', b'image/png', data
+
+
+async def call(application, method, path, content_type=None, body=b'', chunk=65536):
+    """Один HTTP запрос к ASGI приложению; возвращает (статус, секунды)"""
+    headers = [(b'host', b'localhost')]
+    if content_type:
+        headers += [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': headers, 'client': ('127.0.0.1', 50000), 'server': ('localhost', 8000),
+    }
+    parts = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b'']
+    messages = [{'type': 'http.request', 'body': part, 'more_body': i < len(parts) - 1}
+                for i, part in enumerate(parts)]
+    done = asyncio.Event()
+    status = None
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif not message.get('more_body'):
+            done.set()
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    return status, time.perf_counter() - start
+
+
+async def run(application, build_request, images, concurrency, chunk):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, probes, statuses = [], [], {}
+    finished = asyncio.Event()
+
+    async def upload(data):
+        async with semaphore:
+            path, content_type, body = build_request(data)
+            status, elapsed = await call(application, 'POST', path, content_type, body, chunk)
+            statuses[status] = statuses.get(status, 0) + 1
+            latencies.append(elapsed)
+
+    async def probe():
+        while not finished.is_set():
+            _, elapsed = await call(application, 'GET', '/get_token/')
+            probes.append(elapsed)
+            await asyncio.sleep(0.005)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    prober = asyncio.ensure_future(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(data) for data in images))
+    elapsed = time.perf_counter() - start
+    finished.set()
+    await prober
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    return elapsed, latencies, probes, statuses, rss_growth
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whiteboard image upload benchmark")
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--megapixels", type=float, default=2.0, help="size of the uploaded image")
+    parser.add_argument("--chunk", type=int, default=65536, help="request body chunk size")
+    parser.add_argument("--unique", action="store_true", help="distinct images (full image pipeline)")
+    args = parser.parse_args()
+
+    from django.conf import settings
+    from mysite.asgi import application
+    from base import blob_store
+    from base.models import Room
+
+    # Оба варианта сообщают о каждой загрузке
+    logging.disable(logging.INFO)
+    media_root = tempfile.mkdtemp(prefix='upload-benchmark-')
+    settings.MEDIA_ROOT = media_root
+    Room.objects.get_or_create(name=ROOM)
+
+    variants = [("multipart", multipart_request), ("stream", stream_request)]
+    print(f"{args.uploads} uploads of {args.megapixels:g} MP PNG, concurrency {args.concurrency}, "
+          f"{args.chunk} byte chunks, {'unique' if args.unique else 'identical'} images")
+    print(f"\n{'endpoint':>10}{'MB':>7}{'uploads/s':>11}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'probe p50':>11}{'probe p95':>11}{'probe max':>11}{'RSS +MB':>9}  statuses")
+    print("-" * 100)
+    try:
+        for index, (name, build_request) in enumerate(variants):
+            if args.unique:
+                images = [make_image(args.megapixels, seed=index * args.uploads + i) for i in range(args.uploads)]
+            else:
+                image = make_image(args.megapixels, seed=index)
+                images = [image] * args.uploads
+                # Первое сохранение (перекодирование) не входит в замер
+                with contextlib.redirect_stdout(io.StringIO()):
+                    asyncio.run(run(application, build_request, images[:1], 1, args.chunk))
+            # Прежний view печатает каждую загрузку
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, latencies, probes, statuses, rss_growth = asyncio.run(
+                    run(application, build_request, images, args.concurrency, args.chunk))
+            megabytes = sum(len(data) for data in images) / 1e6
+            print(f"{name:>10}{megabytes:>7.0f}{len(images) / elapsed:>11.1f}"
+                  f"{percentile(latencies, 0.5) * 1000:>9.0f}{percentile(latencies, 0.95) * 1000:>9.0f}"
+                  f"{statistics.median(probes) * 1000 if probes else 0:>11.1f}"
+                  f"{percentile(probes, 0.95) * 1000:>11.1f}{max(probes, default=0) * 1000:>11.1f}"
+                  f"{rss_growth / 1024:>9.1f}  {dict(sorted(statuses.items()))}")
+    finally:
+        blob_store.release(blob_store.whiteboard_owner(ROOM))
+        Room.objects.filter(name=ROOM).delete()
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
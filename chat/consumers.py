@@ -1,6 +1,6 @@
 # chat/consumers.py
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from base import codec
 
 
 
@@ -25,7 +25,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     # Receive message from WebSocket
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+        text_data_json = codec.loads(text_data)
         username = text_data_json["user_name"]
         message = text_data_json["message"]
 
@@ -40,4 +40,4 @@ class ChatConsumer(AsyncWebsocketConsumer):
         username = event["user_name"]
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({"message": message,"user_name":username}))
\ No newline at end of file
+        await self.send(text_data=codec.dumps({"message": message,"user_name":username}))
\ No newline at end of file
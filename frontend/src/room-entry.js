@@ -2305,11 +2305,22 @@ async function initApp() {
                     state.whiteboard.handleRemoteClear(data);
                 }
                 break;
+            case 'whiteboard-state-chunk':
+                // Пакет восстановления состояния доски: элементы - обычные сообщения
+                // whiteboard-draw / whiteboard-object, применяются по порядку
+                console.log('[WebRTC] Whiteboard state chunk:', {
+                    seq: data.data?.seq,
+                    items: data.data?.items?.length || 0
+                });
+                (data.data?.items || []).forEach(item => handleSignalingMessage(item));
+                break;
             case 'whiteboard-state-restored':
                 // Получено финальное сообщение о завершении восстановления состояния
                 console.log('[WebRTC] ✅ Whiteboard state restoration complete:', {
                     objects_count: data.data?.objects_count || 0,
-                    paths_count: data.data?.paths_count || 0
+                    paths_count: data.data?.paths_count || 0,
+                    chunks: data.data?.chunks || 0,
+                    version: data.data?.version
                 });
                 if (state.whiteboard) {
                     // Принудительно рендерим canvas после восстановления всех путей и объектов
@@ -640,6 +640,9 @@ export class WhiteboardManager {
                     if (obj.type === 'image' || objJSON.type === 'image') {
                         // Принудительно устанавливаем тип на 'image' (не 'Image' или 'Group')
                         objJSON.type = 'image';
+                        if (obj._fullSrc) {
+                            objJSON.fullSrc = obj._fullSrc;
+                        }
                         
                         // КРИТИЧНО: Убеждаемся, что src (URL) сохранен в objJSON
                         // Приоритет: _imageUrl > _src > element.src
@@ -1756,8 +1759,7 @@ export class WhiteboardManager {
                         const updateData = {
                             left: objData.left,
                             top: objData.top,
-                            scaleX: objData.scaleX,
-                            scaleY: objData.scaleY,
+                            ...this._imageScale(objData, obj),
                             angle: objData.angle,
                             opacity: objData.opacity !== undefined ? objData.opacity : 1
                         };
@@ -2270,7 +2272,8 @@ export class WhiteboardManager {
             angle: imageObj.angle,
             opacity: imageObj.opacity !== undefined ? imageObj.opacity : 1,
             width: imageObj.width,
-            height: imageObj.height
+            height: imageObj.height,
+            fullSrc: imageObj._fullSrc
         };
         
         console.log(`[Whiteboard] 📤 Sending image ${eventType}:`, {
@@ -2565,14 +2568,12 @@ export class WhiteboardManager {
             // Сжимаем изображение
             const { blob, url: compressedUrl, width: compressedWidth, height: compressedHeight } = await this.compressImage(file);
             
-            // Загружаем изображение на сервер
-            const formData = new FormData();
-            formData.append('image', blob, file.name || 'image.png');
-            formData.append('room_name', this.roomName);
-            
-            const uploadResponse = await fetch('/upload_whiteboard_image/', {
+            // Загружаем изображение на сервер: тело запроса - сами байты изображения,
+            // сервер пишет их на диск по мере получения (без multipart)
+            const uploadResponse = await fetch(`/upload_whiteboard_image/${encodeURIComponent(this.roomName)}/`, {
                 method: 'POST',
-                body: formData
+                headers: { 'Content-Type': blob.type || file.type },
+                body: blob
             });
             
             if (!uploadResponse.ok) {
@@ -2582,6 +2583,8 @@ export class WhiteboardManager {
             
             const uploadData = await uploadResponse.json();
             let imageUrl = uploadData.url;
+            // Участникам отправляется миниатюра (src) и полный вариант (fullSrc, загружается в фоне)
+            let thumbnailUrl = uploadData.thumbnail_url || uploadData.url;
             
             // КРИТИЧНО: Преобразуем относительный путь в полный URL
             // Сервер возвращает относительный путь типа /media/whiteboard/TEST2/..., 
@@ -2590,6 +2593,9 @@ export class WhiteboardManager {
                 // Используем window.location.origin для получения базового URL
                 imageUrl = window.location.origin + imageUrl;
             }
+            if (thumbnailUrl && thumbnailUrl.startsWith('/')) {
+                thumbnailUrl = window.location.origin + thumbnailUrl;
+            }
             
             // Освобождаем память от compressedUrl
             URL.revokeObjectURL(compressedUrl);
@@ -2618,8 +2624,10 @@ export class WhiteboardManager {
                         const imgId = `${this.userId}-${Date.now()}-${Math.random()}`;
                         
                         // Сохраняем URL сервера в объекте для синхронизации
-                        fabricImg._src = imageUrl; // Сохраняем URL вместо base64
-                        fabricImg._imageUrl = imageUrl; // Дополнительное поле для ясности
+                        fabricImg._src = thumbnailUrl; // Сохраняем URL вместо base64
+                        fabricImg._imageUrl = thumbnailUrl; // Дополнительное поле для ясности
+                        fabricImg._fullSrc = imageUrl; // Полный вариант (у отправителя уже загружен)
+                        fabricImg._fullLoaded = true;
                                 
                                 // Устанавливаем размер изображения (максимум 800x600 для отображения)
                                 const maxDisplayWidth = 800;
@@ -2681,7 +2689,8 @@ export class WhiteboardManager {
                                             angle: fabricImg.angle || 0,
                                             opacity: fabricImg.opacity !== undefined ? fabricImg.opacity : 1,
                                             width: fabricImg.width || htmlImg.width,
-                                            height: fabricImg.height || htmlImg.height
+                                            height: fabricImg.height || htmlImg.height,
+                                            fullSrc: fabricImg._fullSrc
                                         };
                                         
                                         // ===== ЛОГИРОВАНИЕ ДЛЯ ДИАГНОСТИКИ =====
@@ -2922,6 +2931,53 @@ export class WhiteboardManager {
         this.isLoadingImages = false;
     }
     
+    // Масштаб изображения по размерам отправителя: у участников может быть загружен
+    // разный вариант (миниатюра или полный), видимый размер width * scaleX должен совпадать
+    _imageScale(objData, localImage) {
+        const scaleX = objData.scaleX || 1;
+        const scaleY = objData.scaleY || 1;
+        if (!objData.width || !objData.height || !localImage || !localImage.width || !localImage.height) {
+            return { scaleX, scaleY };
+        }
+        return {
+            scaleX: scaleX * objData.width / localImage.width,
+            scaleY: scaleY * objData.height / localImage.height
+        };
+    }
+    
+    // Заменить миниатюру полным вариантом, когда браузер свободен (видимый размер не меняется)
+    _loadFullImageVariant(fabricImg) {
+        if (!fabricImg._fullSrc || fabricImg._fullLoaded) return;
+        let fullUrl = fabricImg._fullSrc;
+        if (fullUrl.startsWith('/') && !fullUrl.startsWith('//')) {
+            fullUrl = window.location.origin + fullUrl;
+        }
+        const load = () => {
+            const fullImg = new Image();
+            fullImg.crossOrigin = 'anonymous';
+            fullImg.onload = () => {
+                if (!this.canvas || !this.canvas.getObjects().includes(fabricImg)) return;
+                const displayWidth = fabricImg.width * fabricImg.scaleX;
+                const displayHeight = fabricImg.height * fabricImg.scaleY;
+                fabricImg.setElement(fullImg);
+                fabricImg.set({
+                    scaleX: displayWidth / fabricImg.width,
+                    scaleY: displayHeight / fabricImg.height
+                });
+                fabricImg._fullLoaded = true;
+                fabricImg.setCoords();
+                this.canvas.requestRenderAll();
+            };
+            fullImg.onerror = () => console.warn('[Whiteboard] ⚠️ Full image variant failed to load:', fullUrl);
+            fullImg.src = fullUrl;
+        };
+        if (window.requestIdleCallback) {
+            window.requestIdleCallback(load, { timeout: 2000 });
+        } else {
+            setTimeout(load, 200);
+        }
+    }
+    
     // Загрузить изображение на canvas
     _loadImageToCanvas(objData, callback) {
         if (!this.canvas) {
@@ -3009,8 +3065,7 @@ export class WhiteboardManager {
                             existingObj.set({
                                 left: objData.left || 0,
                                 top: objData.top || 0,
-                                scaleX: objData.scaleX || 1,
-                                scaleY: objData.scaleY || 1,
+                                ...this._imageScale(objData, existingObj),
                                 angle: objData.angle || 0,
                                 opacity: objData.opacity !== undefined ? objData.opacity : 1
                             });
@@ -3025,8 +3080,8 @@ export class WhiteboardManager {
                     const imageProps = {
                         left: objData.left || 0,
                         top: objData.top || 0,
-                        scaleX: objData.scaleX || 1,
-                        scaleY: objData.scaleY || 1,
+                        // src может быть миниатюрой: видимый размер берется из размеров отправителя
+                        ...this._imageScale(objData, htmlImg),
                         angle: objData.angle || 0,
                         opacity: objData.opacity !== undefined ? objData.opacity : 1,
                         id: imgId,
@@ -3045,6 +3100,9 @@ export class WhiteboardManager {
                         fabricImg._src = objData.src;
                         fabricImg._imageUrl = isUrl ? objData.src : null; // Сохраняем URL отдельно если это URL
                     }
+                    if (objData.fullSrc) {
+                        fabricImg._fullSrc = objData.fullSrc;
+                    }
                     
                     // Добавляем на canvas
                     this.canvas.add(fabricImg);
@@ -3092,6 +3150,7 @@ export class WhiteboardManager {
                     this.isDrawing = wasDrawing;
                     
                     console.log('[Whiteboard] ✅ Image loading COMPLETE');
+                    this._loadFullImageVariant(fabricImg);
                     if (callback) callback(true);
                 } catch (error) {
                     console.error('[Whiteboard] ❌ Error creating fabric image:', error, error.stack);
@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 """
 Load test script for WebSocket connections
+
+Клиенты подключаются с ?trace=1: сервер добавляет в кадры поле _trace с отметками
+recv (кадр получен сервером), pub (отправлен в channel layer) и dlv (передан
+получателю). Вместе с отметкой клиента sent_at это дает одностороннюю задержку
+сигнализации по типам сообщений и ее разбивку по участкам (клиенты и сервер
+на одной машине - часы общие).
 """
 import asyncio
 import websockets
@@ -24,6 +30,7 @@ stats = {
     'messages_received': 0,
     'errors': 0,
     'latency': [],
+    'trace': defaultdict(lambda: defaultdict(list)),  # {type: {участок: [секунды]}}
     'errors_list': [],
     'connection_times': []
 }
@@ -31,10 +38,27 @@ stats = {
 def generate_uid():
     return ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
 
+def record_trace(data, recv_time):
+    """Задержки по участкам из серверных отметок _trace"""
+    trace = data.get('_trace')
+    if not trace:
+        return
+    hops = stats['trace'][data['type']]
+    # Последняя серверная отметка -> клиент
+    hops['deliver_to_client'].append(recv_time - trace['dlv'])
+    hops['server'].append(trace['dlv'] - trace['recv'])
+    if data.get('sent_at'):
+        hops['client_to_server'].append(trace['recv'] - data['sent_at'])
+        hops['one_way'].append(recv_time - data['sent_at'])
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
 async def simulate_client(client_id, room_name):
     """Симуляция одного клиента"""
     uid = generate_uid()
-    ws_url = f"{SERVER_URL}/ws/video/{room_name}/"
+    ws_url = f"{SERVER_URL}/ws/video/{room_name}/?trace=1"
     
     try:
         connect_start = time.time()
@@ -72,7 +96,8 @@ async def simulate_client(client_id, room_name):
                             "candidate": f"candidate:1 1 UDP 2130706431 192.168.1.{random.randint(1,255)} 54321 typ host",
                             "sdpMLineIndex": 0,
                             "sdpMid": "0"
-                        }
+                        },
+                        "sent_at": time.time()
                     }
                     send_start = time.time()
                     try:
@@ -97,6 +122,7 @@ async def simulate_client(client_id, room_name):
                             if data['type'] in ['user-joined', 'offer', 'answer']:
                                 latency = recv_time - send_start
                                 stats['latency'].append(latency)
+                            record_trace(data, recv_time)
                     except json.JSONDecodeError:
                         pass
                 except asyncio.TimeoutError:
@@ -162,6 +188,15 @@ async def run_load_test():
         print(f"Min latency: {min(stats['latency'])*1000:.2f}ms")
         print(f"Max latency: {max(stats['latency'])*1000:.2f}ms")
     
+    if stats['trace']:
+        print("\nOne-way signaling latency by message type (p50 / p95, ms):")
+        for message_type, hops in sorted(stats['trace'].items()):
+            parts = [
+                f"{hop}={percentile(values, 0.5)*1000:.2f}/{percentile(values, 0.95)*1000:.2f}"
+                for hop, values in hops.items()
+            ]
+            print(f"  {message_type} ({len(hops['server'])}): " + ", ".join(parts))
+    
     if stats['errors_list']:
         print(f"\nErrors ({len(stats['errors_list'])}):")
         for error in stats['errors_list'][:10]:  # Первые 10 ошибок
@@ -5,7 +5,7 @@ from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
-from django.urls import path
+from django.urls import path, re_path
 import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
@@ -20,9 +20,12 @@ import base.routing
 # Combine all websocket routes
 websocket_urlpatterns = chat.routing.websocket_urlpatterns + base.routing.websocket_urlpatterns
 
+# Streaming upload endpoints first, everything else goes to Django
+http_urlpatterns = base.routing.http_urlpatterns + [re_path(r"", django_asgi_app)]
+
 application = ProtocolTypeRouter(
     {
-        "http": django_asgi_app,
+        "http": URLRouter(http_urlpatterns),
         "websocket": AllowedHostsOriginValidator(
             AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
         ),
@@ -83,6 +83,16 @@ TEMPLATES = [
     },
 ]
 
+# Redis: channel layer и состояние комнат (общий пул соединений процесса, base/redis_pool.py)
+REDIS_HOST = os.environ.get('REDIS_HOST', '127.0.0.1')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', '6379'))
+REDIS_DB = int(os.environ.get('REDIS_DB', '0'))
+REDIS_POOL_MAX_CONNECTIONS = int(os.environ.get('REDIS_POOL_MAX_CONNECTIONS', '50'))
+# Сколько ждать свободного соединения, когда заняты все REDIS_POOL_MAX_CONNECTIONS
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', '5'))  # секунды
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', '30'))  # секунды
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '5'))  # секунды
+
 # mysite/settings.py
 # Daphne
 ASGI_APPLICATION = "mysite.asgi.application"
@@ -90,7 +100,7 @@ CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
             # КРИТИЧНО: Увеличено для WebRTC (много ICE кандидатов)
             "capacity": 10000,  # Максимум сообщений в канале (было 5000)
             # ⚠️ ВАЖНО: Баланс между очисткой и достаточным временем для обработки
@@ -108,6 +118,32 @@ CHANNEL_LAYERS = {
 }
 ROOT_URLCONF = "mysite.urls"
 
+# Хранилище lease демонстрации экрана: redis (несколько воркеров) или memory (один процесс)
+SCREEN_SHARING_BACKEND = os.environ.get('SCREEN_SHARING_BACKEND', 'redis')
+
+# Логирование: структурированные записи через неблокирующий QueueHandler (base/structured_log.py)
+# Уровень каждой категории настраивается отдельно: LOG_LEVEL_WHITEBOARD=DEBUG и т.д.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_CATEGORIES = ['signaling', 'whiteboard', 'turn', 'cleanup', 'presence', 'screen_sharing', 'trace']
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'structured': {
+            '()': 'base.structured_log.NonBlockingQueueHandler',
+            'json': os.environ.get('LOG_FORMAT', 'text') == 'json',
+        },
+    },
+    'loggers': {
+        'videochat': {'handlers': ['structured'], 'level': LOG_LEVEL, 'propagate': False},
+        'base': {'handlers': ['structured'], 'level': LOG_LEVEL, 'propagate': False},
+        **{
+            f'videochat.{category}': {'level': os.environ.get(f'LOG_LEVEL_{category.upper()}', LOG_LEVEL)}
+            for category in LOG_CATEGORIES
+        },
+    },
+}
+
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
 
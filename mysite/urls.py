@@ -13,7 +13,7 @@ urlpatterns = [
     path("", include("shareapp.urls")),
     # SPA fallback - serve index.html for all non-API routes (must be last)
     # Exclude room, join, and other base.urls patterns
-    re_path(r'^(?!api|admin|chat|static|media|ws|room|join|get_token|create_room|create_member|get_member|delete_member|get_room_members).*$', TemplateView.as_view(template_name='spa.html'), name='spa'),
+    re_path(r'^(?!api|admin|chat|static|media|ws|room|join|get_token|create_room|create_member|get_member|delete_member|get_room_members|metrics).*$', TemplateView.as_view(template_name='spa.html'), name='spa'),
 ]
 # Раздаем статические файлы (в продакшене обычно используется веб-сервер)
 # Но для совместимости добавляем и здесь
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-17 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shareapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='files',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
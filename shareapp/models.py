@@ -1,7 +1,21 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 class Files(models.Model):
     key = models.CharField(max_length=32,unique=True)
+    # Файл в хранилище blob_store (одинаковое содержимое хранится один раз)
     file = models.FileField()
+    original_name = models.CharField(max_length=255, blank=True)
 
 
+@receiver(post_delete, sender=Files)
+def release_shared_file(sender, instance, **kwargs):
+    """
+    Удаление (в том числе по истечении срока) освобождает ссылку: файл удаляется, если он больше никому не нужен.
+    Освобождение - после фиксации транзакции: queryset.delete() не держит ее открытой на время
+    удаления файлов, а откат удаления не теряет файл.
+    """
+    from base import blob_store
+    owner = blob_store.share_owner(instance.key)
+    transaction.on_commit(lambda: blob_store.release(owner))
@@ -1,3 +1,41 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from base import blob_store
+from .models import Files
+
+
+class SharedFileTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def share(self, key, data, name):
+        blob = blob_store.store_file(blob_store.share_owner(key), [data], name)
+        return Files.objects.create(key=key, file=blob.name, original_name=name)
+
+    def test_download_returns_blob_under_original_name(self):
+        self.share('k' * 32, b'%PDF-1.4', 'report.pdf')
+
+        response = self.client.get(reverse('download', args=['k' * 32]))
+        self.addCleanup(response.close)
+
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="report.pdf"')
+
+    def test_delete_releases_blob_after_commit(self):
+        files = self.share('a' * 32, b'data', 'a.txt')
+        path = blob_store.media_path(files.file.name)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Files.objects.filter(pk=files.pk).delete()
+            self.assertTrue(path.exists())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(path.exists())
@@ -1,9 +1,9 @@
 from django.shortcuts import render,redirect
 from shareapp.forms import UploadFileForm
 from .models import Files
+from base import blob_store
 from django.utils.crypto import get_random_string
-import mimetypes
-from django.http import HttpResponse
+from django.http import FileResponse
 import os
 import pyqrcode
 from PIL import Image
@@ -16,7 +16,10 @@ def home(request):
         form = UploadFileForm(request.POST,request.FILES)
         if form.is_valid():
             key = get_random_string(length=32)
-            files = Files(key = key ,file = request.FILES['file'])
+            uploaded = request.FILES['file']
+            # Хэш считается при записи; повторно загруженный файл не сохраняется второй раз
+            blob = blob_store.store_file(blob_store.share_owner(key), uploaded.chunks(), uploaded.name)
+            files = Files(key = key ,file = blob.name, original_name = uploaded.name)
             files.save()
             url = request.build_absolute_uri()
             s = f"{url}{key}"
@@ -35,13 +38,7 @@ def sucess(request):
     return render(request,'sucess.html')
 
 def download_file(request,key):
-    # fill these variables with real values
     files = Files.objects.get(key = key)
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    filename = str(files.file)
-    fl_path = BASE_DIR+'/media/'+filename
-    fl = open(fl_path, 'rb')
-    mime_type, _ = mimetypes.guess_type(filename)
-    response = HttpResponse(fl, content_type=mime_type)
-    response['Content-Disposition'] = "attachment; filename=%s" % filename
-    return response
+    filename = files.original_name or os.path.basename(files.file.name)
+    # FileResponse закрывает файл после отправки; тип определяется по исходному имени
+    return FileResponse(open(blob_store.media_path(files.file.name), 'rb'), as_attachment=True, filename=filename)